@@ -18,11 +18,28 @@ show_default_options() {
     echo "* swingdiff: A swing diff client"
     echo "* textdiff: Dump actions in a textual format."
     echo "* axmldiff: Dump annotated xml tree"
+    echo "* batch: Diff the pairs of a manifest (or stdin with -) in one process, one JSON result per line (batch --help)"
+    echo "* serve: HTTP/JSON diff service with a pool of warm workers (serve --help)"
+    echo "* history: Diff the Solidity files changed by each commit of a git repository, one JSON result per line (history --help)"
 }
 
+SCRIPTS_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/scripts"
+
 # Check if any parameters are provided
 if [ $# -eq 0 ]; then
     show_default_options
+elif [ "$1" = "batch" ]; then
+    # Diff many pairs with one warm pool of Gumtree workers instead of one gumtree run per pair
+    shift
+    exec python3 "$SCRIPTS_DIR/batch_diff.py" "$@"
+elif [ "$1" = "serve" ]; then
+    # Keep the Gumtree workers warm across requests, e.g. docker run -p 8080:8080 ... serve --host 0.0.0.0
+    shift
+    exec python3 "$SCRIPTS_DIR/diff_service.py" "$@"
+elif [ "$1" = "history" ]; then
+    # Diff the blobs of consecutive commits from the object store, without checking out each commit
+    shift
+    exec python3 "$SCRIPTS_DIR/history_diffs.py" "$@"
 else
     # Pass the parameters to the gumtree command
     gumtree "$@"
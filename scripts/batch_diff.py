@@ -0,0 +1,139 @@
+# Diffs many pairs of files in one warm process, for CI and the `batch` command of SoliDiffy.sh.
+# Running `SoliDiffy.sh textdiff` once per pair starts a container, a JVM and the parser for every
+# pair; here all pairs share one pool of warm Gumtree workers (or difftastic processes run side by
+# side) with the scheduler, caches and diff functions of the drivers (see diff_driver.py).
+#
+# Pairs are read from a manifest file, or from stdin with "-", one pair per line:
+#
+#   contracts/Token.sol<TAB>pr/contracts/Token.sol
+#
+# The paths are separated by a tab, or by spaces when neither path has a tab. Blank lines and lines
+# starting with # are skipped. Relative paths are relative to the directory of the manifest, or to
+# the working directory for stdin.
+#
+# One JSON object per pair is written to stdout (or --output), in the order of the manifest:
+#
+#   {"line": 1, "original": "contracts/Token.sol", "modified": "pr/contracts/Token.sol", "tool": "GT",
+#    "edits": 4, "time": 0.012, "edit_script": "<actions>...</actions>", "metrics": {...}}
+#
+# With --output-level full or summary, "edit_script" is the compressed script or the number of edits
+# of each type (see output_level.py). A pair that could not be diffed has "edits": -1 and the error
+# record of process_runner.py under "error" instead. Progress goes to stderr. The exit status is 1 if
+# any pair failed.
+#
+# Usage:
+#   python3 batch_diff.py pairs.txt > results.ndjson
+#   printf 'a.sol\tb.sol\n' | python3 batch_diff.py - --tool difft
+#   docker run --rm -v "$PWD":/work solidiffy-replication batch /work/pairs.txt > results.ndjson
+
+import os
+import sys
+import json
+import argparse
+import contextlib
+
+import diff_driver
+from scheduler import DiffPair, run_pairs
+from process_runner import is_error
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Diff the pairs of files of a manifest in one process and write one JSON result per line.",
+                                     epilog="Example: python3 %s pairs.txt > results.ndjson" % os.path.basename(__file__),
+                                     parents=[diff_driver.diff_parser(), diff_driver.cache_parser(tree_cache="", result_cache="")])
+    parser.add_argument("manifest", help="file with one tab-separated original/modified pair per line, - for stdin")
+    parser.add_argument("--tool", choices=["GT", "difft"], default="GT", help="diffing tool (default: GT)")
+    parser.add_argument("--output", default="-", help="file the results are written to (default: stdout)")
+    return diff_driver.parse_args(parser)
+
+
+#Reads the manifest into (line, original, modified, error) entries, where error is the error record of a
+#line that cannot be diffed (and the paths are then as given)
+def read_manifest(f, base):
+    entries = []
+    for line_no, line in enumerate(f, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        paths = line.split("\t") if "\t" in line else line.split()
+        if len(paths) != 2:
+            entries.append((line_no, line, "", {"error": "bad-pair", "message": "expected an original and a modified path"}))
+            continue
+        original, modified = paths
+        missing = [path for path in paths if not os.path.isfile(os.path.join(base, path))]
+        error = {"error": "not-found", "message": "no such file: " + ", ".join(missing)} if missing else None
+        entries.append((line_no, original, modified, error))
+    return entries
+
+
+#Writes the records in manifest order: a record waits until the records of all lines before it are written
+class OrderedWriter:
+    def __init__(self, out, lines):
+        self.out = out
+        self.lines = lines
+        self.next = 0
+        self.pending = {}
+
+    def write(self, line, record):
+        self.pending[line] = record
+        while self.next < len(self.lines) and self.lines[self.next] in self.pending:
+            self.out.write(json.dumps(self.pending.pop(self.lines[self.next])) + "\n")
+            self.next += 1
+        self.out.flush()
+
+
+#The output record of a pair from its diff result in the format of perform_diffs_jsonl.py
+def pair_record(line, original, modified, diff_tool, diff):
+    return diff_driver.result_record({"line": line, "original": original, "modified": modified}, diff_tool, diff)
+
+
+#Diffs the pairs of the manifest entries and writes their records. Returns the number of failed pairs.
+def batch_diff(entries, base, diff_tool, out, tool_workers, parse_workers, cache=None, output_level="raw"):
+    writer = OrderedWriter(out, [line for line, _, _, _ in entries])
+    failed = 0
+    pairs = []
+    for line, original, modified, error in entries:
+        if error is not None:
+            writer.write(line, pair_record(line, original, modified, diff_tool, error))
+            failed += 1
+        else:
+            pairs.append(DiffPair(line, 0, "", os.path.join(base, original), os.path.join(base, modified)))
+    names = {line: (original, modified) for line, original, modified, _ in entries}
+
+    def on_result(pair, diff):
+        nonlocal failed
+        failed += is_error(diff)
+        writer.write(pair.contract, pair_record(pair.contract, *names[pair.contract], diff_tool, diff))
+
+    run_fn, parse_fn = diff_driver.diff_tools(output_level)[diff_tool]
+    run_pairs(pairs, run_fn, parse_fn, on_result, tool_workers, parse_workers, cache)
+    return failed
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    if args.manifest == "-":
+        base = ""
+        entries = read_manifest(sys.stdin, base)
+    else:
+        base = os.path.dirname(args.manifest)
+        with open(args.manifest) as f:
+            entries = read_manifest(f, base)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    # The diff functions (see diff_driver.py) keep the edit script of both tools, as for perform_diffs_jsonl.py;
+    # they are used with their limits, pool and tree cache set up here
+    diff_driver.setup(args, args.tool, args.tree_cache, file=sys.stderr)
+    result_cache = diff_driver.open_result_cache(args, args.tool, "perform_diffs_jsonl.py")
+
+    try:
+        # Only the results go to stdout, the progress messages of the drivers and the scheduler go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            failed = batch_diff(entries, base, args.tool, out, args.jobs, args.parse_workers, result_cache, args.output_level)
+    finally:
+        diff_driver.close(result_cache)
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"Diffed {len(entries)} pairs, {failed} failed", file=sys.stderr)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,330 @@
+# Benchmark of the diff tools (SoliDiffy/Gumtree and difftastic) by contract size and number of
+# mutations, with a regression check against a stored baseline.
+#
+# The workload is the example/ pair plus mutants of the baseline contracts in
+# sumo/baseline/contracts. Contracts are put into size buckets by their length (--buckets gives
+# the upper bounds in bytes) and up to --contracts-per-bucket of each bucket are mutated with 1, 2,
+# ... --levels mutations per operator, composed like gen_diff_pairs.py does. The mutations are
+# the seeded ones of gen_synthetic.py, so the workload is the same on every machine and needs no
+# SuMo run; with --sumo the mutations in sumo/results/mutations.json are used instead. Larger
+# inputs can be benchmarked with --contracts pointing at the output of gen_synthetic.py.
+#
+# For each tool, the example pair is first diffed --warmup times without being measured, by every
+# warm Gumtree worker of the pool at once for GT, so no worker starts during the measurement. Then
+# every (tool, bucket) group is diffed --repeats times through the same scheduler and diff
+# functions as perform_diffs.py, with --jobs diffs at once and without the result cache. The
+# tree cache starts empty in the scratch directory, so every benchmark run starts from the same state.
+# Reported per tool and bucket, and per mutation level:
+#
+#   throughput    pairs/s over the wall time of the group (median of the repeats)
+#   latency       percentiles of the wall time of the diffs (see process_runner.METRICS), all repeats
+#   cpu           mean user + system CPU time per diff
+#   peak RSS      largest peak resident set size of a diff tool process
+#
+# The report is written as JSON to --output. If the --baseline file exists, the report is compared
+# to it and the script exits with status 1 when a group's throughput dropped, or its p50 or p95
+# latency rose, by more than --tolerance. --save-baseline stores the report as the new baseline.
+# Only compare reports of the same settings on the same machine.
+#
+# Usage: python3 bench_diffs.py --tools GT difft --repeats 3 [--save-baseline]
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:     #not on Windows
+    resource = None
+
+import diff_driver
+from gen_diff_pairs import iter_mutations, contract_mutants
+from gen_synthetic import seeded_mutations
+from gumtree_client import GumtreeError
+from scheduler import DiffPair, run_pairs
+from result_cache import tool_version
+from results_store import unpack_result
+from stats import percentile
+from process_runner import RunError, run
+
+REPORT_VERSION = 1
+PERCENTILES = [50, 90, 95, 99]
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Benchmark the diff tools by contract size and number of mutations.",
+                                     epilog="Example: python3 %s --tools GT difft --repeats 3" % os.path.basename(__file__),
+                                     parents=[diff_driver.diff_parser()])
+    parser.add_argument("--tools", nargs="+", choices=["GT", "difft"], default=["GT", "difft"], help="diffing tools to benchmark")
+    parser.add_argument("--example", default="../example", help="directory with the original.sol/modified.sol pair (default: ../example)")
+    parser.add_argument("--contracts", default="../sumo/baseline/contracts",
+                        help="contracts the mutants are made from (default: ../sumo/baseline/contracts)")
+    parser.add_argument("--sumo", action="store_true", help="use the mutations in ../sumo/results/mutations.json instead of the built-in ones")
+    parser.add_argument("--buckets", type=int, nargs="+", default=[2048, 8192, 32768],
+                        help="upper bounds in bytes of the contract size buckets, larger contracts go into a last bucket (default: 2048 8192 32768)")
+    parser.add_argument("--contracts-per-bucket", type=int, default=3, help="contracts mutated per size bucket (default: 3)")
+    parser.add_argument("--levels", type=int, default=10, help="highest number of mutations per mutant (default: 10)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the contract selection and the built-in mutations")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured diffs of the example pair per tool (default: 3)")
+    parser.add_argument("--repeats", type=int, default=3, help="measured runs of each group (default: 3)")
+    parser.add_argument("--no-tree-cache", action="store_true", help="diff without the tree cache of parsed originals")
+    parser.add_argument("--scratch", default=None, help="directory the workload is written to (default: system temporary directory)")
+    parser.add_argument("--output", default="../results/bench/report.json", help="report file (default: ../results/bench/report.json)")
+    parser.add_argument("--baseline", default="../results/bench/baseline.json",
+                        help="report to compare against, if it exists (default: ../results/bench/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change of throughput or latency counted as a regression (default: 0.1)")
+    # A retried diff would be measured twice
+    parser.set_defaults(retries=0)
+    args = parser.parse_args()
+    args.buckets = sorted(args.buckets)
+    return args
+
+
+#Labels of the size buckets, smallest first
+def bucket_labels(bounds):
+    lowers = [0] + bounds
+    return ["%s-%s" % (format_size(lower), format_size(bound)) for lower, bound in zip(lowers, bounds)] + [format_size(bounds[-1]) + "+"]
+
+
+#Label of the size bucket of a contract of the given length
+def bucket_of(size, bounds):
+    labels = bucket_labels(bounds)
+    for label, bound in zip(labels, bounds):
+        if size < bound:
+            return label
+    return labels[-1]
+
+
+def format_size(size):
+    return "%dK" % (size // 1024) if size >= 1024 else str(size)
+
+
+#SuMo's mutations of the given contracts, {contract file: {operator: [mutation]}}
+def sumo_mutations(names):
+    found = {}
+    for c, mutations in iter_mutations():
+        if c in names:
+            by_op = {}
+            for mutation in mutations:
+                by_op.setdefault(mutation["operator"], []).append(mutation)
+            found[c] = by_op
+    return found
+
+
+#Writes the workload to scratch in the contracts/mutants layout. Returns {bucket: [DiffPair]}, with the example
+#pair as bucket "example".
+def build_workload(args, scratch):
+    groups = {}
+    example = os.path.join(args.example, "original.sol"), os.path.join(args.example, "modified.sol")
+    if all(os.path.exists(path) for path in example):
+        groups["example"] = [DiffPair("example", 1, "EXAMPLE", example[0], example[1])]
+
+    rng = random.Random(args.seed)
+    by_bucket = {}
+    for c in sorted(os.listdir(args.contracts)):
+        if c.endswith(".sol"):
+            by_bucket.setdefault(bucket_of(os.path.getsize(os.path.join(args.contracts, c)), args.buckets), []).append(c)
+    selected = {bucket: sorted(rng.sample(names, min(args.contracts_per_bucket, len(names)))) for bucket, names in by_bucket.items()}
+    sumo = sumo_mutations({c for names in selected.values() for c in names}) if args.sumo else {}
+
+    for bucket in [label for label in bucket_labels(args.buckets) if label in selected]:
+        pairs = []
+        for c in selected[bucket]:
+            name = c.split('.')[0]
+            with open(os.path.join(args.contracts, c)) as f:
+                contract = f.read()
+            mutations = sumo.get(c, {}) if args.sumo else seeded_mutations(contract, args.levels, random.Random("%d:%s" % (args.seed, c)))
+
+            original = os.path.join(scratch, name, "original", c)
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            with open(original, "w") as f:
+                f.write(contract)
+            for op, level, mutant in contract_mutants(contract, mutations, args.levels):
+                path = os.path.join(scratch, name, str(level), op, c)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(mutant)
+                pairs.append(DiffPair(name, level, op, original, path))
+        if pairs:
+            groups[bucket] = pairs
+    return groups
+
+
+#Latency, CPU and memory statistics of a list of per-pair metrics dicts
+def summarize(samples):
+    wall = sorted(m["wall_ns"] / 1e6 for m in samples if m["wall_ns"] >= 0)
+    cpu = [(m["cpu_user_ns"] + m["cpu_sys_ns"]) / 1e6 for m in samples if m["cpu_user_ns"] >= 0 and m["cpu_sys_ns"] >= 0]
+    rss = [m["max_rss_kb"] for m in samples if m["max_rss_kb"] >= 0]
+    summary = {
+        "samples": len(samples),
+        "latency_ms": {"p%d" % q: percentile(wall, q) for q in PERCENTILES},
+        "latency_mean_ms": sum(wall) / len(wall) if wall else None,
+        "cpu_mean_ms": sum(cpu) / len(cpu) if cpu else None,
+        "peak_rss_kb": max(rss) if rss else None,
+    }
+    for phase in ("parse_ns", "match_ns", "actions_ns"):
+        values = [m[phase] / 1e6 for m in samples if m[phase] >= 0]
+        if values:
+            summary[phase[:-3] + "_mean_ms"] = sum(values) / len(values)
+    return summary
+
+
+#Diffs the pairs of a group repeats times. Returns the group's entry of the report.
+def bench_group(pairs, diff_tool, args):
+    run_fn, parse_fn = diff_driver.diff_tools(args.output_level, raw_chunks=False)[diff_tool]
+    samples, by_level, walls = [], {}, []
+    errors = 0
+
+    def on_result(pair, diff):
+        nonlocal errors
+        edits, _, _, metrics = unpack_result(diff)
+        if edits == -1:
+            errors += 1
+        elif metrics is not None:
+            samples.append(metrics)
+            by_level.setdefault(pair.level, []).append(metrics)
+
+    for _ in range(args.repeats):
+        start = time.perf_counter_ns()
+        run_pairs(pairs, run_fn, parse_fn, on_result, args.jobs, args.parse_workers)
+        walls.append((time.perf_counter_ns() - start) / 1e9)
+
+    entry = {"pairs": len(pairs), "errors": errors, "wall_s": walls,
+             "throughput": len(pairs) / sorted(walls)[len(walls) // 2]}
+    entry.update(summarize(samples))
+    entry["levels"] = {str(level): summarize(by_level[level]) for level in sorted(by_level)}
+    return entry
+
+
+#Sets up the warm Gumtree workers and tree cache of the diff functions (see diff_driver.py) for a tool. Returns
+#whether the tool can run.
+def setup_tool(diff_tool, args, scratch):
+    try:
+        diff_driver.setup(args, diff_tool, "" if args.no_tree_cache else os.path.join(scratch, ".trees"))
+    except GumtreeError as e:
+        print("Skipping GT: " + str(e))
+        return False
+    return True
+
+
+def teardown_tool():
+    diff_driver.close()
+
+
+#Diffs the example pair n times, unmeasured. With a Gumtree pool, each round runs as many diffs at once as the pool
+#has workers, so every worker is started and warmed up.
+def warm_up(diff_tool, example, n, output_level):
+    run_fn, parse_fn = diff_driver.diff_tools(output_level, raw_chunks=False)[diff_tool]
+    workers = diff_driver.gumtree_pool.size if diff_driver.gumtree_pool is not None else 1
+
+    def diff_example(_):
+        try:
+            raw = run_fn(example.original, example.mutant)
+            if parse_fn is not None:
+                parse_fn(*raw)
+        except (RunError, GumtreeError) as e:
+            print("Warm-up diff failed: " + str(e))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(n):
+            list(executor.map(diff_example, range(workers)))
+
+
+def environment():
+    try:
+        commit = run(["git", "rev-parse", "--short", "HEAD"]).stdout.decode().strip()
+    except (OSError, RunError):
+        commit = "unknown"
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+#Compares a report to the baseline. Returns the list of regressions, as text.
+def compare(report, baseline, tolerance):
+    regressions = []
+    print(f"\nComparison with baseline of {baseline['environment']['time']} ({baseline['environment']['commit']}):")
+    for tool, groups in report["results"].items():
+        for bucket, entry in groups.items():
+            base = baseline["results"].get(tool, {}).get(bucket)
+            if base is None:
+                continue
+            checks = [("throughput", entry["throughput"], base["throughput"], -1)]
+            checks += [("p%d" % q, entry["latency_ms"]["p%d" % q], base["latency_ms"]["p%d" % q], 1) for q in (50, 95)]
+            line = []
+            for name, value, base_value, worse in checks:
+                if value is None or not base_value:
+                    continue
+                change = value / base_value - 1
+                line.append(f"{name} {change:+.1%}")
+                if change * worse > tolerance:
+                    regressions.append(f"{tool} {bucket}: {name} {base_value:.3f} -> {value:.3f} ({change:+.1%})")
+            print(f"  {tool:6} {bucket:10} " + ", ".join(line))
+    return regressions
+
+
+def print_report(report):
+    for tool, groups in report["results"].items():
+        print(f"\n{tool}")
+        print(f"  {'bucket':10} {'pairs':>6} {'err':>4} {'pairs/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'cpu ms':>9} {'rss MiB':>8}")
+        for bucket, entry in groups.items():
+            lat = entry["latency_ms"]
+            cells = [entry["throughput"], lat["p50"], lat["p90"], lat["p99"], entry["cpu_mean_ms"]]
+            cells = " ".join(f"{'-' if v is None else format(v, '.2f'):>9}" for v in cells)
+            rss = "-" if entry["peak_rss_kb"] is None else f"{entry['peak_rss_kb'] / 1024:.1f}"
+            print(f"  {bucket:10} {entry['pairs']:>6} {entry['errors']:>4} {cells} {rss:>8}")
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    scratch = tempfile.mkdtemp(prefix="solidiffy-bench-", dir=args.scratch)
+    try:
+        groups = build_workload(args, scratch)
+        print("Workload: " + ", ".join(f"{bucket} {len(pairs)} pairs" for bucket, pairs in groups.items()))
+
+        report = {"version": REPORT_VERSION, "environment": environment(), "settings": {
+            name: getattr(args, name) for name in ("sumo", "buckets", "contracts_per_bucket", "levels", "seed", "warmup",
+                                                   "repeats", "jobs", "gt_workers", "no_tree_cache", "output_level")}, "tools": {}, "results": {}}
+        for diff_tool in args.tools:
+            if not setup_tool(diff_tool, args, scratch):
+                continue
+            try:
+                report["tools"][diff_tool] = tool_version(diff_tool)
+                if "example" in groups:
+                    warm_up(diff_tool, groups["example"][0], args.warmup, args.output_level)
+                report["results"][diff_tool] = {bucket: bench_group(pairs, diff_tool, args) for bucket, pairs in groups.items()}
+            finally:
+                teardown_tool()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if resource is not None:
+        report["environment"]["harness_peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print_report(report)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != report["settings"]:
+            print("Baseline was measured with different settings, the comparison may not be meaningful.")
+        regressions = compare(report, baseline, args.tolerance)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
@@ -0,0 +1,97 @@
+# Micro-benchmark and regression check for difft_count.count_changes against the original
+# per-character implementation (count_changes_legacy).
+#
+# The workload mirrors results/results-difft.pickle: one synthetic difftastic output per
+# (contract, level, operator) entry, with as many changes as difftastic reported for it. Lines
+# are long (as in minified or flattened contracts) and the rhs changes partially overlap the lhs
+# ones, so the de-duplication is exercised. Real `difft --display json` outputs can be added
+# with --json. Both implementations must give identical counts on every input, otherwise the
+# script exits with an error.
+#
+# Usage: python3 bench_difft_count.py [--pickle results/results-difft.pickle] [--line-width 4000] [--json out1.json ...]
+
+import sys
+import json
+import time
+import pickle
+import random
+import argparse
+
+from difft_count import count_changes, count_changes_legacy
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Benchmark difftastic change counting.")
+    parser.add_argument("--pickle", default="results/results-difft.pickle",
+                        help="difftastic results whose change counts size the workload")
+    parser.add_argument("--line-width", type=int, default=4000, help="characters per synthetic line")
+    parser.add_argument("--max-pairs", type=int, default=None, help="only use the first N pairs of the pickle")
+    parser.add_argument("--json", nargs="*", default=[], help="difftastic JSON outputs to include")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+#Builds difftastic-like chunks holding n_changes changes spread over a few long lines
+def synthetic_chunks(rng, n_changes, line_width):
+    chunk = []
+    while n_changes > 0:
+        n = min(n_changes, rng.randint(1, 8))
+        n_changes -= n
+        line = {}
+        for side in ("lhs", "rhs"):
+            changes = []
+            for _ in range(n):
+                start = rng.randrange(line_width)
+                end = min(line_width, start + rng.choice([0, 1, 5, 40, 300, line_width // 4]))
+                changes.append({"start": start, "end": end, "content": ""})
+            changes.sort(key=lambda ch: ch["start"])
+            line[side] = {"line_number": 0, "changes": changes}
+        chunk.append(line)
+    return [chunk]
+
+
+def load_workload(args):
+    rng = random.Random(args.seed)
+    workload = []
+
+    with open(args.pickle, "rb") as f:
+        results = pickle.load(f)
+    for contract in results:
+        for level in results[contract]:
+            for op in level:
+                count = level[op]
+                if isinstance(count, list):
+                    count = count[0]
+                if isinstance(count, int) and count > 0:
+                    workload.append(synthetic_chunks(rng, count, args.line_width))
+                if args.max_pairs is not None and len(workload) >= args.max_pairs:
+                    return workload
+
+    for path in args.json:
+        with open(path) as f:
+            workload.append(json.load(f).get("chunks", []))
+    return workload
+
+
+def bench(count_fn, workload):
+    start = time.perf_counter()
+    counts = [count_fn(chunks) for chunks in workload]
+    return counts, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    workload = load_workload(args)
+    n_changes = sum(len(line[side]["changes"]) for chunks in workload for li in chunks for line in li for side in line)
+    print(f"Workload: {len(workload)} diffs, {n_changes} changes, line width {args.line_width}")
+
+    new_counts, new_time = bench(count_changes, workload)
+    legacy_counts, legacy_time = bench(count_changes_legacy, workload)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(new_counts, legacy_counts)) if a != b]
+    print(f"legacy:   {legacy_time:.3f} s")
+    print(f"interval: {new_time:.3f} s  ({legacy_time / max(new_time, 1e-9):.1f}x faster)")
+    if mismatches:
+        print(f"ERROR: counts differ on {len(mismatches)} diffs, first at workload index {mismatches[0]}")
+        sys.exit(1)
+    print("Counts identical on all diffs.")
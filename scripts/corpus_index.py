@@ -0,0 +1,112 @@
+# Index of the (original, mutant) pairs in a mutants directory laid out as
+#
+#   <contract>/original/<file>
+#   <contract>/<level>/<operator>/<file>
+#
+# The tree is walked once with os.scandir. Levels are the directories with a numeric name, stray
+# files and other directories are ignored. The pairs, with the size of both files, are cached in
+# <cache_dir>/<hash of the path>.json together with the modification times of the root, contract,
+# original and level directories, and reused as long as none of those changed: adding, removing or
+# renaming a contract, level or operator changes the mtime of its parent directory. Mutant files
+# are not checked, so a mutant rewritten in place keeps its pair (the result cache keys pairs by
+# content anyway).
+#
+# Usage:
+#   pairs = index_pairs("../contracts/mutants/", "../cache/corpus")
+
+import os
+import json
+import hashlib
+
+from scheduler import DiffPair
+
+INDEX_VERSION = 1
+
+
+def _subdirs(path):
+    with os.scandir(path) as it:
+        return sorted((entry for entry in it if entry.is_dir()), key=lambda entry: entry.name)
+
+
+def _files(path):
+    with os.scandir(path) as it:
+        return sorted((entry for entry in it if entry.is_file()), key=lambda entry: entry.name)
+
+
+#Walks the mutants directory. Returns the pairs, sorted by (contract, level, operator), and the modification
+#times of the directories the cached index depends on, relative to contracts_path
+def scan_pairs(contracts_path):
+    pairs = []
+    dirs = {".": os.stat(contracts_path).st_mtime_ns}
+    for contract in _subdirs(contracts_path):
+        originals = os.path.join(contract.path, "original")
+        if not os.path.isdir(originals):
+            continue
+        dirs[contract.name] = contract.stat().st_mtime_ns
+        dirs[os.path.join(contract.name, "original")] = os.stat(originals).st_mtime_ns
+        original_files = _files(originals)
+        if not original_files:
+            continue
+        original = original_files[0]
+        original_size = original.stat().st_size
+
+        levels = sorted((int(entry.name), entry) for entry in _subdirs(contract.path) if entry.name.isdigit() and int(entry.name) > 0)
+        for level, level_dir in levels:
+            dirs[os.path.join(contract.name, level_dir.name)] = level_dir.stat().st_mtime_ns
+            for op in _subdirs(level_dir.path):
+                mutants = {entry.name: entry for entry in _files(op.path)}
+                mutant = mutants.get(original.name) or next(iter(mutants.values()), None)
+                if mutant is None:
+                    continue
+                pairs.append(DiffPair(contract.name, level, op.name,
+                                      os.path.join(contract.name, "original", original.name),
+                                      os.path.join(contract.name, level_dir.name, op.name, mutant.name),
+                                      original_size + mutant.stat().st_size))
+    return pairs, dirs
+
+
+def _cache_path(contracts_path, cache_dir):
+    digest = hashlib.sha256(os.path.abspath(contracts_path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, digest + ".json")
+
+
+def _load_cached(path, contracts_path):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != INDEX_VERSION or cached.get("root") != os.path.abspath(contracts_path):
+        return None
+    for rel, mtime in cached["dirs"].items():
+        try:
+            if os.stat(os.path.join(contracts_path, rel)).st_mtime_ns != mtime:
+                return None
+        except OSError:
+            return None
+    return [DiffPair(*pair) for pair in cached["pairs"]]
+
+
+def _save(path, contracts_path, pairs, dirs):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": INDEX_VERSION, "root": os.path.abspath(contracts_path), "dirs": dirs,
+                   "pairs": [list(pair) for pair in pairs]}, f)
+    os.replace(tmp, path)
+
+
+#All pairs in a mutants directory, sorted by (contract, level, operator), with paths under contracts_path.
+#With a cache_dir, the index of the previous run is used if the tree has not changed since.
+def index_pairs(contracts_path, cache_dir=None):
+    pairs = None
+    if cache_dir:
+        path = _cache_path(contracts_path, cache_dir)
+        pairs = _load_cached(path, contracts_path)
+    if pairs is None:
+        pairs, dirs = scan_pairs(contracts_path)
+        if cache_dir:
+            _save(path, contracts_path, pairs, dirs)
+        print(f'Indexed {len(pairs)} pairs in {contracts_path}')
+    return [pair._replace(original=os.path.join(contracts_path, pair.original), mutant=os.path.join(contracts_path, pair.mutant))
+            for pair in pairs]
@@ -0,0 +1,207 @@
+# Diff functions, command line options and setup shared by the drivers (perform_diffs.py,
+# perform_diffs_jsonl.py and perform_diffs_individual_storage.py) and the scripts that reuse them
+# (pipeline.py, batch_diff.py, history_diffs.py, bench_diffs.py, diff_service.py).
+#
+# A diff result is [edit count, running time, edit script or None, metrics], 0 for a pair difftastic
+# found unchanged; perform_diffs_individual_storage.py turns it into a dict. The run functions run in
+# the scheduler's threads and use the Gumtree pool, tree cache and limits set up here by setup().
+# Everything the parse worker processes need is passed to them as arguments (see scheduler.py),
+# never through these globals.
+
+import os
+import json
+import math
+import argparse
+from functools import partial
+from gumtree_client import GumtreePool, GumtreeError, ActionReader, textdiff
+from process_runner import Limits, RunError, run, is_error
+from tree_cache import TreeCache, TreeCacheError
+from result_cache import ResultCache
+from results_store import ResultsStore, unpack_result
+from script_store import ScriptStore
+from difft_count import count_changes
+from output_level import OUTPUT_LEVELS, script_for_level, cache_options
+from profiling import stage, PROFILERS
+
+#Pool of warm Gumtree workers, set up by setup(). When None, gumtree is started once per pair.
+gumtree_pool = None
+#Cache of parsed originals used by the Gumtree workers, set up by setup(). When None, every pair is parsed from scratch.
+tree_cache = None
+#Timeout, retries and resource limits of every diff tool call, set up by setup()
+limits = Limits()
+
+#Limits (see process_runner.py) of the diff tool calls from the command line options
+def limits_from(args):
+    return Limits(args.timeout or None, args.retries, args.memory_limit, args.cpu_limit)
+
+#Uses gumtree to get the diff between two files. Its XML output is streamed into a reader that
+#counts the edit actions and, unless only a summary is kept, keeps the raw <actions> element; no tree is built.
+def get_GT_diff_data(filepath1, filepath2, output_level="raw"):
+    # At the summary level the workers only send the types of the actions
+    reader = ActionReader(capture=output_level != "summary")
+
+    if gumtree_pool is not None:
+        src_tree = tree_cache.tree_for(filepath1) if tree_cache is not None else None
+        _, granular_running_time, metrics = gumtree_pool.diff(filepath1, filepath2, src_tree, reader)
+    else:
+        result = textdiff(filepath1, filepath2, reader, limits)
+        granular_running_time, metrics = result.elapsed, result.metrics
+    if not reader.close():
+        raise GumtreeError("Gumtree produced no output for " + filepath2, kind="no-output")
+
+    n_edits = reader.n_actions
+    print(f'Number of edits: {n_edits}')
+
+    # The edit script, compressed or only summarized depending on the output level, and the timing and
+    # resource use of the diff (see process_runner.METRICS)
+    return [n_edits, granular_running_time, script_for_level(output_level, reader.actions(), reader.counts), metrics]
+
+#Uses difftastic to get the diff between two files
+def get_diffts_data(filepath1, filepath2, output_level="raw", raw_chunks=True):
+    return parse_diffts_data(*run_diffts(filepath1, filepath2), output_level=output_level, raw_chunks=raw_chunks)
+
+#Runs difftastic on two files, returns its raw JSON output, running time and metrics
+def run_diffts(filepath1, filepath2):
+    argv = ["difft", "--display", "json", filepath1, filepath2]
+    result = run(argv, limits, env=dict(os.environ, DFT_UNSTABLE="yes"))
+    diff = result.stdout.decode()
+    if not diff:
+        raise RunError("no-output", argv)
+    return diff, result.elapsed, filepath2, result.metrics
+
+#Parses difftastic's JSON output into the diff result. Runs in the parse worker processes. Without raw_chunks,
+#the chunks are not kept at the raw level, only their count.
+def parse_diffts_data(diff, granular_running_time, filepath2, metrics=None, output_level="raw", raw_chunks=True):
+    with stage("json-parse"):
+        diff = json.loads(diff)
+    if diff["status"] == "unchanged":
+        return 0
+
+    counts = {}
+    with stage("count-changes"):
+        count = count_changes(diff["chunks"], counts)
+    script = script_for_level(output_level, diff["chunks"], counts) if raw_chunks or output_level != "raw" else None
+    return [count, granular_running_time, script, metrics]
+
+#Run and parse functions of each diff tool (see scheduler.run_pairs), keeping the edit scripts at the given output
+#level. The level is bound to the functions, so the parse worker processes get it with every call.
+def diff_tools(output_level, raw_chunks=True):
+    return {"GT": (partial(get_GT_diff_data, output_level=output_level), None),
+            "difft": (run_diffts, partial(parse_diffts_data, output_level=output_level, raw_chunks=raw_chunks))}
+
+#Options of the diff tool calls: the workers, limits and output level, for the parsers of the drivers and the
+#scripts that reuse their diff functions (argparse.ArgumentParser(parents=[diff_parser()]))
+def diff_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of diff tool processes running at once (default: number of CPUs)")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count(),
+                        help="number of processes parsing the diff tool output (default: number of CPUs)")
+    parser.add_argument("--gt-workers", type=int, default=os.cpu_count(),
+                        help="number of warm Gumtree workers (default: number of CPUs); 0 starts `gumtree textdiff` once per pair")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="seconds a diff (or parse) may take before it is killed and recorded as failed (default: %(default)s); 0 for no limit")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="times a diff that timed out or was killed is retried (default: %(default)s)")
+    parser.add_argument("--memory-limit", type=int, default=None,
+                        help="memory limit per diff tool process in MiB, the maximum heap size for Gumtree (default: none)")
+    parser.add_argument("--cpu-limit", type=int, default=None,
+                        help="CPU seconds per diff tool process, not applied to warm Gumtree workers (default: none)")
+    parser.add_argument("--output-level", choices=OUTPUT_LEVELS, default="raw",
+                        help="keep the edit scripts as printed (raw), compressed (full) or only the number of edits of each type (summary) (default: raw)")
+    return parser
+
+#Options of the tree cache and the result cache, with their default directories ("" for off)
+def cache_parser(tree_cache="../cache/trees", result_cache="../cache/results"):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--tree-cache", default=tree_cache,
+                        help="directory of parsed original trees, reused by every pair with the same original (default: %s); empty to disable" % (tree_cache or "off"))
+    parser.add_argument("--result-cache", default=result_cache,
+                        help="directory of cached diff results, pairs already in it are not diffed again (default: %s); empty to disable" % (result_cache or "off"))
+    return parser
+
+#Options of the results store and the script store
+def store_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--store", default="../results/store",
+                        help="columnar results store every result is also appended to (default: ../results/store); empty to disable")
+    parser.add_argument("--script-store", default="",
+                        help="compressed, deduplicated store the edit scripts are written to, the results then only keep their hash (default: off)")
+    return parser
+
+#Options of the stage profiler (see profiling.py)
+def profile_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--profile", default="",
+                        help="record the time spent in each stage of the run and write a profile report to this directory (default: off)")
+    parser.add_argument("--profiler", choices=PROFILERS, default=None,
+                        help="with --profile, also run cProfile or a sampling profiler in the driver and its parse workers")
+    return parser
+
+#Parses the command line of a parser built from the parsers above, and rejects options that conflict
+def parse_args(parser):
+    args = parser.parse_args()
+    if getattr(args, "script_store", "") and args.output_level == "summary":
+        parser.error("--script-store needs the edit scripts, use --output-level raw or full")
+    return args
+
+#Output record of a diff result, as written by batch_diff.py and history_diffs.py: the fields of what was diffed,
+#the tool, and the edit count, running time, edit script and metrics, or edits = -1 and the error record of a failure
+def result_record(fields, diff_tool, diff):
+    record = dict(fields, tool=diff_tool)
+    if is_error(diff):
+        record["edits"] = -1
+        record["error"] = diff if isinstance(diff, dict) else {"error": "exception", "message": "diff tool failed"}
+        return record
+    edits, elapsed, script, metrics = unpack_result(diff)
+    # An unchanged pair has no time, NaN is not valid JSON
+    record.update(edits=edits, time=None if math.isnan(elapsed) else elapsed, edit_script=script, metrics=metrics)
+    return record
+
+#Command line options of a driver, driver being the file name of its script
+def parse_input(driver):
+    parser = argparse.ArgumentParser(description="Diff all mutants against their original contract.",
+                                     epilog="Example: python3 %s ../mutants/ GT" % driver,
+                                     parents=[diff_parser(), cache_parser(), store_parser(), profile_parser()])
+    parser.add_argument("contracts_path", help="path to the mutants directory")
+    parser.add_argument("diff_tool", choices=["GT", "difft"], help="diffing tool")
+    parser.add_argument("--corpus-index", default="../cache/corpus",
+                        help="directory of cached indexes of the mutants directory, reused while it is unchanged (default: ../cache/corpus); empty to rescan every run")
+    return parse_args(parser)
+
+#Sets up the limits, and for GT the warm Gumtree workers and the tree cache in tree_cache_dir (none if empty),
+#from the options in args. Messages are printed to file (default: stdout).
+def setup(args, diff_tool, tree_cache_dir, file=None):
+    global gumtree_pool, tree_cache, limits
+    limits = limits_from(args)
+    gumtree_pool = None
+    tree_cache = None
+    if diff_tool == "GT" and args.gt_workers > 0:
+        gumtree_pool = GumtreePool(args.gt_workers, limits)
+        if tree_cache_dir:
+            try:
+                tree_cache = TreeCache(tree_cache_dir, limits=limits)
+            except TreeCacheError as e:
+                print("Tree cache disabled: " + str(e), file=file)
+
+#Result cache of the results of a tool in the format of a driver, from the options in args, None if disabled.
+#Results are cached per driver as well, since each driver stores them in its own format.
+def open_result_cache(args, diff_tool, driver):
+    return ResultCache(args.result_cache, diff_tool, cache_options(driver, args.output_level)) if args.result_cache else None
+
+#Result cache, results store and script store of a driver from its options, None where disabled
+def open_stores(args, driver):
+    result_cache = open_result_cache(args, args.diff_tool, driver)
+    store = ResultsStore(args.store) if args.store else None
+    scripts = ScriptStore(args.script_store) if args.script_store else None
+    return result_cache, store, scripts
+
+#Stops the warm Gumtree workers and closes the given caches and stores (None ones are skipped)
+def close(*stores):
+    global gumtree_pool
+    if gumtree_pool is not None:
+        gumtree_pool.close()
+        gumtree_pool = None
+    for store in stores:
+        if store is not None:
+            store.close()
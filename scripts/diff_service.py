@@ -0,0 +1,397 @@
+# Local HTTP/JSON diff service. Keeps a pool of warm Gumtree workers (see gumtree_client.py), so a
+# diff costs the diff itself instead of a container, JVM and parser start. Only the standard library
+# is used, so it runs offline in the Docker image:
+#
+#   docker run --rm -p 8080:8080 solidiffy-replication serve --host 0.0.0.0
+#
+# Endpoints:
+#   POST /sources          body: a Solidity source; stores it and answers 201 {"hash": "<sha256 of the source>"}
+#   GET  /sources/<hash>   a stored source, 404 if it is unknown
+#   POST /diff             {"original": "<source>" or "original_hash": "<hash>", "modified": ... or "modified_hash": ...,
+#                           "format": "json" (default), "summary", "xml" or "html", "tool": "GT" (default) or "difft"}
+#   GET  /metrics          queue depth, workers and latency percentiles as JSON, or with ?format=prometheus
+#                          in the Prometheus text format
+#   GET  /health           {"status": "ok"} once the workers are started
+#
+# Sources sent inline are stored too, and /diff answers with the hashes of both sides, so a client
+# can refer to an original it diffs repeatedly by its hash. The originals are parsed once into the tree
+# cache when tree-sitter-parser.py is available. The formats of /diff:
+#   json   {"original_hash", "modified_hash", "tool", "edits", "time", "metrics", "actions"}, actions as in
+#          edit_script.actions_json (GT) or difftastic's chunks (difft)
+#   summary  the same without "actions", with "counts", the number of edits of each type (see output_level.py);
+#          Gumtree workers then only send the types of the actions
+#   xml    Gumtree's textdiff XML, with the number of edits and the diff time in X-Edits and X-Diff-Time
+#   html   both sources side by side with the edit script highlighted, without external resources
+# A diff that fails answers 502 (504 if it timed out) with the error record of process_runner.py, and
+# 503 when more than --max-queue requests are already waiting for a worker.
+#
+# Usage: python3 diff_service.py [--port 8080] [--gt-workers 4] [--sources ../cache/sources]
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import shutil
+import signal
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import diff_driver
+from gumtree_client import GumtreePool, GumtreeError, ActionReader
+from tree_cache import TreeCache, TreeCacheError
+from process_runner import RunError, error_record
+from results_store import unpack_result
+from edit_script import parse_textdiff, actions_json, render_html
+from difft_count import count_changes
+from stats import percentile
+
+HASH = re.compile(r"^[0-9a-f]{64}$")
+FORMATS = {"json": "application/json", "summary": "application/json", "xml": "application/xml", "html": "text/html; charset=utf-8"}
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example")
+LATENCY_WINDOW = 1024
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Serve diffs of Solidity sources over HTTP with a pool of warm Gumtree workers.",
+                                     epilog="Example: python3 %s --port 8080 --gt-workers 4" % os.path.basename(__file__))
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1; 0.0.0.0 in Docker)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    parser.add_argument("--gt-workers", type=int, default=os.cpu_count(), help="number of warm Gumtree workers (default: number of CPUs)")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="requests that may wait for a worker before new ones are turned away with 503 (default: 64)")
+    parser.add_argument("--sources", default="",
+                        help="directory the uploaded sources and their trees are kept in (default: a temporary directory removed on exit)")
+    parser.add_argument("--max-bytes", type=int, default=16 << 20, help="largest request body accepted in bytes (default: 16 MiB)")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="seconds a diff may take before it is killed and answered with 504 (default: 600); 0 for no limit")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="times a diff whose worker timed out or died is retried (default: 1)")
+    parser.add_argument("--memory-limit", type=int, default=None,
+                        help="maximum heap size of the Gumtree workers in MiB, and memory limit of difftastic (default: none)")
+    parser.add_argument("--cpu-limit", type=int, default=None, help="CPU seconds per difftastic process (default: none)")
+    parser.add_argument("--quiet", action="store_true", help="do not log every request to stderr")
+    return parser.parse_args()
+
+
+#An error answered to the client with the given status and a JSON body {"error": kind, "message": message, ...}
+class RequestError(Exception):
+    def __init__(self, status, kind, message, record=None):
+        super().__init__(message)
+        self.status = status
+        self.record = record or {"error": kind, "message": message}
+
+
+#Content-addressed store of the diffed sources, as <directory>/<sha256>.sol
+class SourceStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + ".sol")
+
+    def get(self, digest):
+        if not HASH.match(digest or "") or not os.path.exists(self.path(digest)):
+            return None
+        return self.path(digest)
+
+
+#Request counts by endpoint and status, and the latencies of the last LATENCY_WINDOW requests per endpoint
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = Counter()                   #(endpoint, status) -> count
+        self.totals = defaultdict(lambda: [0, 0.0]) #endpoint -> [count, seconds]
+        self.latency = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.diff_time = deque(maxlen=LATENCY_WINDOW)
+        self.in_flight = 0
+
+    def observe(self, endpoint, status, seconds):
+        with self.lock:
+            self.requests[(endpoint, status)] += 1
+            self.totals[endpoint][0] += 1
+            self.totals[endpoint][1] += seconds
+            self.latency[endpoint].append(seconds)
+
+    def snapshot(self, pool):
+        with self.lock:
+            latency = {endpoint: sorted(values) for endpoint, values in self.latency.items()}
+            diff_time = sorted(self.diff_time)
+            requests = defaultdict(dict)
+            for (endpoint, status), n in sorted(self.requests.items()):
+                requests[endpoint][str(status)] = n
+            totals = {endpoint: list(total) for endpoint, total in self.totals.items()}
+            in_flight = self.in_flight
+        stats = lambda values: {"count": len(values), "p50": percentile(values, 50), "p90": percentile(values, 90),
+                                "p99": percentile(values, 99), "max": values[-1] if values else None}
+        pool_stats = pool.stats() if pool is not None else None
+        return {
+            "uptime_s": time.time() - self.started,
+            "queue_depth": pool_stats["waiting"] if pool_stats else 0,
+            "in_flight": in_flight,
+            "pool": pool_stats,
+            "requests": dict(requests),
+            "totals": {endpoint: {"count": n, "seconds": s} for endpoint, (n, s) in totals.items()},
+            "latency_s": {endpoint: stats(values) for endpoint, values in latency.items()},
+            "diff_time_s": stats(diff_time),
+        }
+
+
+#The metrics snapshot in the Prometheus text format
+def prometheus(snapshot):
+    lines = ["# TYPE solidiffy_queue_depth gauge", "solidiffy_queue_depth %d" % snapshot["queue_depth"],
+             "# TYPE solidiffy_in_flight gauge", "solidiffy_in_flight %d" % snapshot["in_flight"]]
+    if snapshot["pool"] is not None:
+        lines.append("# TYPE solidiffy_workers gauge")
+        for state in ("busy", "idle"):
+            lines.append('solidiffy_workers{state="%s"} %d' % (state, snapshot["pool"][state]))
+    lines.append("# TYPE solidiffy_requests_total counter")
+    for endpoint, statuses in snapshot["requests"].items():
+        for status, n in statuses.items():
+            lines.append('solidiffy_requests_total{endpoint="%s",status="%s"} %d' % (endpoint, status, n))
+    lines.append("# TYPE solidiffy_request_latency_seconds summary")
+    for endpoint, stats in snapshot["latency_s"].items():
+        for q in ("50", "90", "99"):
+            if stats["p" + q] is not None:
+                lines.append('solidiffy_request_latency_seconds{endpoint="%s",quantile="0.%s"} %f' % (endpoint, q, stats["p" + q]))
+        total = snapshot["totals"][endpoint]
+        lines.append('solidiffy_request_latency_seconds_count{endpoint="%s"} %d' % (endpoint, total["count"]))
+        lines.append('solidiffy_request_latency_seconds_sum{endpoint="%s"} %f' % (endpoint, total["seconds"]))
+    return "\n".join(lines) + "\n"
+
+
+class DiffService:
+    def __init__(self, sources, pool, tree_cache, metrics, max_queue):
+        self.sources = sources
+        self.pool = pool
+        self.tree_cache = tree_cache
+        self.metrics = metrics
+        self.max_queue = max_queue
+
+    #Path of one side of a diff request, from its inline source or its hash
+    def side(self, request, name):
+        if isinstance(request.get(name), str):
+            return self.sources.path(self.sources.put(request[name].encode()))
+        digest = request.get(name + "_hash")
+        if digest is None:
+            raise RequestError(400, "bad-request", "give either %s or %s_hash" % (name, name))
+        path = self.sources.get(digest)
+        if path is None:
+            raise RequestError(404, "unknown-hash", "no source with hash %s, POST it to /sources first" % digest)
+        return path
+
+    #Answers a /diff request with (content type, body, headers)
+    def diff(self, request, fmt=None):
+        fmt = fmt or request.get("format", "json")
+        tool = request.get("tool", "GT")
+        if fmt not in FORMATS:
+            raise RequestError(400, "bad-request", "format must be one of " + ", ".join(FORMATS))
+        if tool not in ("GT", "difft"):
+            raise RequestError(400, "bad-request", "tool must be GT or difft")
+        if tool == "difft" and fmt not in ("json", "summary"):
+            raise RequestError(400, "bad-request", "difft results are only available as json or summary")
+        if tool == "GT" and self.pool is None:
+            raise RequestError(503, "unavailable", "Gumtree is not available in this service")
+
+        original, modified = self.side(request, "original"), self.side(request, "modified")
+        hashes = {"original_hash": os.path.basename(original)[:-4], "modified_hash": os.path.basename(modified)[:-4]}
+        # Checked and counted at once, so a burst of requests cannot all pass the check before any is counted
+        capacity = self.max_queue + (self.pool.size if self.pool is not None else 0)
+        with self.metrics.lock:
+            if self.metrics.in_flight >= capacity:
+                raise RequestError(503, "busy", "%d requests are already waiting for a worker" % self.max_queue)
+            self.metrics.in_flight += 1
+        try:
+            if tool == "GT":
+                src_tree = self.tree_cache.tree_for(original) if self.tree_cache is not None else None
+                if fmt == "summary":
+                    reader = ActionReader(capture=False)
+                    _, elapsed, metrics = self.pool.diff(original, modified, src_tree, reader)
+                    if not reader.close():
+                        raise GumtreeError("Gumtree produced no output", kind="no-output")
+                    edits, counts = reader.n_actions, reader.counts
+                else:
+                    xml, elapsed, metrics = self.pool.diff(original, modified, src_tree)
+                    actions, matches = parse_textdiff(xml)
+                    edits, script = len(actions), actions_json(actions, matches)
+            else:
+                result = diff_driver.get_diffts_data(original, modified)
+                edits, elapsed, script, metrics = unpack_result(result)
+                elapsed = None if math.isnan(elapsed) else elapsed
+                counts = {}
+                if fmt == "summary":
+                    count_changes(script or [], counts)
+        except (GumtreeError, TreeCacheError, RunError) as e:
+            record = error_record(e)
+            raise RequestError(504 if record["error"] == "timeout" else 502, record["error"], str(e), record)
+        finally:
+            with self.metrics.lock:
+                self.metrics.in_flight -= 1
+        if elapsed is not None:
+            with self.metrics.lock:
+                self.metrics.diff_time.append(elapsed)
+
+        headers = {"X-Edits": str(edits), "X-Diff-Time": str(elapsed)}
+        if fmt == "xml":
+            return FORMATS[fmt], xml, headers
+        if fmt == "html":
+            with open(original, "rb") as f1, open(modified, "rb") as f2:
+                page = render_html(f1.read(), f2.read(), actions, matches, request.get("original_name", hashes["original_hash"][:12] + ".sol"),
+                                   request.get("modified_name", hashes["modified_hash"][:12] + ".sol"))
+            return FORMATS[fmt], page.encode(), headers
+        if fmt == "summary":
+            body = dict(hashes, tool=tool, edits=edits, time=elapsed, metrics=metrics, counts=dict(sorted(counts.items())))
+        else:
+            body = dict(hashes, tool=tool, edits=edits, time=elapsed, metrics=metrics, actions=script)
+        return FORMATS[fmt], json.dumps(body).encode(), headers
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   #keep-alive, so a client pays for one connection
+    service = None
+    quiet = False
+    max_bytes = 16 << 20
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def send_json(self, status, obj, headers=None):
+        return self.send(status, FORMATS["json"], json.dumps(obj).encode(), headers)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.max_bytes:
+            self.close_connection = True
+            raise RequestError(413, "too-large", "request body is larger than %d bytes" % self.max_bytes)
+        return self.rfile.read(length)
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        endpoint = parts[0] or "/"
+        start = time.perf_counter()
+        try:
+            status = self.route(method, parts, query)
+        except RequestError as e:
+            status = self.send_json(e.status, e.record, {"Retry-After": "1"} if e.status == 503 else None)
+        except Exception as e:
+            status = self.send_json(500, {"error": "exception", "message": str(e), "type": type(e).__name__})
+        self.service.metrics.observe(endpoint, status, time.perf_counter() - start)
+
+    def route(self, method, parts, query):
+        service = self.service
+        if method == "GET" and parts == ["health"]:
+            return self.send_json(200, {"status": "ok", "pool": service.pool.stats() if service.pool is not None else None})
+        if method == "GET" and parts == ["metrics"]:
+            snapshot = service.metrics.snapshot(service.pool)
+            if query.get("format") == ["prometheus"]:
+                return self.send(200, "text/plain; version=0.0.4", prometheus(snapshot).encode())
+            return self.send_json(200, snapshot)
+        if method == "POST" and parts == ["sources"]:
+            return self.send_json(201, {"hash": service.sources.put(self.read_body())})
+        if method == "GET" and len(parts) == 2 and parts[0] == "sources":
+            path = service.sources.get(parts[1])
+            if path is None:
+                raise RequestError(404, "unknown-hash", "no source with hash " + parts[1])
+            with open(path, "rb") as f:
+                return self.send(200, "text/plain; charset=utf-8", f.read())
+        if method == "POST" and parts == ["diff"]:
+            try:
+                request = json.loads(self.read_body())
+            except ValueError as e:
+                raise RequestError(400, "bad-request", "the body must be a JSON object: " + str(e))
+            if not isinstance(request, dict):
+                raise RequestError(400, "bad-request", "the body must be a JSON object")
+            content_type, body, headers = service.diff(request, query.get("format", [None])[0])
+            return self.send(200, content_type, body, headers)
+        raise RequestError(404, "not-found", "no endpoint %s %s" % (method, self.path))
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+#Starts every worker of the pool and runs the example pair on each, so the first requests find warm JVMs
+def warm_up(pool):
+    original, modified = os.path.join(EXAMPLE, "original.sol"), os.path.join(EXAMPLE, "modified.sol")
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        workers = list(executor.map(lambda _: pool.acquire(), range(pool.size)))
+        if os.path.exists(original) and os.path.exists(modified):
+            def run(worker):
+                try:
+                    worker.diff(original, modified, timeout=pool.limits.timeout)
+                except GumtreeError as e:
+                    print("Warm-up diff failed: " + str(e), file=sys.stderr)
+            list(executor.map(run, workers))
+    for worker in workers:
+        pool.release(worker)
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    limits = diff_driver.limits = diff_driver.limits_from(args)
+
+    sources_dir = args.sources or tempfile.mkdtemp(prefix="solidiffy-sources-")
+    pool = tree_cache = None
+    try:
+        pool = GumtreePool(max(1, args.gt_workers), limits)
+    except GumtreeError as e:
+        print("Gumtree disabled: " + str(e), file=sys.stderr)
+    if pool is not None:
+        try:
+            tree_cache = TreeCache(os.path.join(sources_dir, "trees"), limits=limits)
+        except TreeCacheError as e:
+            print("Tree cache disabled: " + str(e), file=sys.stderr)
+        warm_up(pool)
+
+    Handler.service = DiffService(SourceStore(sources_dir), pool, tree_cache, Metrics(), args.max_queue)
+    Handler.quiet = args.quiet
+    Handler.max_bytes = args.max_bytes
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    # docker stop sends SIGTERM; shut down cleanly so the workers are closed
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print("Serving diffs on http://%s:%d/ with %d Gumtree workers" % (args.host, args.port, pool.size if pool else 0), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if pool is not None:
+            pool.close()
+        if not args.sources:
+            shutil.rmtree(sources_dir, ignore_errors=True)
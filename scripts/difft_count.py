@@ -0,0 +1,86 @@
+# Counts the changes in difftastic's JSON output ("chunks" of lines with "lhs"/"rhs" changes).
+# A change is counted unless its character span overlaps a change already counted on the same
+# line, so the left and right hand side of one edit are not counted twice. Changes with an
+# empty span are always counted.
+#
+# Counted changes can also be tallied by type: "delete" on a line that only has a left hand side,
+# "insert" on one that only has a right hand side, and "update" on a line with both.
+
+from bisect import bisect_left
+
+
+#Whether the span [start, end) overlaps one of the disjoint spans, sorted by start
+def overlaps(starts, ends, start, end):
+    i = bisect_left(starts, end)
+    return i > 0 and ends[i - 1] > start
+
+
+#Counts changes with sorted lists of the disjoint spans counted so far on each line, which costs O(k log k) per line
+#of k changes instead of touching every character position. The spans of the left hand side are kept apart from those
+#of the right hand side: difftastic lists the changes of a side by position, so a counted span is appended at the end
+#of its side's lists. Changes out of order are inserted in the middle, at O(k) each (O(k^2) per line at worst).
+#If a counts dict is given, the counted changes of each type are added to it.
+def count_changes(chunks, counts=None):
+    count = 0
+    for li in chunks:
+        for line in li:
+            counted = None      #starts and ends of the spans counted on the left hand side
+            before = count
+            for side in ("lhs", "rhs"):
+                if side not in line:
+                    continue
+                starts = []     #counted spans never overlap, so sorting them by start also sorts them by end
+                ends = []
+                for ch in line[side]["changes"]:
+                    start, end = ch["start"], ch["end"]
+                    if start >= end:
+                        count += 1
+                        continue
+
+                    # The last span starting before this one ends is the only candidate for an overlap
+                    if counted is not None and overlaps(*counted, start, end):
+                        continue
+                    i = bisect_left(starts, end)
+                    if i > 0 and ends[i - 1] > start:
+                        continue
+                    starts.insert(i, start)
+                    ends.insert(i, end)
+                    count += 1
+                counted = (starts, ends)
+            if counts is not None and count > before:
+                kind = "update" if "lhs" in line and "rhs" in line else "delete" if "lhs" in line else "insert"
+                counts[kind] = counts.get(kind, 0) + count - before
+    return count
+
+
+#The original per-character implementation, kept as the reference for bench_difft_count.py
+def count_changes_legacy(chunks):
+    count = 0
+    for li in chunks:
+        for line in li:
+            used_changes = {}
+
+            if "lhs" in line.keys():
+                for ch in line["lhs"]["changes"]:
+                    counted = False
+                    for i in range(ch["start"], ch["end"]):
+                        if str(i) in used_changes.keys():
+                            counted = True
+
+                    if not counted:
+                        for i in range(ch["start"], ch["end"]):
+                            used_changes[str(i)] = 1
+                        count += 1
+
+            if "rhs" in line.keys():
+                for ch in line["rhs"]["changes"]:
+                    counted = False
+                    for i in range(ch["start"], ch["end"]):
+                        if str(i) in used_changes.keys():
+                            counted = True
+
+                    if not counted:
+                        for i in range(ch["start"], ch["end"]):
+                            used_changes[str(i)] = 1
+                        count += 1
+    return count
@@ -0,0 +1,122 @@
+# Reads and renders the textdiff XML of Gumtree (what `gumtree textdiff -f XML` and
+# gumtree_server/GumtreeServer.java print): a <matches> element mapping the nodes of the original
+# to those of the modified file, followed by the <actions> element with the edit script.
+#
+# Nodes are written as "<type>: <label> [<start>,<end>]" (or without the label), with the byte
+# range of the node in its file: actions on the original (update, move, delete) name nodes of the
+# original, insertions name nodes of the modified file. The matches give the other side of updates
+# and moves.
+#
+# Usage:
+#   actions, matches = parse_textdiff(xml)
+#   actions_json(actions, matches)    -> [{"type": "update-node", "tree": ..., "src": [41, 44], "dst": [41, 47], ...}]
+#   render_html(original, modified, actions, matches, "a.sol", "b.sol")    -> page in the style of `gumtree htmldiff`
+
+import re
+import html
+import xml.etree.ElementTree as ET
+
+POSITION = re.compile(r"\[(\d+),(\d+)\]$")
+
+# Class of the highlighted nodes on each side, as in `gumtree htmldiff`
+ACTION_CLASSES = {"update": "upd", "move": "mv", "delete": "del", "insert": "add"}
+
+HTML_STYLE = """
+body { font-family: sans-serif; margin: 1em; }
+.files { display: flex; gap: 1em; }
+.file { flex: 1; min-width: 0; }
+pre { border: 1px solid #ccc; padding: .5em; overflow: auto; }
+.add { border: 1px solid black; background-color: MediumSeaGreen; }
+.del { border: 1px solid black; background-color: IndianRed; }
+.mv { border: 1px solid black; background-color: Plum; }
+.upd { border: 1px solid black; background-color: DarkOrange; font-weight: bold; }
+"""
+
+
+#Byte range [start, end] of a node written by Gumtree, or None
+def node_range(node):
+    m = POSITION.search(node or "")
+    return [int(m.group(1)), int(m.group(2))] if m else None
+
+
+def node_type(node):
+    return re.split(r":? \[|: ", node, 1)[0]
+
+
+#Attributes of the actions, in order, and {original node: modified node} of the matches
+def parse_textdiff(xml):
+    if isinstance(xml, bytes):
+        xml = xml.decode()
+    # An XML declaration followed by two root elements, parsed inside a wrapper
+    if xml.startswith("<?xml"):
+        xml = xml.split("\n", 1)[1] if "\n" in xml else ""
+    root = ET.fromstring("<X>" + xml + "</X>")
+    matches = {m.get("src"): m.get("dest") for m in root.iter("match")}
+    actions = [dict(a.attrib) for a in root.iter("action")]
+    return actions, matches
+
+
+#The edit script as a list of dicts: the attributes Gumtree writes, with "at" as int, plus the byte
+#ranges of the action in the original ("src") and the modified file ("dst"), None where it has none
+def actions_json(actions, matches):
+    out = []
+    for action in actions:
+        item = dict(action)
+        if "at" in item:
+            item["at"] = int(item["at"])
+        tree = action.get("tree")
+        if action.get("type", "").startswith("insert"):
+            item["src"], item["dst"] = None, node_range(tree)
+        else:
+            item["src"] = node_range(tree)
+            item["dst"] = node_range(matches.get(tree)) if not action.get("type", "").startswith("delete") else None
+        out.append(item)
+    return out
+
+
+#Source with the given (start, end, class, title) byte ranges wrapped in spans. The ranges are AST
+#nodes, so they nest; one that would cross an enclosing range is cut at its end.
+def highlight(source, spans):
+    data = source.encode() if isinstance(source, str) else source
+    text = lambda start, end: html.escape(data[start:end].decode(errors="replace"))
+    out = []
+    pos = 0
+    ends = []
+    for start, end, cls, title in sorted(spans, key=lambda s: (s[0], -s[1])):
+        while ends and ends[-1] <= start:
+            out.append(text(pos, ends[-1]) + "</span>")
+            pos = ends.pop()
+        if start < pos:
+            continue
+        if ends:
+            end = min(end, ends[-1])
+        out.append(text(pos, start) + '<span class="%s" title="%s">' % (cls, html.escape(title)))
+        pos = start
+        ends.append(end)
+    while ends:
+        out.append(text(pos, ends[-1]) + "</span>")
+        pos = ends.pop()
+    out.append(text(pos, len(data)))
+    return "".join(out)
+
+
+#Self-contained HTML page with both files side by side and the nodes of the edit script highlighted
+def render_html(original, modified, actions, matches, original_name="original", modified_name="modified"):
+    src_spans, dst_spans = [], []
+    for action in actions_json(actions, matches):
+        kind = action.get("type", "").split("-")[0]
+        cls = ACTION_CLASSES.get(kind)
+        if cls is None:
+            continue
+        title = kind + " " + node_type(action.get("tree", ""))
+        if action["src"] is not None:
+            src_spans.append((*action["src"], cls, title))
+        if action["dst"] is not None:
+            dst_spans.append((*action["dst"], cls, title))
+
+    legend = " ".join('<span class="%s">&nbsp;&nbsp;</span> %s' % (cls, kind) for kind, cls in ACTION_CLASSES.items())
+    return ('<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"/><title>SoliDiffy</title><style>%s</style></head><body>'
+            '<p>%d edit actions. %s</p><div class="files">'
+            '<div class="file"><h4>%s</h4><pre>%s</pre></div><div class="file"><h4>%s</h4><pre>%s</pre></div>'
+            '</div></body></html>\n') % (HTML_STYLE, len(actions), legend, html.escape(original_name), highlight(original, src_spans),
+                                         html.escape(modified_name), highlight(modified, dst_spans))
@@ -1,10 +1,23 @@
+import os
 import sys
 import json
-import subprocess
+import argparse
 from pathlib import Path
+from collections import defaultdict
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from mutant_compose import mutant_texts
+from json_stream import iter_object_items
+from mutant_corpus import CorpusWriter, level_edits
+from process_runner import run
 
 logging = False
 
+#Contracts SuMo mutates (contractsDir in sumo-config.js) and the mutations it finds in them
+DATASET_PATH = "../contracts/small_dataset/"
+MUTATIONS_PATH = "../sumo/results/mutations.json"
+
 mutation_operators = ["ACM", "AOR", "AVR", "BCRD", "BLR", 
                       "BOR", "CCD", "CSC", "DLR", 
                       "DOD", "ECS", "EED", "EHC", "ER", 
@@ -18,81 +31,229 @@ mutation_operators = ["ACM", "AOR", "AVR", "BCRD", "BLR",
 #non-working operators? = ["CBD", "OMD"]
 
 def handle_input():
-    if len(sys.argv) != 2:
-        raise Exception("Please provide the desired number of mutations!")
-    
-    n_mutations = int(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Generate mutants with up to n SuMo mutations per contract and operator.",
+                                     epilog="Example: python3 %s 10" % os.path.basename(__file__))
+    parser.add_argument("n_mutations", type=int, help="the desired number of mutations")
+    parser.add_argument("--per-operator", action="store_true",
+                        help="run one SuMo lookup per operator instead of a single lookup with all operators enabled")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of contracts mutated at once (default: number of CPUs)")
+    parser.add_argument("--pack", default="",
+                        help="write a packed corpus (see mutant_corpus.py) to this file instead of the mutants directory")
+    parser.add_argument("--output", default="../contracts/mutants/", help="mutants directory (default: ../contracts/mutants/)")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="directory of the contracts to mutate (default: %s)" % DATASET_PATH)
+    parser.add_argument("--mutations", default="",
+                        help="mutations in the format of SuMo's mutations.json to use instead of running a SuMo lookup, e.g. from gen_synthetic.py")
+    args = parser.parse_args()
+    if args.pack and args.per_operator:
+        parser.error("--pack needs all operators of a contract at once, it cannot be combined with --per-operator")
+    if args.mutations and args.per_operator:
+        parser.error("--mutations already holds the mutations of every operator, it cannot be combined with --per-operator")
 
-    return n_mutations
+    return args.n_mutations, args.per_operator, args.jobs, args.pack, os.path.join(args.output, ""), os.path.join(args.dataset, ""), args.mutations
 
 #Generates sumo mutations
 def run_sumo():
-    subprocess.run('npx sumo lookup > /dev/null', shell=True)
-
-#Combines Sumo mutations into files with multiple mutations
-def generate_mutants(output_path, n_mutants, op):
-    file = open("../sumo/results/mutations.json")
-    sumo_res = json.load(file)
-    for c in sumo_res:
-        print("Mutating contract: " + c)
-        name = c.split('.')[0]
-        sumo_res[c] =  sorted(sumo_res[c], key=lambda d: d['start']) 
-        
-        try:
-            contract = open("../contracts/small_dataset/" +  c).read()
-        except: 
-            print("file: " + c + " could not be opened!")
-            continue
+    run(["npx", "sumo", "lookup"])
+
+#Yields (contract, mutations) from mutations.json one contract at a time, so memory is bounded by the largest
+#contract instead of the whole file
+def iter_mutations(path=MUTATIONS_PATH):
+    with open(path) as file:
+        yield from iter_object_items(file)
+
+#Splits the mutations of a contract found by a lookup with several operators enabled into {operator: mutations}.
+#Every operator is listed, as every contract is in the output of a lookup with only that operator enabled.
+def partition_by_operator(mutations, operators, unknown):
+    partitioned = {op: [] for op in operators}
+    for mutation in mutations:
+        if mutation["operator"] in partitioned:
+            partitioned[mutation["operator"]].append(mutation)
+        else:
+            unknown[mutation["operator"]] += 1
+    return partitioned
+
+#Source of a contract in the dataset, or None if it cannot be read
+def read_contract(c, dataset=DATASET_PATH):
+    try:
+        return open(dataset +  c).read()
+    except:
+        return None
+
+#Yields (operator, level, mutant) for the mutants combining 1, 2, ... n_mutants Sumo mutations of each operator in mutations
+def contract_mutants(contract, mutations, n_mutants):
+    for op in mutations:
+        level = 0
+        for mutant in mutant_texts(contract, sorted(mutations[op], key=lambda d: d['start']), n_mutants, logging):
+            level += 1
+            yield op, level, mutant
 
-        output = Path(output_path + name + '/original/' + c)
+#Combines the Sumo mutations of one contract into files with multiple mutations, for each operator in mutations.
+#Returns the number of successful mutants per operator, or None if the contract could not be read.
+def mutate_contract(output_path, n_mutants, c, mutations, dataset=DATASET_PATH):
+    name = c.split('.')[0]
+    contract = read_contract(c, dataset)
+    if contract is None:
+        return None
+
+    # Replaced atomically, in case an interrupted run left a partial copy
+    output = Path(output_path + name + '/original/' + c)
+    output.parent.mkdir(exist_ok=True, parents=True)
+    tmp = output.with_name(output.name + '.' + str(os.getpid()) + '.tmp')
+    tmp.write_text(contract)
+    os.replace(tmp, output)
+
+    counts = {op: 0 for op in mutations}                        #The number of successful mutaions
+    for op, level, mutant in contract_mutants(contract, mutations, n_mutants):
+        counts[op] = level
+        output = Path(output_path + name  + '/' + str(level) + '/' + op + '/' + c)
         output.parent.mkdir(exist_ok=True, parents=True)
-        output.write_text(contract)
-
-        i = 0                                                   #The index of the next possible mutation
-        offset = 0                                              #The offset in character indices caused by mutations
-        used_characters = [True for i in range(len(contract))]  #Bitmap tracking already mutated characters
-        counter = 0                                             #The number of successful mutaions
-        prev_start = 0                                          #Keeps track of last mutation start index to avoid case where mutations become 'unsorted' after applying offset
-        while counter < n_mutants:
-            try:
-                mutation = sumo_res[c][i]
-            except:
-                break
-            i += 1
-
-            mut_start, mut_end = mutation["start"] + offset, mutation["end"] + offset
-            new_content, old_content = str(mutation["replace"]), str(mutation["original"])
-            line_start, line_end = mutation["startLine"], mutation["endLine"]
-
-            if  all(used_characters[mut_start:mut_end]) and prev_start < mut_start:
-                if logging:
-                    print("------------------------------------------")
-                    print("Mutating line " + str(line_start) + " characters " + str(mut_start) + "-" + str(mut_end))
-                    print(old_content + " --> " + new_content)
-                    print("Offset for replacement: " + str(len(new_content) - len(old_content)))
-
-                contract = contract[0:mut_start] + new_content + contract[mut_end:]
-                offs = len(new_content) - len(old_content)
-                offset += offs
-                used_characters = used_characters[0:mut_start] + [False for j in range(mut_end - mut_start + offs)] + used_characters[mut_end+offs:]
-                counter += 1
-                prev_start = mut_start
-
-                output = Path(output_path + name  + '/' + str(counter) + '/' + op + '/' + c)
-                output.parent.mkdir(exist_ok=True, parents=True)
-                output.write_text(contract)
-            else:
+        output.write_text(mutant)
+    return counts
+
+#Edits of the mutants of one contract for a packed corpus, as (original, {operator: [edits of level 1, ...]}),
+#or None if the contract could not be read
+def pack_contract(n_mutants, c, mutations, dataset=DATASET_PATH):
+    contract = read_contract(c, dataset)
+    if contract is None:
+        return None
+    return contract, {op: level_edits(contract, sorted(mutations[op], key=lambda d: d['start']), n_mutants) for op in mutations}
+
+#Number of successful mutants per contract and operator. <output>.progress.jsonl gets a line as soon as a
+#contract is done, <output>.manifest.json the sorted summary when the run is closed. Both are next to the
+#mutants directory, which must only contain contract directories.
+class Manifest:
+    def __init__(self, output_path, n_mutants):
+        base = output_path.rstrip('/')
+        self.path = base + ".manifest.json"
+        self.n_mutants = n_mutants
+        self.contracts = {}
+        self.unreadable = set()
+        Path(base).parent.mkdir(exist_ok=True, parents=True)
+        self.progress = open(base + ".progress.jsonl", "w")
+
+    def add(self, c, counts):
+        if counts is None:
+            print("file: " + c + " could not be opened!")
+            self.unreadable.add(c)
+        else:
+            self.contracts.setdefault(c, {}).update(counts)
+        self.progress.write(json.dumps({"contract": c, "mutants": counts}) + "\n")
+        self.progress.flush()
+
+    def close(self):
+        self.progress.close()
+        operators = defaultdict(int)
+        for counts in self.contracts.values():
+            for op, n in counts.items():
+                operators[op] += n
+        manifest = {
+            "n_mutants": self.n_mutants,
+            "total": sum(operators.values()),
+            "operators": dict(sorted(operators.items())),
+            "contracts": {c: dict(sorted(self.contracts[c].items())) for c in sorted(self.contracts)},
+            "unreadable": sorted(self.unreadable),
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, self.path)
+        print("# of successful mutants: " + str(manifest["total"]) + " (" + self.path + ")")
+
+#Runs task(*task_args, contract, mutations) in a pool of jobs processes and on_done(contract, result) in the main
+#process as they finish. tasks yields (contract, {operator: mutations}) and is consumed lazily, with at most two
+#tasks per worker in flight. Every contract is written by exactly one task, so the output does not depend on the
+#order tasks finish in.
+def run_mutations(task, task_args, tasks, jobs, on_done):
+    jobs = max(1, jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        done = 0
+        for c, mutations in tasks:
+            futures[executor.submit(task, *task_args, c, mutations)] = c
+            if len(futures) < 2 * jobs:
                 continue
-        print("# of successful mutants for " + c + ": " + str(counter) + "/" + str(n_mutants))
-       
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                on_done(futures.pop(future), future.result())
+                done += 1
+            print(f'\rMutated contracts: {done}', end='', flush=True)
+        for future in as_completed(futures):
+            on_done(futures[future], future.result())
+            done += 1
+            print(f'\rMutated contracts: {done}', end='', flush=True)
+        print()
+
+#Combines Sumo mutations of one operator into files with multiple mutations. Mutations are read from mutations.json unless given.
+def generate_mutants(output_path, n_mutants, op, sumo_res=None, jobs=1, manifest=None, dataset=DATASET_PATH):
+    contracts = iter_mutations() if sumo_res is None else sumo_res.items()
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = Manifest(output_path, n_mutants)
+    run_mutations(partial(mutate_contract, dataset=dataset), (output_path, n_mutants), ((c, {op: mutations}) for c, mutations in contracts), jobs, manifest.add)
+    if own_manifest:
+        manifest.close()
+
+#Runs one SuMo lookup with every operator enabled
+def run_sumo_all():
+    run(["npx", "sumo", "disable"])
+    run(["npx", "sumo", "enable"])
+    run_sumo()
+    run(["npx", "sumo", "disable"])
+
+#Yields (contract, {operator: mutations}) from mutations.json, for every operator in mutation_operators
+def iter_partitioned_mutations(unknown, path=MUTATIONS_PATH):
+    for c, mutations in iter_mutations(path):
+        yield c, partition_by_operator(mutations, mutation_operators, unknown)
+
+def print_unknown_operators(unknown):
+    for op in sorted(unknown):
+        print("Skipping " + str(unknown[op]) + " mutations of operator " + op + ", it is not in mutation_operators")
+
+#Runs one SuMo lookup with every operator enabled and generates the mutants of all contracts in parallel,
+#either as files under output_path or, with pack, as a packed corpus. With a mutations file (in the format of
+#SuMo's mutations.json), no lookup is run and the mutations are read from it instead.
+def generate_all_mutants(output_path, n_mutants, jobs, pack="", dataset=DATASET_PATH, mutations=""):
+    if not mutations:
+        run_sumo_all()
+
+    unknown = defaultdict(int)
+    tasks = iter_partitioned_mutations(unknown, mutations or MUTATIONS_PATH)
+    if not pack:
+        manifest = Manifest(output_path, n_mutants)
+        run_mutations(partial(mutate_contract, dataset=dataset), (output_path, n_mutants), tasks, jobs, manifest.add)
+        manifest.close()
+    else:
+        manifest = Manifest(pack, n_mutants)
+        writer = CorpusWriter(pack, n_mutants)
+
+        def add_contract(c, result):
+            if result is None:
+                manifest.add(c, None)
+                return
+            contract, edits = result
+            writer.add(c.split('.')[0], c, contract, edits)
+            manifest.add(c, {op: len(edits[op]) for op in edits})
+
+        run_mutations(partial(pack_contract, dataset=dataset), (n_mutants,), tasks, jobs, add_contract)
+        writer.close()
+        manifest.close()
+    print_unknown_operators(unknown)
+
 
 if __name__ ==  '__main__':
-    num_mutants = handle_input()
-    subprocess.run('npx sumo disable', shell=True)
-    output_path = "../contracts/mutants/"
-    
+    num_mutants, per_operator, jobs, pack, output_path, dataset, mutations = handle_input()
+
+    if not per_operator:
+        generate_all_mutants(output_path, num_mutants, jobs, pack, dataset, mutations)
+        sys.exit(0)
+
+    run(["npx", "sumo", "disable"])
+
+    manifest = Manifest(output_path, num_mutants)
     for op in mutation_operators:
-        subprocess.run('npx sumo enable ' + op, shell=True)
+        run(["npx", "sumo", "enable", op])
         run_sumo()
-        generate_mutants(output_path, num_mutants, op)
-        subprocess.run('npx sumo disable ' + op, shell=True)
+        generate_mutants(output_path, num_mutants, op, jobs=jobs, manifest=manifest, dataset=dataset)
+        run(["npx", "sumo", "disable", op])
+    manifest.close()
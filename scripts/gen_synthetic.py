@@ -0,0 +1,212 @@
+# Generates large synthetic Solidity contracts for scaling tests by combining and scaling the
+# baseline contracts, together with seeded mutations for them in the format of SuMo's
+# mutations.json, so gen_diff_pairs.py can turn them into mutants without a SuMo run.
+#
+# A synthetic contract is built like a flattened contract: the baseline contracts are
+# concatenated, in a seeded order and repeated as often as needed, until the file reaches the
+# requested size. Their SPDX, pragma and import lines are dropped (one pragma is kept at the
+# top), and the contracts, interfaces, libraries, structs, enums, events and errors each copy
+# declares are renamed with a suffix so copies do not clash. With a depth > 0, the body of every
+# function is wrapped in that many nested blocks, which deepens the AST without changing what the
+# code does. The result is syntactically valid Solidity of about the requested size; like the
+# baseline contracts it refers to imports that are not there, so it parses but does not compile.
+#
+# The mutations are seeded replacements of binary operators (BOR), boolean literals (BLR) and
+# integer literals (ILR) outside comments and strings, named after the SuMo operators they
+# imitate, spread over the whole contract. bench_diffs.py uses the same mutator.
+#
+# Usage:
+#   python3 gen_synthetic.py --sizes 50000 200000 1000000 --depths 0 4
+#   python3 gen_diff_pairs.py 10 --dataset ../contracts/synthetic --mutations ../contracts/synthetic.mutations.json --output ../contracts/synthetic_mutants/
+#   python3 perform_diffs.py ../contracts/synthetic_mutants/ GT
+# or, in one go: python3 gen_synthetic.py --sizes 50000 200000 --mutate 10
+
+import os
+import re
+import json
+import random
+import argparse
+from bisect import bisect_right
+
+from gen_diff_pairs import generate_all_mutants
+
+# Operator replacements of the seeded mutator, named after the SuMo operators they imitate
+MUTATION_OPERATORS = {
+    "BOR": (re.compile(r"(?<=\s)(\+|-|\*|/|%|<|>|<=|>=|==|!=|&&|\|\|)(?=\s)"),
+            {"+": "-", "-": "+", "*": "/", "/": "*", "%": "*", "<": ">=", ">": "<=", "<=": ">", ">=": "<",
+             "==": "!=", "!=": "==", "&&": "||", "||": "&&"}),
+    "BLR": (re.compile(r"\b(true|false)\b"), {"true": "false", "false": "true"}),
+    "ILR": (re.compile(r"(?<![\w.])(\d+)(?![\w.])"), None),
+}
+# Comments and string literals
+SKIPPED = re.compile(r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'", re.S)
+
+DROPPED_LINES = re.compile(r"^[ \t]*(//[ \t]*SPDX-License-Identifier:[^\n]*|pragma[^;]*;|import[^;]*;)[ \t]*\n?", re.M)
+PRAGMA = re.compile(r"^[ \t]*pragma solidity[^;]*;", re.M)
+DECLARATION = re.compile(r"\b(?:contract|interface|library|struct|enum|event|error)\s+([A-Za-z_]\w*)")
+FUNCTION = re.compile(r"\bfunction\b")
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Generate large synthetic Solidity contracts from the baseline contracts, with seeded mutations.",
+                                     epilog="Example: python3 %s --sizes 50000 200000 1000000 --depths 0 4" % os.path.basename(__file__))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000, 1000000],
+                        help="sizes in bytes of the generated contracts (default: 50000 200000 1000000)")
+    parser.add_argument("--depths", type=int, nargs="+", default=[0],
+                        help="numbers of blocks every function body is wrapped in, one contract per size and depth (default: 0)")
+    parser.add_argument("--contracts", default="../sumo/baseline/contracts",
+                        help="contracts the synthetic ones are made from (default: ../sumo/baseline/contracts)")
+    parser.add_argument("--output", default="../contracts/synthetic", help="directory the contracts are written to (default: ../contracts/synthetic)")
+    parser.add_argument("--mutations", default="../contracts/synthetic.mutations.json",
+                        help="file the mutations are written to (default: ../contracts/synthetic.mutations.json)")
+    parser.add_argument("--mutations-per-operator", type=int, default=10, help="mutations per contract and operator (default: 10)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the contract order and the mutations")
+    parser.add_argument("--mutate", type=int, default=0,
+                        help="also generate mutants with up to this many mutations with gen_diff_pairs.py (default: 0, do not)")
+    parser.add_argument("--mutants", default="../contracts/synthetic_mutants/",
+                        help="mutants directory for --mutate (default: ../contracts/synthetic_mutants/)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of contracts mutated at once with --mutate (default: number of CPUs)")
+    return parser.parse_args()
+
+
+#Sorted (start, end) spans of the comments and string literals of a contract, and a test whether a position is in one
+def skipped_spans(contract):
+    spans = [m.span() for m in SKIPPED.finditer(contract)]
+    starts = [start for start, _ in spans]
+    def is_skipped(pos):
+        i = bisect_right(starts, pos) - 1
+        return i >= 0 and pos < spans[i][1]
+    return spans, is_skipped
+
+
+#Seeded SuMo-style mutations of a contract, {operator: [mutation]}, with up to n_mutations per operator
+def seeded_mutations(contract, n_mutations, rng):
+    _, is_skipped = skipped_spans(contract)
+    mutations = {}
+    for op, (pattern, replacements) in MUTATION_OPERATORS.items():
+        candidates = [m for m in pattern.finditer(contract) if not is_skipped(m.start())]
+        chosen = sorted(rng.sample(candidates, min(n_mutations, len(candidates))), key=lambda m: m.start())
+        mutations[op] = [{
+            "start": m.start(),
+            "end": m.end(),
+            "startLine": contract.count("\n", 0, m.start()) + 1,
+            "original": m.group(),
+            "replace": replacements[m.group()] if replacements else str(int(m.group()) + 1),
+            "operator": op,
+        } for m in chosen]
+    return mutations
+
+
+#Index just past the brace closing the one at open_pos, or None if it is not closed
+def matching_brace(contract, open_pos, is_skipped):
+    depth = 0
+    for pos in range(open_pos, len(contract)):
+        if contract[pos] in "{}" and not is_skipped(pos):
+            depth += 1 if contract[pos] == "{" else -1
+            if depth == 0:
+                return pos + 1
+    return None
+
+
+#Wraps the body of every function with a body in depth nested blocks
+def nest_function_bodies(contract, depth):
+    if depth <= 0:
+        return contract
+    _, is_skipped = skipped_spans(contract)
+    out = []
+    pos = 0
+    for m in FUNCTION.finditer(contract):
+        if m.start() < pos or is_skipped(m.start()):
+            continue    #inside a body or header already handled, e.g. a function type
+        header_end = m.end()
+        while header_end < len(contract) and (contract[header_end] not in "{;" or is_skipped(header_end)):
+            header_end += 1
+        if header_end == len(contract) or contract[header_end] == ";":
+            continue    #declaration without a body
+        body_end = matching_brace(contract, header_end, is_skipped)
+        if body_end is None:
+            break
+        out.append(contract[pos:header_end + 1])
+        out.append(" {" * depth + contract[header_end + 1:body_end - 1] + "} " * depth)
+        out.append("}")
+        pos = body_end
+    out.append(contract[pos:])
+    return "".join(out)
+
+
+#One baseline contract prepared to be part of a synthetic one: without its SPDX, pragma and import lines and with
+#its declarations renamed with the given suffix
+def synthetic_part(contract, suffix, depth):
+    body = DROPPED_LINES.sub("", contract)
+    _, is_skipped = skipped_spans(body)
+    names = sorted({m.group(1) for m in DECLARATION.finditer(body) if not is_skipped(m.start())}, key=len, reverse=True)
+    if names:
+        body = re.sub(r"\b(" + "|".join(map(re.escape, names)) + r")\b", lambda m: m.group(1) + suffix, body)
+    return nest_function_bodies(body, depth).strip() + "\n"
+
+
+#A synthetic contract of at least size bytes (a whole part more at most) made of the given baseline contracts
+def synthetic_contract(sources, size, depth, rng):
+    pragma = PRAGMA.search(sources[0][1])
+    out = ["// SPDX-License-Identifier: MIT\n", (pragma.group().strip() if pragma else "pragma solidity ^0.8.0;") + "\n\n"]
+    length = sum(map(len, out))
+    copies = 0
+    while length < size:
+        order = list(range(len(sources)))
+        rng.shuffle(order)
+        for i in order:
+            name, contract = sources[i]
+            copies += 1
+            part = "// ---- " + name + " (copy " + str(copies) + ") ----\n" + synthetic_part(contract, "_" + str(copies), depth) + "\n"
+            out.append(part)
+            length += len(part)
+            if length >= size:
+                break
+    return "".join(out), copies
+
+
+def format_size(size):
+    return "%dK" % (size // 1000) if size >= 1000 else str(size)
+
+
+def max_block_depth(contract):
+    _, is_skipped = skipped_spans(contract)
+    depth = deepest = 0
+    for pos, char in enumerate(contract):
+        if char in "{}" and not is_skipped(pos):
+            depth += 1 if char == "{" else -1
+            deepest = max(deepest, depth)
+    return deepest
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    sources = []
+    for c in sorted(os.listdir(args.contracts)):
+        if c.endswith(".sol"):
+            with open(os.path.join(args.contracts, c)) as f:
+                sources.append((c, f.read()))
+    if not sources:
+        raise SystemExit("no .sol files in " + args.contracts)
+
+    os.makedirs(args.output, exist_ok=True)
+    mutations = {}
+    for size in args.sizes:
+        for depth in args.depths:
+            c = "Synthetic%sD%d.sol" % (format_size(size), depth)
+            contract, copies = synthetic_contract(sources, size, depth, random.Random("%d:%d" % (args.seed, size)))
+            with open(os.path.join(args.output, c), "w") as f:
+                f.write(contract)
+            muts = seeded_mutations(contract, args.mutations_per_operator, random.Random("%d:%s" % (args.seed, c)))
+            mutations[c] = [mutation for op in muts for mutation in muts[op]]
+            print(f"{c}: {len(contract)} bytes, {contract.count(chr(10))} lines, {copies} contracts, "
+                  f"block depth {max_block_depth(contract)}, {len(mutations[c])} mutations")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.mutations)), exist_ok=True)
+    with open(args.mutations, "w") as f:
+        json.dump(mutations, f)
+    print("Mutations written to " + args.mutations)
+
+    if args.mutate > 0:
+        generate_all_mutants(os.path.join(args.mutants, ""), args.mutate, args.jobs, dataset=os.path.join(args.output, ""), mutations=args.mutations)
@@ -0,0 +1,348 @@
+# Client for the long-lived Gumtree diff workers in gumtree_server/GumtreeServer.java.
+# Instead of starting a new JVM for every `gumtree textdiff` call, a pool of warm workers
+# is kept alive and each pair of files is sent to an idle worker over its stdin.
+#
+# Usage:
+#   pool = GumtreePool(8)
+#   xml, running_time, metrics = pool.diff("original.sol", "mutant.sol")
+#   xml, running_time, metrics = pool.diff("original.sol", "mutant.sol", src_tree=tree_cache.tree_for("original.sol"))
+#
+#   reader = ActionReader()
+#   _, running_time, metrics = pool.diff("original.sol", "mutant.sol", reader=reader)
+#   reader.close(); n_edits, actions = reader.n_actions, reader.actions()
+#
+#   reader = ActionReader(capture=False)    #only the types of the actions are sent, see output_level.py
+#   _, running_time, metrics = pool.diff("original.sol", "mutant.sol", reader=reader)
+#   reader.close(); n_edits, counts = reader.n_actions, reader.counts
+#   pool.close()
+
+import os
+import shutil
+import subprocess
+import queue
+import threading
+import xml.parsers.expat
+
+import time
+
+from process_runner import Limits, RETRYABLE, run, java_env, metrics, peak_rss_kb
+from profiling import stage
+
+CHUNK_SIZE = 1 << 16
+
+SERVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gumtree_server", "GumtreeServer.java")
+
+
+#kind classifies the failure as in process_runner.py
+class GumtreeError(Exception):
+    def __init__(self, message, kind="tool-error"):
+        super().__init__(message)
+        self.kind = kind
+
+
+#Incremental reader of Gumtree's textdiff XML. Counts the edit actions, in total and by type, and
+#optionally keeps the raw bytes of the <actions> element as they stream in, without building a tree. The output has
+#an XML declaration followed by two root elements (<matches> and <actions>), so the declaration
+#line is skipped and the rest is parsed inside a <X> wrapper.
+class ActionReader:
+    def __init__(self, capture=True):
+        self.reset(capture)
+
+    #Starts over, e.g. before the output of a retried call is fed in
+    def reset(self, capture=None):
+        self.capture = self.capture if capture is None else capture
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        self.depth = 0
+        self.in_actions = False
+        self.n_actions = 0
+        self.counts = {}            #type of action -> number of actions
+        self.header = b""           #XML declaration line, until it is complete
+        self.fed = 0                #bytes handed to the parser so far, including the wrapper
+        self.buffer = []            #(offset, chunk) of the chunks that may hold the <actions> element
+        self.last_tag = 0           #offset of the last tag parsed before <actions>, <actions> starts after it
+        self.actions_start = None   #offsets of the <actions> element in the wrapped stream
+        self.actions_end = None
+        self.error = None
+
+    def start_element(self, name, attrs):
+        self.depth += 1
+        self.last_tag = self.parser.CurrentByteIndex
+        if self.depth == 2 and name == "actions":
+            self.in_actions = True
+            self.actions_start = self.parser.CurrentByteIndex
+        elif self.depth == 3 and self.in_actions:
+            self.n_actions += 1
+            kind = attrs.get("type")
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def end_element(self, name):
+        self.last_tag = self.parser.CurrentByteIndex
+        if self.depth == 2 and self.in_actions:
+            self.in_actions = False
+            # expat points at the start of </actions>, or right after <actions/>
+            self.actions_end = self.parser.CurrentByteIndex
+            if self.capture:
+                base, data = self.buffered()
+                if data[self.actions_end - base:self.actions_end - base + 2] == b"</":
+                    self.actions_end += len(b"</actions>")
+        self.depth -= 1
+
+    def buffered(self):
+        return self.buffer[0][0], b"".join(chunk for _, chunk in self.buffer)
+
+    def feed(self, data):
+        if self.header is not None:
+            self.header += data
+            if b"\n" not in self.header:
+                return
+            data = b"<X>" + self.header.split(b"\n", 1)[1]
+            self.header = None
+
+        if self.error is not None:
+            return
+        if self.capture and self.actions_end is None:
+            self.buffer.append((self.fed, data))
+        self.fed += len(data)
+        try:
+            with stage("xml-parse"):
+                self.parser.Parse(data, False)
+        except xml.parsers.expat.ExpatError as e:
+            # Raised from close(), so the caller can still drain the stream it is reading from
+            self.error = e
+            return
+        if self.actions_start is None:
+            # Drop the chunks that end before the last parsed tag
+            while self.buffer and self.buffer[0][0] + len(self.buffer[0][1]) <= self.last_tag:
+                del self.buffer[0]
+
+    #Finishes parsing. Returns False if Gumtree produced no output, raises ExpatError on malformed output.
+    def close(self):
+        if self.header is not None:
+            return False
+        if self.error is None:
+            self.parser.Parse(b"</X>", True)
+        else:
+            raise self.error
+        return True
+
+    #The raw <actions> element, or None if it was not captured
+    def actions(self):
+        if not self.capture or self.actions_end is None:
+            return None
+        base, data = self.buffered()
+        return data[self.actions_start - base:self.actions_end - base].decode()
+
+
+#Finds the lib/ directory of the Gumtree distribution, either from $GUMTREE_HOME or from the gumtree launcher on the PATH
+def find_gumtree_lib():
+    home = os.environ.get("GUMTREE_HOME")
+    if home is None:
+        launcher = shutil.which("gumtree")
+        if launcher is None:
+            raise GumtreeError("gumtree not found on PATH, set GUMTREE_HOME to the Gumtree distribution")
+        home = os.path.dirname(os.path.dirname(os.path.realpath(launcher)))
+
+    lib = os.path.join(home, "lib")
+    if not os.path.isdir(lib):
+        raise GumtreeError("no Gumtree lib directory at " + lib)
+    return lib
+
+
+#Runs `gumtree textdiff` in a new process and streams its XML output into an ActionReader. Raises a RunError on failure.
+def textdiff(filepath1, filepath2, reader, limits=Limits()):
+    return run(["gumtree", "textdiff", "-f", "XML", filepath1, filepath2], limits._replace(memory_mb=None),
+               on_stdout=reader.feed, env=java_env(limits), on_retry=reader.reset)
+
+
+#A single warm JVM running GumtreeServer
+class GumtreeWorker:
+    def __init__(self, lib=None, memory_mb=None):
+        lib = lib or find_gumtree_lib()
+        self.proc = subprocess.Popen(["java", "-cp", os.path.join(lib, "*"), SERVER_SOURCE],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     env=java_env(Limits(memory_mb=memory_mb)))
+        ready = self.proc.stdout.readline()
+        if ready != b"READY\n":
+            self.close()
+            raise GumtreeError("Gumtree worker failed to start")
+
+    #Returns the textdiff XML (bytes), the diff time in seconds measured inside the JVM and the metrics
+    #of the request (see process_runner.METRICS): the wall time of the round trip, the CPU time of the
+    #JVM thread handling it, the phase times reported by the worker and the peak RSS of the worker so far.
+    #src_tree is an optional pre-parsed tree of filepath1 (see tree_cache.py). If an ActionReader
+    #is given, the XML is streamed into it instead and None is returned in its place; a reader that does
+    #not capture the actions only gets their types. A worker that takes longer than timeout seconds is killed.
+    def diff(self, filepath1, filepath2, src_tree=None, reader=None, timeout=None):
+        timer = None
+        timed_out = threading.Event()
+        if timeout is not None:
+            def expire():
+                timed_out.set()
+                self.proc.kill()
+            timer = threading.Timer(timeout, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            start = time.perf_counter_ns()
+            body, elapsed_ns, phases = self.request(filepath1, filepath2, src_tree, reader)
+            wall_ns = time.perf_counter_ns() - start
+        except (OSError, ValueError, GumtreeError) as e:
+            if timed_out.is_set() or not isinstance(e, GumtreeError) or e.kind == "worker-exit":
+                # Make sure the pool sees the worker as dead, its output may have ended before it exited
+                self.proc.kill()
+                self.proc.wait()
+            if timed_out.is_set():
+                raise GumtreeError("Gumtree worker timed out after %s s" % timeout, kind="timeout") from e
+            if not isinstance(e, GumtreeError):
+                raise GumtreeError("Gumtree worker exited unexpectedly (" + str(e) + ")", kind="worker-exit") from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        # Times the worker does not report are -1
+        parse_ns, match_ns, actions_ns, user_ns, cpu_ns = phases + [-1] * (5 - len(phases))
+        return body, elapsed_ns / 1e9, metrics(wall_ns=wall_ns, cpu_user_ns=user_ns, cpu_sys_ns=cpu_ns - user_ns if cpu_ns >= 0 else -1,
+                                               max_rss_kb=peak_rss_kb(self.proc.pid), parse_ns=parse_ns, match_ns=match_ns,
+                                               actions_ns=actions_ns)
+
+    #Sends one request and reads the answer: the XML (or None when streamed into reader), the elapsed
+    #time and the list of phase and CPU times of the header
+    def request(self, filepath1, filepath2, src_tree, reader):
+        request = os.path.abspath(filepath1) + "\t" + os.path.abspath(filepath2)
+        if reader is not None and not reader.capture:
+            request += "\t" + (os.path.abspath(src_tree) if src_tree is not None else "") + "\tsummary"
+        elif src_tree is not None:
+            request += "\t" + os.path.abspath(src_tree)
+        request += "\n"
+        self.proc.stdin.write(request.encode())
+        self.proc.stdin.flush()
+
+        header = self.proc.stdout.readline().decode()
+        if not header:
+            raise GumtreeError("Gumtree worker exited unexpectedly", kind="worker-exit")
+        status, rest = header.rstrip("\n").split(" ", 1)
+        if status == "ERR":
+            raise GumtreeError(rest)
+
+        fields = [int(field) for field in rest.split(" ")]
+        n_bytes, elapsed_ns = fields[:2]
+        if reader is None:
+            body = self.proc.stdout.read(n_bytes)
+            if len(body) < n_bytes:
+                raise GumtreeError("Gumtree worker exited unexpectedly", kind="worker-exit")
+        else:
+            body = None
+            while n_bytes > 0:
+                chunk = self.proc.stdout.read(min(n_bytes, CHUNK_SIZE))
+                if not chunk:
+                    raise GumtreeError("Gumtree worker exited unexpectedly", kind="worker-exit")
+                reader.feed(chunk)
+                n_bytes -= len(chunk)
+        return body, elapsed_ns, fields[2:]
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def close(self):
+        if self.proc.stdin:
+            try:
+                self.proc.stdin.close()
+            except OSError:     #the worker is already gone
+                pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+#Thread-safe pool of warm workers. Workers are started lazily and replaced if they die. limits
+#(see process_runner.py) gives the timeout per diff, the number of retries on another worker
+#after a timeout or a dead worker, and the heap size of the workers; CPU limits do not apply.
+class GumtreePool:
+    def __init__(self, size=os.cpu_count(), limits=Limits()):
+        self.size = size
+        self.limits = limits
+        self.lib = find_gumtree_lib()
+        self.idle = queue.Queue()
+        self.started = 0
+        self.waiting = 0    #threads in acquire(), waiting for a worker to become idle or start
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            self.waiting += 1
+        try:
+            return self._acquire()
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def _acquire(self):
+        while True:
+            with self.lock:
+                if self.idle.empty() and self.started < self.size:
+                    self.started += 1
+                    spawn = True
+                else:
+                    spawn = False
+            if spawn:
+                try:
+                    return GumtreeWorker(self.lib, self.limits.memory_mb)
+                except Exception:
+                    with self.lock:
+                        self.started -= 1
+                    raise
+            worker = self.idle.get()
+            if worker is not None:
+                return worker
+
+    #Number of workers started, busy and idle, and of threads waiting for one
+    def stats(self):
+        with self.lock:
+            idle = self.idle.qsize()
+            return {"size": self.size, "started": self.started, "busy": max(0, self.started - idle), "idle": idle, "waiting": self.waiting}
+
+    #A dead worker is replaced by None, which wakes a waiting thread to start a new one
+    def release(self, worker):
+        if worker.alive():
+            self.idle.put(worker)
+        else:
+            worker.close()
+            with self.lock:
+                self.started -= 1
+            self.idle.put(None)
+
+    def diff(self, filepath1, filepath2, src_tree=None, reader=None):
+        attempts = 0
+        while True:
+            attempts += 1
+            with stage("pool-acquire"):
+                worker = self.acquire()
+            try:
+                with stage("gumtree-worker"):
+                    return worker.diff(filepath1, filepath2, src_tree, reader, self.limits.timeout)
+            except GumtreeError as e:
+                if e.kind not in RETRYABLE or attempts > self.limits.retries:
+                    raise
+                if reader is not None:
+                    reader.reset()
+            finally:
+                self.release(worker)
+
+    def close(self):
+        with self.lock:
+            while not self.idle.empty():
+                worker = self.idle.get()
+                if worker is not None:
+                    worker.close()
+            self.started = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
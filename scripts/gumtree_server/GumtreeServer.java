@@ -0,0 +1,141 @@
+// Long-lived Gumtree diff worker. Reads one "<original>\t<modified>[\t<original tree>[\tsummary]]"
+// request per line on stdin and answers each with a header line followed by the textdiff XML:
+//
+//   OK <n_bytes> <elapsed_ns> <parse_ns> <match_ns> <actions_ns> <cpu_user_ns> <cpu_ns>\n<n_bytes of XML>
+//   ERR <message>\n
+//
+// elapsed_ns covers the whole request, parse_ns, match_ns and actions_ns its phases (parsing or
+// loading the trees, matching them and generating the edit script; writing the XML is the rest).
+// cpu_user_ns and cpu_ns are the user and total CPU time of the request thread, -1 if the JVM
+// cannot measure them. The XML is exactly what `gumtree textdiff -f XML` prints. The optional third field is the
+// tree-sitter-parser XML of the original (see scripts/tree_cache.py); it is loaded instead of
+// parsing the original again, and kept in memory for the following mutants of the same contract;
+// it may be empty. With "summary" as the fourth field, the XML has no matches and only the type of
+// each action, e.g. <action type="update-node"/>, for callers that only count the actions.
+//
+// Started once per worker by scripts/gumtree_client.py with the Java source launcher, so the
+// JVM, the Gumtree classes and the generator registry stay warm across pairs:
+//
+//   java -cp "$GUMTREE_HOME/lib/*" GumtreeServer.java
+
+import com.github.gumtreediff.actions.Diff;
+import com.github.gumtreediff.actions.EditScript;
+import com.github.gumtreediff.actions.SimplifiedChawatheScriptGenerator;
+import com.github.gumtreediff.actions.model.Action;
+import com.github.gumtreediff.client.Run;
+import com.github.gumtreediff.gen.TreeGenerators;
+import com.github.gumtreediff.io.ActionsIoUtils;
+import com.github.gumtreediff.io.TreeIoUtils;
+import com.github.gumtreediff.matchers.MappingStore;
+import com.github.gumtreediff.matchers.Matchers;
+import com.github.gumtreediff.tree.TreeContext;
+
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.StringWriter;
+import java.lang.management.ManagementFactory;
+import java.lang.management.ThreadMXBean;
+import java.nio.charset.StandardCharsets;
+import java.util.LinkedHashMap;
+import java.util.Map;
+
+public class GumtreeServer {
+    private static final int MAX_CACHED_TREES = 32;
+
+    // Trees of recently used originals, keyed by the (content-addressed) tree file path
+    private static final Map<String, TreeContext> trees = new LinkedHashMap<String, TreeContext>(16, 0.75f, true) {
+        @Override
+        protected boolean removeEldestEntry(Map.Entry<String, TreeContext> eldest) {
+            return size() > MAX_CACHED_TREES;
+        }
+    };
+
+    private static TreeContext cachedTree(String treeFile) throws Exception {
+        TreeContext tree = trees.get(treeFile);
+        if (tree == null) {
+            tree = TreeIoUtils.fromXml().generateFrom().file(treeFile);
+            trees.put(treeFile, tree);
+        }
+        return tree;
+    }
+
+    // End times of the phases of the last compute(), in System.nanoTime()
+    private static long parsed, matched, scripted;
+
+    // Same steps as Diff.compute, timed one by one
+    private static Diff compute(String[] files) throws Exception {
+        TreeContext src = files.length == 2 || files[2].isEmpty() ? TreeGenerators.getInstance().getTree(files[0]) : cachedTree(files[2]);
+        TreeContext dst = TreeGenerators.getInstance().getTree(files[1]);
+        parsed = System.nanoTime();
+        MappingStore mappings = Matchers.getInstance().getMatcher().match(src.getRoot(), dst.getRoot());
+        matched = System.nanoTime();
+        EditScript editScript = new SimplifiedChawatheScriptGenerator().computeActions(mappings);
+        scripted = System.nanoTime();
+        return new Diff(src, dst, mappings, editScript);
+    }
+
+    // The actions of the edit script in the textdiff XML layout, with only their types
+    private static void writeSummary(EditScript editScript, StringWriter xml) {
+        xml.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<matches/>\n<actions>\n");
+        for (Action action : editScript)
+            xml.write("<action type=\"" + action.getName() + "\"/>\n");
+        xml.write("</actions>\n");
+    }
+
+    private static long cpuTime(ThreadMXBean threads, boolean user) {
+        if (!threads.isCurrentThreadCpuTimeSupported())
+            return -1;
+        return user ? threads.getCurrentThreadUserTime() : threads.getCurrentThreadCpuTime();
+    }
+
+    public static void main(String[] args) throws Exception {
+        // Keep the protocol channel private: anything Gumtree or a generator prints goes to stderr.
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+        System.setOut(new PrintStream(new FileOutputStream(FileDescriptor.err), true));
+
+        Run.initGenerators();
+        ThreadMXBean threads = ManagementFactory.getThreadMXBean();
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        out.write("READY\n".getBytes(StandardCharsets.UTF_8));
+        out.flush();
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty())
+                continue;
+            String[] files = line.split("\t", -1);
+            try {
+                boolean summary = files.length == 4 && files[3].equals("summary");
+                if (files.length != 2 && files.length != 3 && !summary)
+                    throw new IllegalArgumentException("expected <original>\\t<modified>[\\t<original tree>[\\tsummary]], got: " + line);
+                long userStart = cpuTime(threads, true), cpuStart = cpuTime(threads, false);
+                long start = System.nanoTime();
+                Diff diff = compute(files);
+                StringWriter xml = new StringWriter();
+                if (summary)
+                    writeSummary(diff.editScript, xml);
+                else
+                    ActionsIoUtils.toXml(diff.src, diff.editScript, diff.mappings).writeTo(xml);
+                long elapsed = System.nanoTime() - start;
+                long user = userStart < 0 ? -1 : cpuTime(threads, true) - userStart;
+                long cpu = cpuStart < 0 ? -1 : cpuTime(threads, false) - cpuStart;
+
+                byte[] body = xml.toString().getBytes(StandardCharsets.UTF_8);
+                String header = "OK " + body.length + " " + elapsed + " " + (parsed - start) + " " + (matched - parsed)
+                        + " " + (scripted - matched) + " " + user + " " + cpu + "\n";
+                out.write(header.getBytes(StandardCharsets.UTF_8));
+                out.write(body);
+            } catch (Throwable e) {
+                String msg = (e.getClass().getSimpleName() + ": " + e.getMessage()).replaceAll("\\s+", " ");
+                out.write(("ERR " + msg + "\n").getBytes(StandardCharsets.UTF_8));
+            }
+            out.flush();
+        }
+    }
+}
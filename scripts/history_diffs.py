@@ -0,0 +1,214 @@
+# Diffs the Solidity files changed by each commit of a git repository against their version in the
+# parent commit, reading both versions straight from the object store with gitpython instead of
+# checking out every revision.
+#
+# Commits are listed with `git rev-list` and handled in batches of --batch-commits. The commits of a
+# batch are compared with their parents in a pool of --walkers processes (each with its own Repo), which
+# also write the changed blobs to a scratch directory on tmpfs as <blob sha>.sol. The pairs of blobs
+# are then diffed with the scheduler and diff functions of the drivers (see diff_driver.py), each distinct
+# (old blob, new blob) pair once per batch. Results are cached by that pair of blob SHAs (see
+# result_cache.py), so a pair that recurs on another branch, after a rebase or in a later run is not
+# diffed again.
+#
+# Added and deleted files have nothing to be diffed against and are skipped, as are merge commits
+# unless --merges is given (they are then compared with their first parent). Renamed files are diffed
+# against their old path's version.
+#
+# One JSON object per changed file is written to stdout (or --output), commit by commit:
+#
+#   {"commit": "<sha>", "parent": "<sha>", "path": "contracts/Token.sol", "old_path": "contracts/Token.sol",
+#    "old_blob": "<sha>", "new_blob": "<sha>", "tool": "GT", "edits": 4, "time": 0.012, "edit_script": ..., "metrics": {...}}
+#
+# with "edits": -1 and an "error" record (see process_runner.py) for a pair that could not be diffed.
+# With --output-level full or summary, "edit_script" is the compressed script or the number of edits
+# of each type (see output_level.py).
+#
+# Usage:
+#   python3 history_diffs.py /path/to/repo > history.ndjson
+#   python3 history_diffs.py /path/to/repo main~500..main --paths contracts/ --tool difft --output history.ndjson
+#   docker run --rm -v /path/to/repo:/repo solidiffy-replication history /repo > history.ndjson
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import contextlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import git
+
+import diff_driver
+from scheduler import DiffPair, run_pairs
+from process_runner import is_error
+
+#A changed Solidity file of a commit
+Change = namedtuple("Change", ["commit", "parent", "path", "old_path", "old_blob", "new_blob", "size"])
+
+#Repository of the walker process, opened by open_repo
+repo = None
+#Directory the blobs are written to, set by open_repo
+blobs_dir = None
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Diff the Solidity files changed by each commit of a git repository against their previous version.",
+                                     epilog="Example: python3 %s /path/to/repo main --paths contracts/" % os.path.basename(__file__),
+                                     parents=[diff_driver.diff_parser(), diff_driver.cache_parser()])
+    parser.add_argument("repo", help="path to the git repository")
+    parser.add_argument("revs", nargs="*", default=["HEAD"], help="revisions or ranges to walk, as for git rev-list (default: HEAD)")
+    parser.add_argument("--all", action="store_true", help="walk the commits of all branches and tags")
+    parser.add_argument("--paths", nargs="+", default=[], help="only diff files under these paths")
+    parser.add_argument("--max-count", type=int, default=None, help="walk at most this many commits")
+    parser.add_argument("--merges", action="store_true", help="also diff merge commits, against their first parent")
+    parser.add_argument("--tool", choices=["GT", "difft"], default="GT", help="diffing tool (default: GT)")
+    parser.add_argument("--output", default="-", help="file the results are written to (default: stdout)")
+    parser.add_argument("--walkers", type=int, default=os.cpu_count(),
+                        help="number of processes comparing commits with their parents (default: number of CPUs)")
+    parser.add_argument("--batch-commits", type=int, default=100, help="number of commits diffed at a time (default: 100)")
+    parser.add_argument("--scratch", default="/dev/shm" if os.path.isdir("/dev/shm") else None,
+                        help="directory the blobs are written to while they are diffed (default: /dev/shm)")
+    return diff_driver.parse_args(parser)
+
+
+def open_repo(path, directory):
+    global repo, blobs_dir
+    repo = git.Repo(path)
+    blobs_dir = directory
+
+
+def blob_path(sha):
+    return os.path.join(blobs_dir, sha + ".sol")
+
+
+#Writes a blob to the scratch directory unless it is there already, returns its size
+def write_blob(blob):
+    path = blob_path(blob.hexsha)
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    data = blob.data_stream.read()
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+#The changed Solidity files of a commit compared with its first parent, with both blobs written to the
+#scratch directory. Runs in the walker processes.
+def commit_changes(sha, paths):
+    commit = repo.commit(sha)
+    if not commit.parents:
+        return []
+    parent = commit.parents[0]
+    changes = []
+    for d in parent.diff(commit, paths=paths or None):
+        if d.a_blob is None or d.b_blob is None or not d.b_path.endswith(".sol"):
+            continue    #added or deleted file, or not Solidity
+        if d.a_blob.hexsha == d.b_blob.hexsha:
+            continue    #renamed without changes
+        size = write_blob(d.a_blob) + write_blob(d.b_blob)
+        changes.append(Change(commit.hexsha, parent.hexsha, d.b_path, d.a_path, d.a_blob.hexsha, d.b_blob.hexsha, size))
+    return changes
+
+
+#Yields the SHAs of the commits to walk, newest first, in lists of batch_size
+def iter_commit_batches(path, revs, batch_size, all_refs=False, merges=False, max_count=None, paths=()):
+    kwargs = {"all": True} if all_refs else {}
+    if not merges:
+        kwargs["no_merges"] = True
+    if max_count is not None:
+        kwargs["max_count"] = max_count
+    batch = []
+    for commit in git.Repo(path).iter_commits(revs if not all_refs else None, paths=list(paths), **kwargs):
+        batch.append(commit.hexsha)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+#Output record of a changed file from its diff result in the format of perform_diffs_jsonl.py
+def change_record(change, diff_tool, diff):
+    fields = change._asdict()
+    del fields["size"]
+    return diff_driver.result_record(fields, diff_tool, diff)
+
+
+#Diffs the changes of one batch of commits and writes their records in commit order. Every distinct pair of
+#blobs is diffed once. Returns (number of changes, number of distinct pairs, number of failed changes).
+def diff_changes(changes, diff_tool, out, tool_workers, parse_workers, cache=None, output_level="raw"):
+    pairs = {}
+    for change in changes:
+        key = (change.old_blob, change.new_blob)
+        if key not in pairs:
+            pairs[key] = DiffPair(change.path, 0, "", blob_path(change.old_blob), blob_path(change.new_blob), change.size)
+            if cache is not None:
+                # The blob SHAs are content hashes already, the files need not be hashed again
+                cache.set_hash(pairs[key].original, "git:" + change.old_blob)
+                cache.set_hash(pairs[key].mutant, "git:" + change.new_blob)
+
+    results = {}
+    def on_result(pair, diff):
+        results[(os.path.basename(pair.original)[:-4], os.path.basename(pair.mutant)[:-4])] = diff
+
+    run_fn, parse_fn = diff_driver.diff_tools(output_level)[diff_tool]
+    run_pairs(list(pairs.values()), run_fn, parse_fn, on_result, tool_workers, parse_workers, cache)
+
+    failed = 0
+    for change in changes:
+        diff = results[(change.old_blob, change.new_blob)]
+        failed += is_error(diff)
+        out.write(json.dumps(change_record(change, diff_tool, diff)) + "\n")
+    out.flush()
+    return len(changes), len(pairs), failed
+
+
+def diff_history(args, out, cache=None):
+    scratch_dir = tempfile.mkdtemp(prefix="solidiffy-history-", dir=args.scratch)
+    n_commits = n_changes = n_pairs = n_failed = 0
+    try:
+        # The main process writes no blobs, it only needs to know where they are
+        open_repo(args.repo, scratch_dir)
+        with ProcessPoolExecutor(max_workers=max(1, args.walkers), initializer=open_repo, initargs=(args.repo, scratch_dir)) as walkers:
+            for batch in iter_commit_batches(args.repo, args.revs, args.batch_commits, args.all, args.merges, args.max_count, args.paths):
+                changes = [change for commit_changes_ in walkers.map(commit_changes, batch, [args.paths] * len(batch))
+                           for change in commit_changes_]
+                counts = diff_changes(changes, args.tool, out, args.jobs, args.parse_workers, cache, args.output_level)
+                n_commits += len(batch)
+                n_changes, n_pairs, n_failed = n_changes + counts[0], n_pairs + counts[1], n_failed + counts[2]
+                # The scratch directory only holds the blobs of one batch, however long the history
+                # nor does the result cache keep their hashes
+                for blob in {sha for change in changes for sha in (change.old_blob, change.new_blob)}:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(blob_path(blob))
+                    if cache is not None:
+                        cache.forget_hash(blob_path(blob))
+                print(f"Commits walked: {n_commits}, changed files: {n_changes}")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    print(f"Diffed {n_changes} changed files ({n_pairs} distinct blob pairs) in {n_commits} commits, {n_failed} failed")
+    return n_failed
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    # The diff functions (see diff_driver.py) keep the edit script of both tools, as for perform_diffs_jsonl.py;
+    # they are used with their limits, pool and tree cache set up here
+    diff_driver.setup(args, args.tool, args.tree_cache, file=sys.stderr)
+    result_cache = diff_driver.open_result_cache(args, args.tool, "perform_diffs_jsonl.py")
+
+    try:
+        # Only the results go to stdout, progress messages go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            failed = diff_history(args, out, result_cache)
+    finally:
+        diff_driver.close(result_cache)
+        if out is not sys.stdout:
+            out.close()
+    sys.exit(1 if failed else 0)
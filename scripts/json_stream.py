@@ -0,0 +1,83 @@
+# Incremental reading of large JSON objects such as SuMo's mutations.json ({contract: [mutations]}).
+# iter_object_items() yields the top-level (key, value) pairs one at a time, so only a single value
+# is held in memory instead of the whole document. Only the standard library json decoder is used:
+# each value is decoded with raw_decode once enough of the file has been read to hold it.
+
+import json
+
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    #Reads more of the file, at least as much as is buffered so re-decoding a large value stays linear overall
+    def fill(self):
+        if self.eof:
+            return False
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    #Skips whitespace and returns the next character without consuming it ("" at the end of the file)
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        c = self.peek()
+        if c == "" or c not in chars:
+            raise json.JSONDecodeError("Expecting one of " + repr(chars), self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value continues past the buffer; at the end of the file it is a real error
+                if not self.fill():
+                    raise
+                continue
+            # A number could continue in the next chunk
+            if end == len(self.buf) and not isinstance(value, (dict, list, str)) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+#Yields the (key, value) pairs of the JSON object in the text file f
+def iter_object_items(f, chunk_size=CHUNK_SIZE):
+    reader = _Reader(f, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting property name", reader.buf, reader.pos)
+        reader.expect(":")
+        yield key, reader.value()
+        if reader.expect(",}") == "}":
+            return
@@ -0,0 +1,153 @@
+# Composes SuMo mutations of a contract into mutants with 1, 2, ... n applied mutations.
+#
+# Mutations are tried in order of their start position and applied when their span is still
+# untouched by earlier mutations. The original implementation (compose_legacy) rebuilt the whole
+# contract string and a per-character bitmap for every applied mutation, i.e. O(n) work per
+# mutation. compose() makes the same decisions with a sorted set of occupied intervals and
+# records the applied mutations as (start, end, replacement) edits on the original contract, so
+# every mutant is the original with its first k edits spliced in (a piece table).
+#
+# The bitmap of the original implementation is kept exactly, including its quirks: it is never
+# shifted by earlier length changes, and spans reaching past its end are only checked up to it.
+# Adjacent mutations are composed, their intervals merged. When a mutation really overlaps an
+# earlier one (e.g. an insertion inside its replacement), so the intervals cannot express the
+# result, compose() stops there and mutant_texts() carries on from that mutation with the original
+# implementation, so the generated files are byte-identical either way.
+
+from bisect import bisect_left
+from collections import namedtuple
+
+#Where compose() stopped: the index of the first mutation it could not express, and the offset, previous start and
+#bitmap of the original implementation at that point, from which compose_legacy() carries on
+Resume = namedtuple("Resume", ["index", "offset", "prev_start", "used_characters"])
+
+
+def log_mutation(mutation, mut_start, mut_end):
+    new_content, old_content = str(mutation["replace"]), str(mutation["original"])
+    print("------------------------------------------")
+    print("Mutating line " + str(mutation["startLine"]) + " characters " + str(mut_start) + "-" + str(mut_end))
+    print(old_content + " --> " + new_content)
+    print("Offset for replacement: " + str(len(new_content) - len(old_content)))
+
+
+#Returns the applied mutations as (start, end, replacement) edits on the original contract, sorted and
+#non-overlapping, and None, or a Resume of the first mutation that cannot be expressed that way (the edits are then
+#those of the mutations before it). The applied mutations and their spans in the mutated contract are added to
+#applied, if given.
+def compose(contract, mutations, n_mutants, applied=None):
+    edits = []
+    offset = 0                  #The offset in character indices caused by mutations, as the legacy code computes it
+    shift = 0                   #The actual difference between mutated and original character indices
+    text_end = 0                #End of the last replacement in the mutated contract
+    used_length = len(contract) #Length of the legacy bitmap
+    starts, ends = [], []       #Sorted, disjoint intervals of the legacy bitmap that are marked as used
+    prev_start = 0
+
+    def resume(index):
+        used_characters = [True] * used_length
+        for start, end in zip(starts, ends):
+            used_characters[start:end] = [False] * (end - start)
+        return edits, Resume(index, offset, prev_start, used_characters)
+
+    for index, mutation in enumerate(mutations):
+        if len(edits) >= n_mutants:
+            break
+
+        mut_start, mut_end = mutation["start"] + offset, mutation["end"] + offset
+        new_content, old_content = str(mutation["replace"]), str(mutation["original"])
+        if not prev_start < mut_start:
+            continue
+        if mut_end < 0:
+            return resume(index)    #a negative slice end would count from the end of the bitmap
+
+        # all(used_characters[mut_start:mut_end]): is any used interval inside the part of the span the bitmap covers?
+        check_end = min(mut_end, used_length)
+        if mut_start < check_end:
+            i = bisect_left(starts, check_end)
+            if i > 0 and ends[i - 1] > mut_start:
+                continue
+
+        offs = len(new_content) - len(old_content)
+        n_used = mut_end - mut_start + offs
+        if n_used < 0 or mut_start < text_end or mut_start < 0:
+            return resume(index)
+
+        # used_characters[0:mut_start] + [False] * n_used + used_characters[mut_start + n_used:]
+        used_start = min(mut_start, used_length)
+        if n_used > 0:
+            if starts and ends[-1] > used_start:
+                return resume(index)
+            if starts and ends[-1] == used_start:
+                ends[-1] += n_used      #adjacent to the last interval
+            else:
+                starts.append(used_start)
+                ends.append(used_start + n_used)
+        used_length = max(used_length, used_start + n_used)
+
+        orig_start, orig_end = mut_start - shift, mut_end - shift
+        if orig_end > len(contract) or orig_start > orig_end:
+            return resume(index)
+        edits.append((orig_start, orig_end, new_content))
+        if applied is not None:
+            applied.append((mutation, mut_start, mut_end))
+        shift += len(new_content) - (mut_end - mut_start)
+        text_end = mut_start + len(new_content)
+        offset += offs
+        prev_start = mut_start
+    return edits, None
+
+
+#The original implementation: yields the contract after each applied mutation. With a Resume of compose(), it
+#carries on from there, contract being the contract with the edits of compose() applied.
+def compose_legacy(contract, mutations, n_mutants, logging=False, resume=None):
+    i = 0                                                   #The index of the next possible mutation
+    offset = 0                                              #The offset in character indices caused by mutations
+    used_characters = [True for i in range(len(contract))]  #Bitmap tracking already mutated characters
+    counter = 0                                             #The number of successful mutaions
+    prev_start = 0                                          #Keeps track of last mutation start index to avoid case where mutations become 'unsorted' after applying offset
+    if resume is not None:
+        i, offset, prev_start, used_characters = resume
+    while counter < n_mutants:
+        try:
+            mutation = mutations[i]
+        except IndexError:
+            break
+        i += 1
+
+        mut_start, mut_end = mutation["start"] + offset, mutation["end"] + offset
+        new_content, old_content = str(mutation["replace"]), str(mutation["original"])
+
+        if  all(used_characters[mut_start:mut_end]) and prev_start < mut_start:
+            if logging:
+                log_mutation(mutation, mut_start, mut_end)
+
+            contract = contract[0:mut_start] + new_content + contract[mut_end:]
+            offs = len(new_content) - len(old_content)
+            offset += offs
+            used_characters = used_characters[0:mut_start] + [False for j in range(mut_end - mut_start + offs)] + used_characters[mut_end+offs:]
+            counter += 1
+            prev_start = mut_start
+            yield contract
+
+
+#Yields the contract after each of up to n_mutants applied mutations (mutations must be sorted by start)
+def mutant_texts(contract, mutations, n_mutants, logging=False):
+    applied = []
+    edits, resume = compose(contract, mutations, n_mutants, applied)
+
+    # Every mutant shares the prefix up to its last edit with the next one, so only the tail is rebuilt
+    prefix = []
+    prev_end = 0
+    mutant = contract
+    for (start, end, replacement), (mutation, mut_start, mut_end) in zip(edits, applied):
+        if logging:
+            log_mutation(mutation, mut_start, mut_end)
+        prefix.append(contract[prev_end:start])
+        prefix.append(replacement)
+        prev_end = end
+        mutant = "".join(prefix) + contract[prev_end:]
+        yield mutant
+
+    # From the first mutation overlapping an earlier one on, the original implementation applies them
+    if resume is not None:
+        yield from compose_legacy(mutant, mutations, n_mutants - len(edits), logging, resume)
@@ -0,0 +1,192 @@
+# Packed mutant corpus: a single zip file holding every original contract once and each mutant as
+# the list of (start, end, replacement) edits that turn the original into it, instead of one file
+# per (contract, level, operator).
+#
+#   index.json                  {"n_mutants": n, "contracts": {name: {"file": file, "operators": {op: levels}}}}
+#   originals/<name>/<file>     source of the original contract
+#   edits/<name>/<op>.json      [[edits of level 1], [edits of level 2], ...], edits on the original, sorted
+#
+# Members are deflated and can be read individually, so any mutant is rebuilt on demand without
+# unpacking the corpus.
+#
+# Usage:
+#   python3 mutant_corpus.py pack ../contracts/mutants/ ../contracts/mutants.zip
+#   python3 mutant_corpus.py export ../contracts/mutants.zip ../contracts/mutants/
+#   python3 mutant_corpus.py show ../contracts/mutants.zip <contract> <level> <operator>
+#
+#   corpus = Corpus("../contracts/mutants.zip")
+#   for contract, level, op in corpus.pairs():
+#       corpus.mutant(contract, level, op)
+
+import os
+import sys
+import json
+import zipfile
+import argparse
+from pathlib import Path
+
+from mutant_compose import compose, compose_legacy
+from corpus_index import index_pairs
+
+
+#Applies sorted, non-overlapping edits to the original contract
+def apply_edits(contract, edits):
+    pieces = []
+    prev_end = 0
+    for start, end, replacement in edits:
+        pieces.append(contract[prev_end:start])
+        pieces.append(replacement)
+        prev_end = end
+    pieces.append(contract[prev_end:])
+    return "".join(pieces)
+
+
+#A single edit turning original into mutant: everything between their common prefix and suffix
+def edit_between(original, mutant):
+    prefix = 0
+    limit = min(len(original), len(mutant))
+    while prefix < limit and original[prefix] == mutant[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and original[-1 - suffix] == mutant[-1 - suffix]:
+        suffix += 1
+    return [(prefix, len(original) - suffix, mutant[prefix:len(mutant) - suffix])]
+
+
+#Edits of the mutants combining 1, 2, ... n_mutants of the (sorted) mutations, as a list per level
+def level_edits(contract, mutations, n_mutants):
+    edits, resume = compose(contract, mutations, n_mutants)
+    levels = [edits[:k] for k in range(1, len(edits) + 1)]
+    if resume is not None:
+        # Mutations the composition cannot express as edits on the original: diff those mutants instead
+        mutants = compose_legacy(apply_edits(contract, edits), mutations, n_mutants - len(edits), resume=resume)
+        levels += [edit_between(contract, mutant) for mutant in mutants]
+    return levels
+
+
+class CorpusWriter:
+    def __init__(self, path, n_mutants=None):
+        Path(path).parent.mkdir(exist_ok=True, parents=True)
+        self.zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        self.index = {"n_mutants": n_mutants, "contracts": {}}
+
+    #Adds a contract with its edits per operator ({op: [edits of level 1, ...]})
+    def add(self, name, file_name, original, edits):
+        if name in self.index["contracts"]:
+            raise ValueError("contract " + name + " is already in the corpus")
+        self.zip.writestr("originals/" + name + "/" + file_name, original)
+        for op in edits:
+            if edits[op]:
+                self.zip.writestr("edits/" + name + "/" + op + ".json", json.dumps(edits[op]))
+        self.index["contracts"][name] = {"file": file_name, "operators": {op: len(edits[op]) for op in edits if edits[op]}}
+
+    def close(self):
+        # Contracts are added as they finish, the index lists them in a fixed order
+        self.index["contracts"] = dict(sorted(self.index["contracts"].items()))
+        self.zip.writestr("index.json", json.dumps(self.index, indent=1))
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Corpus:
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+        self.index = json.loads(self.zip.read("index.json"))
+        self.contracts = self.index["contracts"]
+        self.cached = (None, None, None)    #(name, original, {op: edits}) of the last contract read
+
+    def load(self, name):
+        if self.cached[0] != name:
+            entry = self.contracts[name]
+            original = self.zip.read("originals/" + name + "/" + entry["file"]).decode()
+            self.cached = (name, original, {})
+        return self.cached
+
+    def original(self, name):
+        return self.load(name)[1]
+
+    def edits(self, name, level, op):
+        levels = self.contracts[name]["operators"].get(op, 0)
+        if not 1 <= level <= levels:
+            raise KeyError((name, level, op))
+        _, _, ops = self.load(name)
+        if op not in ops:
+            ops[op] = json.loads(self.zip.read("edits/" + name + "/" + op + ".json"))
+        return ops[op][level - 1]
+
+    def mutant(self, name, level, op):
+        return apply_edits(self.original(name), self.edits(name, level, op))
+
+    #All (contract, level, operator) mutants in the corpus
+    def pairs(self):
+        for name in self.contracts:
+            for op, levels in self.contracts[name]["operators"].items():
+                for level in range(1, levels + 1):
+                    yield name, level, op
+
+    #Writes the corpus in the <contract>/original/<file> and <contract>/<level>/<operator>/<file> layout
+    def export(self, output_path):
+        for name, entry in self.contracts.items():
+            output = Path(output_path, name, "original", entry["file"])
+            output.parent.mkdir(exist_ok=True, parents=True)
+            output.write_text(self.original(name))
+            for op, levels in entry["operators"].items():
+                for level in range(1, levels + 1):
+                    output = Path(output_path, name, str(level), op, entry["file"])
+                    output.parent.mkdir(exist_ok=True, parents=True)
+                    output.write_text(self.mutant(name, level, op))
+
+    def close(self):
+        self.zip.close()
+
+
+#Packs an existing mutants directory, each mutant stored as the edit between its original and itself
+def pack_directory(contracts_path, path):
+    pairs = index_pairs(contracts_path)
+    with CorpusWriter(path) as writer:
+        i = 0
+        while i < len(pairs):
+            name, original_path = pairs[i].contract, pairs[i].original
+            original = Path(original_path).read_text()
+            edits = {}
+            # Pairs are sorted by (contract, level, operator), so the levels of each operator are appended in order
+            while i < len(pairs) and pairs[i].contract == name:
+                edits.setdefault(pairs[i].operator, []).append(edit_between(original, Path(pairs[i].mutant).read_text()))
+                i += 1
+            writer.add(name, os.path.basename(original_path), original, edits)
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Pack, export and inspect packed mutant corpora.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="pack a mutants directory")
+    pack.add_argument("contracts_path")
+    pack.add_argument("corpus")
+    export = commands.add_parser("export", help="write a corpus in the mutants directory layout")
+    export.add_argument("corpus")
+    export.add_argument("output_path")
+    show = commands.add_parser("show", help="print one mutant")
+    show.add_argument("corpus")
+    show.add_argument("contract")
+    show.add_argument("level", type=int)
+    show.add_argument("operator")
+    return parser.parse_args()
+
+
+if __name__ ==  '__main__':
+    args = parse_input()
+    if args.command == "pack":
+        pack_directory(args.contracts_path, args.corpus)
+    elif args.command == "export":
+        corpus = Corpus(args.corpus)
+        corpus.export(args.output_path)
+        corpus.close()
+    else:
+        corpus = Corpus(args.corpus)
+        sys.stdout.write(corpus.mutant(args.contract, args.level, args.operator))
+        corpus.close()
@@ -0,0 +1,47 @@
+# Output levels of the drivers: how much of the edit script of each pair a diff result keeps. The
+# edit count, running time and metrics are kept at every level; the level decides what goes where
+# the edit script was (the "edit_script"/"diff_chunks" field, or the third item of a list result):
+#
+#   raw      the edit script as the tool prints it: Gumtree's <actions> XML, difftastic's chunks
+#   full     the same edit script, compressed: "zlib:" followed by the base64 of the zlib-compressed
+#            JSON of the raw script (see compress_script and decompress_script)
+#   summary  no edit script, only the number of edits of each type: {"update-node": 2, "insert-tree": 1}
+#            for Gumtree, {"delete": 1, "insert": 1, "update": 3} for difftastic (see difft_count.py)
+#
+# At the summary level, Gumtree workers only send the types of the actions instead of the whole
+# textdiff XML (see gumtree_server/GumtreeServer.java), so neither the JVM, the pipe nor the results
+# carry the matches and node labels. raw is the default and gives the results of earlier versions.
+
+import json
+import zlib
+import base64
+
+OUTPUT_LEVELS = ["raw", "full", "summary"]
+COMPRESSED_PREFIX = "zlib:"
+
+
+def compress_script(script):
+    data = zlib.compress(json.dumps(script, separators=(",", ":")).encode(), 9)
+    return COMPRESSED_PREFIX + base64.b64encode(data).decode()
+
+
+#The raw edit script of a script of any level: compressed scripts are decompressed, others returned as they are
+def decompress_script(script):
+    if isinstance(script, str) and script.startswith(COMPRESSED_PREFIX):
+        return json.loads(zlib.decompress(base64.b64decode(script[len(COMPRESSED_PREFIX):])))
+    return script
+
+
+#What a result keeps of a raw edit script at the given level, counts being the edits of each type
+def script_for_level(level, script, counts):
+    if level == "summary":
+        return dict(sorted(counts.items()))
+    if level == "full":
+        return compress_script(script) if script is not None else None
+    return script
+
+
+#Options of the result cache (see result_cache.py) of a driver, so results of one level are not
+#returned for another. Results cached before every level had the same layout are not reused.
+def cache_options(driver, level):
+    return driver + " " + level
@@ -1,100 +1,21 @@
-import sys
 import os
-import xml.etree.ElementTree as ET
-import subprocess
 import json
 import time
-import concurrent.futures as cc
-
-def parse_input():
-    if len(sys.argv) != 3:
-        raise Exception("Please provide arguments in the form: [PATH TO MUTANTS], [DIFFING TOOL] (GT/difft)! \n Example: python3 perform_diffs.py ../mutants/ GT")
-    
-    contracts_path = sys.argv[1]
-    diff_tool = sys.argv[2]
-
-    if diff_tool != "difft" and diff_tool != "GT":
-        raise Exception("Error: invalid diff tool provided!")
-
-    return contracts_path, diff_tool
-
-# Uses gumtree to get the diff between two files
-def get_GT_diff_data(filepath1, filepath2):
-    save_full_diff = True
-
-    start = time.time()
-    diff = subprocess.check_output('gumtree textdiff -f XML ' +  filepath1 + " " + filepath2, shell=True).decode()
-    granular_running_time = time.time() - start
-    if not diff:
-        print("mutant causing error:" + filepath2)
-        return -1
-    
-    # Wrap result to get single XML root and convert to tree
-    diff = diff.split('\n', 1)
-    diff = diff[0] + "<X>" + diff[1] + "</X>"
-    tree = ET.fromstring(diff)
-
-    # Get number of edit actions and matches from tree
-    n_edits = len(tree.findall('actions')[0])
-    print(f'Number of edits: {n_edits}')
-    
-    # Append full diff to res if flag is set and return res
-    res = {
-        "number_of_edits": n_edits,
-        "timing": granular_running_time,
-        "edit_script": ET.tostring(tree.findall('actions')[0], encoding='unicode') if save_full_diff else None
-    }
-    
-    return res
-
-# Uses difftastic to get the diff between two files
-def get_diffts_data(filepath1, filepath2):
-    os.environ['DFT_UNSTABLE'] = 'yes'
-    start = time.time()
-    diff = subprocess.check_output('difft --display json ' +  filepath1 + " " + filepath2, shell=True).decode()
-    granular_running_time = time.time() - start
-    if not diff:
-        return -1 
-    
-    diff = json.loads(diff)
-    if diff["status"] == "unchanged":
-        return 0
-    
-    count = 0
-    for li in diff["chunks"]:
-        for line in li:
-            used_changes = {}
-            if "lhs" in line.keys():
-                for ch in line["lhs"]["changes"]:
-                    counted = False
-                    for i in range(ch["start"], ch["end"]):
-                        if str(i) in used_changes.keys():
-                            counted = True
-
-                    if not counted:
-                        for i in range(ch["start"], ch["end"]):
-                            used_changes[str(i)] = 1
-                        count += 1
-            
-            if "rhs" in line.keys():
-                for ch in line["rhs"]["changes"]:
-                    counted = False
-                    for i in range(ch["start"], ch["end"]):
-                        if str(i) in used_changes.keys():
-                            counted = True
-
-                    if not counted:
-                        for i in range(ch["start"], ch["end"]):
-                            used_changes[str(i)] = 1
-                        count += 1
-
-    res = {
-        "number_of_changes": count,
-        "timing": granular_running_time,
-        "diff_chunks": diff["chunks"]
-    }
-    
-    return res
+from scheduler import run_pairs
+from corpus_index import index_pairs
+import profiling
+from profiling import stage
+import diff_driver
+
+# The result of a pair in the format of this driver: a dict of named fields instead of the list of
+# diff_driver.py. Unchanged pairs (0) and the error records of failed pairs are kept as they are.
+def as_record(diff, diff_tool):
+    if not isinstance(diff, list):
+        return diff
+    count, timing, script, metrics = diff
+    if diff_tool == "GT":
+        return {"number_of_edits": count, "timing": timing, "edit_script": script, "metrics": metrics}
+    return {"number_of_changes": count, "timing": timing, "diff_chunks": script, "metrics": metrics}
 
 # Save each contract's diff result in a structured directory under the results folder
 def save_diff_to_file(diff_data, contract_path, diff_tool):
@@ -105,58 +26,43 @@ def save_diff_to_file(diff_data, contract_path, diff_tool):
     # Define the output file name and save the diff result as JSON
     output_file = os.path.join(results_path, f"diff_result_{diff_tool}.json")
     # print(f"Saving diff result to: {output_file}")
+    # Compact JSON, indenting the edit scripts only made the files larger
     with open(output_file, "w") as f:
-        json.dump(diff_data, f, indent=4)
-
-# Modified get_contract_diffs function
-def get_contract_diffs(contract_path, contract, diff_tool):
-    con_name = os.listdir(contract_path + "/original")[0]
-    unmutated_path = os.path.join(contract_path, "original", con_name)
-    num_contracts = len(os.listdir(contract_path))
-    
-    for i in range(1, num_contracts):
-        operators = os.listdir(os.path.join(contract_path, str(i)))
-        for op in operators:
-            mutated_path = os.path.join(contract_path, str(i), op, con_name)
-            if diff_tool == "GT":
-                diff = get_GT_diff_data(unmutated_path, mutated_path)
-                print(f"Contract: {contract}, Operator: {op}, Diff: {diff}")
-                if diff == -1:
-                    continue
-            elif diff_tool == "difft":
-                diff = get_diffts_data(unmutated_path, mutated_path)
-                if diff == -1:
-                    continue
-            else:
-                raise Exception("Error: invalid diff tool!")
-            
-            # Save each diff result in its corresponding subfolder under results
-            save_diff_to_file(diff, os.path.join(contract_path, str(i), op), diff_tool)
-
-# Corrected calculate_diffs function
-def calculate_diffs(contracts_path, diff_tool):
-    contracts = os.listdir(contracts_path)
-    executor = cc.ThreadPoolExecutor(max_workers=os.cpu_count())
-    futures = []
-
-    # Schedule the execution of get_contract_diffs
-    for contract in contracts:
-        futures.append(executor.submit(get_contract_diffs, os.path.join(contracts_path, contract), contract, diff_tool))
-
-    # Ensure proper completion of all futures
-    completed_count = 0
-    for future in cc.as_completed(futures):
-        completed_count += 1
-        print(f'Contracts done: {completed_count}/{len(contracts)}', end='\r')
-
-    executor.shutdown(wait=True)
+        json.dump(diff_data, f)
+
+# Diffs every (contract, level, operator) pair as its own job and saves each result as soon as it is done
+def calculate_diffs(contracts_path, diff_tool, tool_workers, parse_workers, cache=None, store=None, index_cache=None, scripts=None, output_level="raw"):
+    def on_result(pair, diff):
+        diff = as_record(diff, diff_tool)
+        if scripts is not None:
+            with stage("script-store"):
+                diff = scripts.put_result(pair.contract, pair.level, pair.operator, diff_tool, diff)
+        if store is not None:
+            with stage("store-append"):
+                store.append_result(pair.contract, pair.level, pair.operator, diff_tool, diff, output_level)
+        # Save each diff result, or the error record of a failed pair, in its corresponding subfolder under results
+        with stage("save-results"):
+            save_diff_to_file(diff, os.path.dirname(pair.mutant), diff_tool)
+
+    with stage("index"):
+        pairs = index_pairs(contracts_path, index_cache)
+    run_fn, parse_fn = diff_driver.diff_tools(output_level)[diff_tool]
+    run_pairs(pairs, run_fn, parse_fn, on_result, tool_workers, parse_workers, cache)
     print('All contracts processed.')
 
 if __name__ == '__main__':
     start_time = time.time()
 
-    contracts_path, diff_tool = parse_input()
-    calculate_diffs(contracts_path, diff_tool)
+    args = diff_driver.parse_input(os.path.basename(__file__))
+    if args.profile:
+        profiling.enable(args.profile, args.profiler)
+    diff_driver.setup(args, args.diff_tool, args.tree_cache)
+    result_cache, store, scripts = diff_driver.open_stores(args, os.path.basename(__file__))
+    calculate_diffs(args.contracts_path, args.diff_tool, args.jobs, args.parse_workers, result_cache, store, args.corpus_index, scripts, args.output_level)
+    diff_driver.close(result_cache, store, scripts)
+    if args.profile:
+        print(profiling.finish())
+        print("Profile written to " + args.profile)
     
     total_running_time_seconds = time.time() - start_time
     print(f"Generated diffs in {total_running_time_seconds} s")
@@ -175,7 +81,7 @@ if __name__ == '__main__':
             print("Error reading the JSON file, initializing with an empty dictionary.")
 
     # Update the running time for the current diff tool
-    running_time[diff_tool] = total_running_time_seconds
+    running_time[args.diff_tool] = total_running_time_seconds
 
     # Save the updated running time data back to the file
     with open(json_file_path, "w") as f:
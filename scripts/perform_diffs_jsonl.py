@@ -10,180 +10,125 @@
 # Contractn | ...
 # ------------------------------------------
 
-import sys
 import os
-import xml.etree.ElementTree as ET
-import subprocess
-import pickle
 import json
 import time
-import concurrent.futures as cc
-import pprint
-
-def parse_input():
-    if len(sys.argv) != 3:
-        raise Exception("Please provide arguments in the form: [PATH TO MUTANTS], [DIFFING TOOL] (GT/difft)! \n Example: python3 perform_diffs.py ../mutants/ GT")
-    
-    contracts_path = sys.argv[1]
-    diff_tool = sys.argv[2]
-
-    if diff_tool != "difft" and diff_tool != "GT":
-        raise Exception("Error: invalid diff tool provided!")
-
-    return contracts_path, diff_tool
-
-#Uses gumtree to get the diff between two files
-def get_GT_diff_data(filepath1, filepath2):
-    save_full_diff = True
-
-    start = time.time()
-    diff = subprocess.check_output('gumtree textdiff -f XML ' +  filepath1 + " " + filepath2, shell=True).decode()
-    granular_running_time = time.time() - start
-    if not diff:
-        print("mutant causing error:" + filepath2)
-        return -1
-    
-    # Wrap result to get single XML root and convert to tree
-    diff = diff.split('\n', 1)
-    diff = diff[0] + "<X>" + diff[1] + "</X>"
-    tree = ET.fromstring(diff)
-
-    # Get number of edit actions and matches from tree
-    n_edits = len(tree.findall('actions')[0])
-    print(f'Number of edits: {n_edits}')
-    
-    # Append full diff to res if flag is set and return res
-    res = [n_edits, granular_running_time]
-    if save_full_diff:
-        # Convert the 'actions' element to a string and append
-        actions = tree.findall('actions')[0]
-        actions_str = ET.tostring(actions, encoding='unicode')
-        res.append(actions_str)
-    
-    return res
-
-
-#Uses difftastic to get the diff between two files
-def get_diffts_data(filepath1, filepath2):
-    os.environ['DFT_UNSTABLE'] = 'yes'
-    start = time.time()
-    diff = subprocess.check_output('difft --display json ' +  filepath1 + " " + filepath2, shell=True).decode()
-    granular_running_time = time.time() - start
-    if not diff:
-        return -1 
-    
-    diff = json.loads(diff)
-    if diff["status"] == "unchanged":
-        #print("WARNING: difft failed to detect change in contract " + filepath2 + "!!!")
-        return 0
-    
-    #Have to keep track of the left hand and right hand side changes, so that no changes are double counted. Can probably by done in a much better way. 
-    count = 0
-    for li in diff["chunks"]:
-        for line in li:
-            used_changes = {}
-             
-            if "lhs" in line.keys():
-                for ch in line["lhs"]["changes"]:
-                    counted = False
-                    for i in range(ch["start"], ch["end"]):
-                        if str(i) in used_changes.keys():
-                            counted = True
-
-                    if not counted:
-                        for i in range(ch["start"], ch["end"]):
-                            used_changes[str(i)] = 1
-                        count += 1
-            
-            if "rhs" in line.keys():
-                for ch in line["rhs"]["changes"]:
-                    counted = False
-                    for i in range(ch["start"], ch["end"]):
-                        if str(i) in used_changes.keys():
-                            counted = True
-
-                    if not counted:
-                        for i in range(ch["start"], ch["end"]):
-                            used_changes[str(i)] = 1
-                        count += 1
-    return [count, granular_running_time, diff["chunks"]]
-
-
-# Save results incrementally using JSON Lines format
-def save_res_to_file_incrementally(results, diff_tool):
+import hashlib
+from collections import Counter
+from scheduler import run_pairs
+from corpus_index import index_pairs
+import profiling
+from profiling import stage
+import diff_driver
+
+# Save results incrementally using JSON Lines format. Contracts whose line is already in the file
+# (saved holds the hash of each saved contract's line) are not appended again.
+def save_res_to_file_incrementally(results, diff_tool, saved):
     file_path = f"../results/results_{diff_tool}.jsonl"
+    replaced = 0
     with open(file_path, "a") as f:
         for result in results:
-            json.dump(result, f)
-            f.write('\n')  # Newline separates each JSON object
-
-
-# Modified get_contract_diffs function
-def get_contract_diffs(contract_path, contract, diff_tool):
-    res = []
-    con_name = os.listdir(contract_path + "/original")[0]
-    unmutated_path = contract_path + "/" + "original/" + con_name
-    num_contracts = len(os.listdir(contract_path))
-    
-    for i in range(1, num_contracts):
-        operators = os.listdir(contract_path + "/" + str(i))
-        diffs = {}
-        for op in operators:
-            mutated_path = contract_path + "/" + str(i) + "/" + op + "/" + con_name
-            if diff_tool == "GT":
-                diff = get_GT_diff_data(unmutated_path, mutated_path)
-                print(f"Contract: {contract}, Operator: {op}, Diff: {diff}")
-                if diff == -1:
-                    diff = []
-            elif diff_tool == "difft":
-                diff = get_diffts_data(unmutated_path, mutated_path)
-                if diff == -1:
-                    diff = []
-            else:
-                raise Exception("Error: invalid diff tool!")
-            diffs[op] = diff
-        res.append(diffs)
-    
-    # Save each contract's results incrementally
-    save_res_to_file_incrementally([{contract: res}], diff_tool)
-
-
-
-
-# Corrected calculate_diffs function
-def calculate_diffs(contracts_path, diff_tool):
-    contracts = os.listdir(contracts_path)
-    executor = cc.ThreadPoolExecutor(max_workers=os.cpu_count())
-    futures = []
-
-    # Schedule the execution of get_contract_diffs
-    for contract in contracts:
-        futures.append(executor.submit(get_contract_diffs, contracts_path + contract, contract, diff_tool))
-
-    # Ensure proper completion of all futures
-    completed_count = 0
-    for future in cc.as_completed(futures):
-        completed_count += 1
-        print(f'Contracts done: {completed_count}/{len(contracts)}', end='\r')
-
-    executor.shutdown(wait=True)
+            line = json.dumps(result)
+            digest = hashlib.sha256(line.encode()).hexdigest()
+            contract = next(iter(result))
+            if saved.get(contract) == digest:
+                continue
+            if contract in saved:
+                replaced += 1
+            saved[contract] = digest
+            f.write(line + '\n')  # Newline separates each JSON object
+    return replaced
+
+
+# Reads the contract name of a results line without parsing the whole line
+def contract_of_line(line):
+    return json.JSONDecoder().raw_decode(line.decode(), 1)[0]
+
+
+# Loads the hashes of the contracts saved by a previous, possibly interrupted, run. A partially
+# written last line is cut off so the file stays valid JSON Lines.
+def load_saved_contracts(diff_tool):
+    file_path = f"../results/results_{diff_tool}.jsonl"
+    saved = {}
+    if not os.path.exists(file_path):
+        return saved
+
+    offset = 0
+    with open(file_path, "rb+") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                f.truncate(offset)
+                break
+            saved[contract_of_line(line)] = hashlib.sha256(line[:-1]).hexdigest()
+            offset += len(line)
+    return saved
+
+
+# Drops all but the last line of contracts that were saved more than once (e.g. after new operators were added)
+def compact_results_file(diff_tool):
+    file_path = f"../results/results_{diff_tool}.jsonl"
+    last = {}
+    with open(file_path, "rb") as f:
+        for i, line in enumerate(f):
+            last[contract_of_line(line)] = i
+
+    keep = set(last.values())
+    with open(file_path, "rb") as f, open(file_path + ".tmp", "wb") as out:
+        for i, line in enumerate(f):
+            if i in keep:
+                out.write(line)
+    os.replace(file_path + ".tmp", file_path)
+
+
+# Diffs every (contract, level, operator) pair as its own job and saves each contract's results once all of its pairs are done
+def calculate_diffs(contracts_path, diff_tool, tool_workers, parse_workers, cache=None, store=None, index_cache=None, scripts=None, output_level="raw"):
+    with stage("index"):
+        pairs = index_pairs(contracts_path, index_cache)
+    remaining = Counter(pair.contract for pair in pairs)
+    res = {}
+    saved = load_saved_contracts(diff_tool)
+    replaced = 0
+
+    def on_result(pair, diff):
+        if scripts is not None:
+            with stage("script-store"):
+                diff = scripts.put_result(pair.contract, pair.level, pair.operator, diff_tool, diff)
+        if store is not None:
+            with stage("store-append"):
+                store.append_result(pair.contract, pair.level, pair.operator, diff_tool, diff, output_level)
+        levels = res.setdefault(pair.contract, [])
+        while len(levels) < pair.level:
+            levels.append({})
+        levels[pair.level - 1][pair.operator] = diff
+
+        remaining[pair.contract] -= 1
+        if remaining[pair.contract] == 0:
+            # Operators are sorted so a recomputed contract gives the same line as its saved one
+            levels = [{op: level[op] for op in sorted(level)} for level in res.pop(pair.contract)]
+            nonlocal replaced
+            with stage("save-results"):
+                replaced += save_res_to_file_incrementally([{pair.contract: levels}], diff_tool, saved)
+
+    run_fn, parse_fn = diff_driver.diff_tools(output_level)[diff_tool]
+    run_pairs(pairs, run_fn, parse_fn, on_result, tool_workers, parse_workers, cache)
+    if replaced > 0:
+        compact_results_file(diff_tool)
     print('All contracts processed.')
 
 
-#Saves results as a python object in a json file
-def save_res_to_file(results, diff_tool):
-    with open(f"../results/results_{diff_tool}.json", "w") as f:
-        json.dump(results, f)
-
-
-
-
-
 if __name__ == '__main__':
     start_time = time.time()
 
-    contracts_path, diff_tool = parse_input()
-    calculate_diffs(contracts_path, diff_tool)
+    args = diff_driver.parse_input(os.path.basename(__file__))
+    if args.profile:
+        profiling.enable(args.profile, args.profiler)
+    diff_driver.setup(args, args.diff_tool, args.tree_cache)
+    result_cache, store, scripts = diff_driver.open_stores(args, os.path.basename(__file__))
+    calculate_diffs(args.contracts_path, args.diff_tool, args.jobs, args.parse_workers, result_cache, store, args.corpus_index, scripts, args.output_level)
+    diff_driver.close(result_cache, store, scripts)
+    if args.profile:
+        print(profiling.finish())
+        print("Profile written to " + args.profile)
     
     total_running_time_seconds = time.time() - start_time
     print(f"Generated diffs in {total_running_time_seconds} s")
@@ -202,7 +147,7 @@ if __name__ == '__main__':
             print("Error reading the JSON file, initializing with an empty dictionary.")
 
     # Update the running time for the current diff tool
-    running_time[diff_tool] = total_running_time_seconds
+    running_time[args.diff_tool] = total_running_time_seconds
 
     # Save the updated running time data back to the file
     with open(json_file_path, "w") as f:
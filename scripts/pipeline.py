@@ -0,0 +1,156 @@
+# Generates mutants and diffs them in one pass, without writing the contracts/mutants tree.
+#
+# Mutations are read from SuMo's mutations.json one contract at a time (run the lookup first, or
+# pass --lookup). The composed mutants of a batch of contracts are written to a scratch directory
+# on tmpfs (/dev/shm when available), diffed with the same scheduler, caches and diff functions as
+# perform_diffs.py, and removed again. Only the results store and, with --archive, a compressed tar
+# of the mutants in the contracts/mutants layout are written to disk:
+#
+#   tar -xf mutants.tar.gz -C ../contracts/mutants
+#
+# Usage: python3 pipeline.py 10 GT [--archive ../contracts/mutants.tar.gz]
+
+import os
+import io
+import time
+import shutil
+import tarfile
+import argparse
+import tempfile
+from collections import defaultdict
+
+import diff_driver
+from gen_diff_pairs import DATASET_PATH, run_sumo_all, iter_partitioned_mutations, print_unknown_operators, read_contract, contract_mutants
+from scheduler import DiffPair, run_pairs
+import profiling
+from profiling import stage
+
+ARCHIVE_MODES = {".gz": "gz", ".tgz": "gz", ".xz": "xz", ".bz2": "bz2", ".tar": ""}
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Generate mutants from mutations.json and diff them against their original contract in one pass.",
+                                     epilog="Example: python3 %s 10 GT --archive ../contracts/mutants.tar.gz" % os.path.basename(__file__),
+                                     parents=[diff_driver.diff_parser(), diff_driver.cache_parser(), diff_driver.store_parser(), diff_driver.profile_parser()])
+    parser.add_argument("n_mutations", type=int, help="the desired number of mutations")
+    parser.add_argument("diff_tool", choices=["GT", "difft"], help="diffing tool")
+    parser.add_argument("--lookup", action="store_true", help="run a SuMo lookup with all operators enabled first")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="directory of the contracts to mutate (default: %s)" % DATASET_PATH)
+    parser.add_argument("--archive", default="", help="also write the mutants to this tar archive, compressed by its extension (.gz, .xz, .bz2)")
+    parser.add_argument("--scratch", default="/dev/shm" if os.path.isdir("/dev/shm") else None,
+                        help="directory the mutants of a batch are written to while they are diffed (default: /dev/shm)")
+    parser.add_argument("--batch-pairs", type=int, default=2000,
+                        help="number of pairs written to the scratch directory at a time (default: 2000)")
+    args = diff_driver.parse_args(parser)
+    if not args.store:
+        parser.error("--store is where the results are written to, it cannot be disabled")
+    return args
+
+
+#Tar archive of mutants laid out as <contract>/original/<file> and <contract>/<level>/<operator>/<file>
+class MutantArchive:
+    def __init__(self, path):
+        mode = ARCHIVE_MODES.get(os.path.splitext(path)[1], "gz")
+        self.tar = tarfile.open(path, "w|" + mode)
+        self.mtime = time.time()
+
+    def add(self, member, text):
+        data = text.encode()
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        info.mtime = self.mtime
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+#Writes the original and mutants of each contract to the scratch directory and yields the pairs, in batches of
+#at least batch_pairs pairs (or the remaining contracts). Contracts are read from the dataset directory. Mutants are
+#added to the archive, if given, as they are written.
+def iter_batches(scratch, n_mutants, batch_pairs, unknown, archive=None, dataset=DATASET_PATH):
+    batch = []
+    for c, mutations in iter_partitioned_mutations(unknown):
+        name = c.split('.')[0]
+        contract = read_contract(c, dataset)
+        if contract is None:
+            print("file: " + c + " could not be opened!")
+            continue
+
+        with stage("write-mutants"):
+            original = os.path.join(scratch, name, "original", c)
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            with open(original, "w") as f:
+                f.write(contract)
+            if archive is not None:
+                archive.add(name + "/original/" + c, contract)
+
+            for op, level, mutant in contract_mutants(contract, mutations, n_mutants):
+                member = name + "/" + str(level) + "/" + op + "/" + c
+                path = os.path.join(scratch, member)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(mutant)
+                if archive is not None:
+                    archive.add(member, mutant)
+                batch.append(DiffPair(name, level, op, original, path))
+
+        if len(batch) >= batch_pairs:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_pipeline(n_mutants, diff_tool, tool_workers, parse_workers, scratch, batch_pairs, store, cache=None, archive=None, scripts=None, output_level="raw",
+                 dataset=DATASET_PATH):
+    def on_result(pair, diff):
+        if scripts is not None:
+            with stage("script-store"):
+                diff = scripts.put_result(pair.contract, pair.level, pair.operator, diff_tool, diff)
+        with stage("store-append"):
+            store.append_result(pair.contract, pair.level, pair.operator, diff_tool, diff, output_level)
+
+    run_fn, parse_fn = diff_driver.diff_tools(output_level, raw_chunks=False)[diff_tool]
+    unknown = defaultdict(int)
+    scratch_dir = tempfile.mkdtemp(prefix="solidiffy-", dir=scratch)
+    n_pairs = 0
+    try:
+        for batch in iter_batches(scratch_dir, n_mutants, batch_pairs, unknown, archive, dataset):
+            run_pairs(batch, run_fn, parse_fn, on_result, tool_workers, parse_workers, cache)
+            store.flush()
+            n_pairs += len(batch)
+            for contract in {pair.contract for pair in batch}:
+                shutil.rmtree(os.path.join(scratch_dir, contract))
+            print(f'Pairs diffed: {n_pairs}')
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    print_unknown_operators(unknown)
+
+
+if __name__ ==  '__main__':
+    start_time = time.time()
+    args = parse_input()
+    if args.profile:
+        profiling.enable(args.profile, args.profiler)
+    if args.lookup:
+        run_sumo_all()
+
+    # The diff functions (see diff_driver.py) are used with their limits, pool and tree cache set up here
+    diff_driver.setup(args, args.diff_tool, args.tree_cache)
+    # Results have the format of perform_diffs.py, so its cached results are shared
+    result_cache, store, scripts = diff_driver.open_stores(args, "perform_diffs.py")
+    archive = MutantArchive(args.archive) if args.archive else None
+
+    try:
+        run_pipeline(args.n_mutations, args.diff_tool, args.jobs, args.parse_workers, args.scratch, args.batch_pairs,
+                     store, result_cache, archive, scripts, args.output_level, os.path.join(args.dataset, ""))
+    finally:
+        if archive is not None:
+            archive.close()
+        diff_driver.close(result_cache, store, scripts)
+    if args.profile:
+        print(profiling.finish())
+        print("Profile written to " + args.profile)
+
+    print(f"Generated and diffed mutants in {time.time() - start_time} s")
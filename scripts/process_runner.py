@@ -0,0 +1,230 @@
+# Runs the external tools (gumtree, difftastic, tree-sitter-parser, SuMo) without a shell, with a
+# timeout, retries and resource limits per call, and turns failures into RunErrors that say what
+# went wrong. Failed pairs are recorded as error_record(e) dicts instead of plain -1 / [].
+#
+# Usage:
+#   limits = Limits(timeout=300, retries=1, memory_mb=4096)
+#   out = run(["difft", "--display", "json", a, b], limits).stdout
+#   run(["gumtree", "textdiff", "-f", "XML", a, b], limits, on_stdout=reader.feed)
+#
+# Memory and CPU limits are set with prlimit on the started process (RLIMIT_AS and RLIMIT_CPU), so
+# they work from the worker threads of the scheduler, where preexec_fn is unsafe. Where prlimit
+# is not available (not Linux) they are not enforced. The JVM reserves far more address space
+# than it uses, so Java tools get their memory limit as -Xmx instead (see gumtree_client.py).
+#
+# Every call is measured: wall time with perf_counter_ns from start to exit, and the CPU time
+# and peak RSS of the process from the rusage of os.wait4. They are returned as the metrics of
+# the RunResult, a dict with the keys of METRICS that the drivers store with each result.
+
+import os
+import sys
+import time
+import signal
+import tempfile
+import threading
+import subprocess
+from collections import namedtuple
+
+from profiling import stage
+
+try:
+    import resource
+except ImportError:     #not on Windows
+    resource = None
+
+CHUNK_SIZE = 1 << 16
+STDERR_TAIL = 4096
+
+#timeout and cpu_s in seconds, memory_mb in MiB; None means no limit. A call is retried up to retries times
+#if it failed in a way that may not happen again (RETRYABLE).
+Limits = namedtuple("Limits", ["timeout", "retries", "memory_mb", "cpu_s"], defaults=[None, 0, None, None])
+
+RunResult = namedtuple("RunResult", ["stdout", "stderr", "elapsed", "attempts", "metrics"])
+
+#Measurements of a diff: wall time, user and system CPU time in ns, peak resident set size in KiB and, where
+#the tool reports them (the warm Gumtree workers), the time spent parsing, matching and generating the edit
+#script. -1 where unknown.
+METRICS = ["wall_ns", "cpu_user_ns", "cpu_sys_ns", "max_rss_kb", "parse_ns", "match_ns", "actions_ns"]
+
+# Failure kinds:
+#   not-found   the program could not be started
+#   timeout     killed after limits.timeout seconds
+#   memory      ran out of memory (limit or allocation failure reported on stderr)
+#   cpu-limit   killed for exceeding limits.cpu_s
+#   signal      killed by another signal
+#   exit        exited with a non-zero status
+#   no-output   exited normally without output where some was expected
+#   worker-exit a warm worker (see gumtree_client.py) died while handling the call
+#   tool-error  the tool reported an error for this input
+RETRYABLE = {"timeout", "signal", "worker-exit"}
+
+MEMORY_MARKERS = ("OutOfMemoryError", "MemoryError", "memory allocation of", "Cannot allocate memory", "std::bad_alloc")
+
+
+class RunError(Exception):
+    def __init__(self, kind, argv, returncode=None, stderr="", attempts=1, message=None):
+        self.kind = kind
+        self.argv = list(argv)
+        self.returncode = returncode
+        self.stderr = stderr
+        self.attempts = attempts
+        self.message = message or kind
+        super().__init__(self.message)
+
+    def __str__(self):
+        text = "%s: %s" % (self.message, " ".join(self.argv))
+        if self.returncode is not None:
+            text += " (status %d)" % self.returncode
+        return text
+
+    def to_dict(self):
+        return {"error": self.kind, "message": self.message, "command": self.argv, "returncode": self.returncode,
+                "stderr": self.stderr, "attempts": self.attempts}
+
+
+#Structured record of a failed pair. Exceptions without a kind of their own are recorded by type.
+def error_record(e):
+    if isinstance(e, RunError):
+        return e.to_dict()
+    return {"error": getattr(e, "kind", "exception"), "message": str(e), "type": type(e).__name__}
+
+
+def is_error(result):
+    return result == -1 or (isinstance(result, dict) and "error" in result)
+
+
+#Metrics dict with the given values and -1 for the rest
+def metrics(**values):
+    return {name: values.get(name, -1) for name in METRICS}
+
+
+#Peak resident set size of a running process in KiB, -1 where /proc is not available
+def peak_rss_kb(pid):
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return -1
+
+
+#Waits for proc to exit and returns its rusage, or None where wait4 is not available
+def _wait(proc):
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:   #already reaped by the poll() of a concurrent proc.kill()
+        proc.wait()
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+def _usage_metrics(wall_ns, usage):
+    if usage is None:
+        return metrics(wall_ns=wall_ns)
+    # ru_maxrss is in KiB on Linux but in bytes on macOS
+    max_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return metrics(wall_ns=wall_ns, cpu_user_ns=int(usage.ru_utime * 1e9), cpu_sys_ns=int(usage.ru_stime * 1e9),
+                   max_rss_kb=max_rss)
+
+
+def _set_limits(pid, limits):
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    if limits.memory_mb is not None:
+        size = limits.memory_mb * 1024 * 1024
+        resource.prlimit(pid, resource.RLIMIT_AS, (size, size))
+    if limits.cpu_s is not None:
+        # The soft limit sends SIGXCPU, the hard limit a second later SIGKILL
+        resource.prlimit(pid, resource.RLIMIT_CPU, (limits.cpu_s, limits.cpu_s + 1))
+
+
+def _classify(returncode, stderr, timed_out, limits):
+    if timed_out:
+        return "timeout"
+    if any(marker in stderr for marker in MEMORY_MARKERS):
+        return "memory"
+    if returncode < 0:
+        sig = -returncode
+        if sig == getattr(signal, "SIGXCPU", None) or (limits.cpu_s is not None and sig == signal.SIGKILL):
+            return "cpu-limit"
+        return "signal"
+    return "exit"
+
+
+def _run_once(argv, limits, on_stdout, env):
+    with tempfile.TemporaryFile() as stderr_file:
+        start = time.perf_counter_ns()
+        try:
+            proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr_file, env=env)
+        except OSError as e:
+            raise RunError("not-found", argv, message=str(e)) from e
+
+        timed_out = threading.Event()
+        timer = None
+        try:
+            _set_limits(proc.pid, limits)
+            if limits.timeout is not None:
+                def expire():
+                    timed_out.set()
+                    proc.kill()
+                timer = threading.Timer(limits.timeout, expire)
+                timer.daemon = True
+                timer.start()
+
+            chunks = []
+            for chunk in iter(lambda: proc.stdout.read(CHUNK_SIZE), b""):
+                if on_stdout is None:
+                    chunks.append(chunk)
+                else:
+                    on_stdout(chunk)
+            usage = _wait(proc)
+            wall_ns = time.perf_counter_ns() - start
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            proc.stdout.close()
+        returncode = proc.returncode
+
+        stderr_file.seek(max(0, stderr_file.tell() - STDERR_TAIL))
+        stderr = stderr_file.read().decode(errors="replace")
+
+    if returncode != 0 or timed_out.is_set():
+        kind = _classify(returncode, stderr, timed_out.is_set(), limits)
+        raise RunError(kind, argv, returncode, stderr)
+    return RunResult(b"".join(chunks) if on_stdout is None else None, stderr, wall_ns / 1e9, 1, _usage_metrics(wall_ns, usage))
+
+
+#Runs argv and returns its output, or raises a RunError. With on_stdout, the output is passed to it chunk by
+#chunk as it arrives instead, and on_retry() is called before a retry so the consumer can start over.
+def run(argv, limits=Limits(), on_stdout=None, env=None, on_retry=None):
+    attempts = 0
+    while True:
+        attempts += 1
+        if attempts > 1 and on_retry is not None:
+            on_retry()
+        try:
+            with stage("subprocess " + os.path.basename(argv[0])):
+                result = _run_once(argv, limits, on_stdout, env)
+            return result._replace(attempts=attempts)
+        except RunError as e:
+            e.attempts = attempts
+            if e.kind not in RETRYABLE or attempts > limits.retries:
+                raise
+
+
+#Environment for a Java tool with the memory limit given as maximum heap size
+def java_env(limits, env=None):
+    env = dict(os.environ if env is None else env)
+    if limits.memory_mb is not None:
+        env["JAVA_TOOL_OPTIONS"] = (env.get("JAVA_TOOL_OPTIONS", "") + " -Xmx%dm" % limits.memory_mb).strip()
+    return env
@@ -0,0 +1,277 @@
+# Opt-in profiling of the drivers. Code marks the stages of a pair with `with stage("name"):`
+# (waiting for the diff tool, parsing its XML or JSON output, counting changes, saving results,
+# ...), and when profiling is on, the time and count of every stage is recorded in each process,
+# the driver and its parse workers alike. Optionally every thread also runs cProfile, or a
+# sampling profiler records the Python stacks of all threads every few milliseconds. At the end
+# of the run the records of all processes are merged into the profile directory:
+#
+#   summary.txt       per stage: count, total and self time, mean; with cProfile the top functions
+#   stages.folded     stage stacks with their self time in microseconds, e.g. "driver;on-result;store-append 1520"
+#   samples.folded    with the sampling profiler: the sampled Python stacks with their number of samples
+#   profile.prof      with cProfile: the merged statistics of all threads and processes (python -m pstats, snakeviz)
+#
+# The .folded files are in the collapsed stack format of flamegraph.pl, inferno and speedscope.
+# Stages nest: the total time of a stage includes the stages inside it, its self time does not.
+# Stages of different threads overlap in time, so their totals can add up to more than the run.
+# When profiling is off, stage() returns a shared no-op context manager.
+#
+# Usage:
+#   python3 perform_diffs.py ../contracts/mutants/ difft --profile ../results/profile [--profiler sample]
+#
+#   profiling.enable("../results/profile", "cprofile")
+#   with profiling.stage("parse"):
+#       ...
+#   ProcessPoolExecutor(**profiling.pool_args())
+#   profiling.finish()
+
+import io
+import os
+import re
+import sys
+import glob
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextlib
+import multiprocessing.util
+from collections import Counter
+
+PROFILERS = ["cprofile", "sample"]
+SAMPLE_INTERVAL = 0.005
+
+_settings = None    #(directory, profiler, role) while profiling is on
+_stages = {}        #stage path -> [count, total_ns, self_ns]
+_lock = threading.Lock()
+_local = threading.local()
+_profiles = []
+_sampler = None
+_started = None
+_null = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "start", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.children = 0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = [_settings[2]]
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        stack = _local.stack
+        stack.pop()
+        if len(stack) > 1:
+            stack[-1].children += elapsed
+        path = ";".join([stack[0]] + [s.name for s in stack[1:]] + [self.name])
+        with _lock:
+            record = _stages.setdefault(path, [0, 0, 0])
+            record[0] += 1
+            record[1] += elapsed
+            record[2] += elapsed - self.children
+        return False
+
+
+#Context manager timing a stage of the work, a no-op unless profiling is on
+def stage(name):
+    if _settings is None:
+        return _null
+    return _Stage(name)
+
+
+def enabled():
+    return _settings is not None
+
+
+#Records the Python stacks of all other threads every interval seconds
+class Sampler:
+    def __init__(self, role, interval=SAMPLE_INTERVAL):
+        self.role = role
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, name="profiling-sampler", daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        me = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    # Numbered threads of a pool are merged into one frame
+                    names[ident] = re.sub(r"[-_]\d+$", "", thread.name) if thread is not None else "thread"
+                self.counts[";".join([self.role, names[ident]] + stack[::-1])] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def _profile_thread(frame, event, arg):
+    # Called on the first event of every new thread: replaces itself with a profiler of that thread
+    sys.setprofile(None)
+    profile = cProfile.Profile()
+    with _lock:
+        _profiles.append(profile)
+    profile.enable()
+
+
+def _start(directory, profiler, role):
+    global _settings, _sampler
+    _settings = (directory, profiler, role)
+    # A forked worker starts with the records and the stage stack of the thread that forked it
+    _stages.clear()
+    _profiles.clear()
+    _local.stack = [role]
+    if profiler == "cprofile":
+        _profile_thread(None, None, None)
+        threading.setprofile(_profile_thread)
+    elif profiler == "sample":
+        _sampler = Sampler(role)
+
+
+#Stops profiling in this process and writes its records to the profile directory
+def _dump():
+    global _settings, _sampler
+    if _settings is None:
+        return
+    directory, profiler, role = _settings
+    # Pids of the parse workers of earlier pools may have been reused by now
+    tag = "%d-%d" % (os.getpid(), time.time_ns())
+    threading.setprofile(None)
+    if profiler == "cprofile":
+        with _lock:
+            profiles = list(_profiles)
+            _profiles.clear()
+        stats = None
+        for profile in profiles:
+            profile.disable()
+            profile.create_stats()
+            if profile.stats:
+                stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+        if stats is not None:
+            stats.dump_stats(os.path.join(directory, "cprofile-%s.prof" % tag))
+    elif profiler == "sample" and _sampler is not None:
+        _sampler.stop()
+        with open(os.path.join(directory, "samples-%s.folded" % tag), "w") as f:
+            for stack, count in _sampler.counts.items():
+                f.write("%s %d\n" % (stack, count))
+        _sampler = None
+    with _lock:
+        stages = {path: list(record) for path, record in _stages.items()}
+    with open(os.path.join(directory, "stages-%s.json" % tag), "w") as f:
+        json.dump(stages, f)
+    _settings = None
+
+
+#Turns profiling on in the driver process, writing to directory. profiler is None, "cprofile" or "sample".
+def enable(directory, profiler=None):
+    global _started
+    _started = time.perf_counter_ns()
+    os.makedirs(directory, exist_ok=True)
+    # Records of an earlier run would be merged into this one
+    for path in glob.glob(os.path.join(directory, "stages-*.json")) + glob.glob(os.path.join(directory, "samples-*.folded")) + \
+            glob.glob(os.path.join(directory, "cprofile-*.prof")):
+        os.remove(path)
+    _start(directory, profiler, "driver")
+
+
+def _start_worker(directory, profiler):
+    _start(directory, profiler, "parse-worker")
+    # Runs when the worker process exits normally, as it does when its pool is shut down
+    multiprocessing.util.Finalize(None, _dump, exitpriority=10)
+
+
+#Keyword arguments for a ProcessPoolExecutor whose workers are profiled like the driver
+def pool_args():
+    if _settings is None:
+        return {}
+    return {"initializer": _start_worker, "initargs": _settings[:2]}
+
+
+def _merge_stages(directory):
+    merged = {}
+    for path in glob.glob(os.path.join(directory, "stages-*.json")):
+        with open(path) as f:
+            for stack, (count, total, self_ns) in json.load(f).items():
+                record = merged.setdefault(stack, [0, 0, 0])
+                record[0] += count
+                record[1] += total
+                record[2] += self_ns
+    return merged
+
+
+def _summary(merged, wall_s):
+    by_stage = {}
+    for stack, (count, total, self_ns) in merged.items():
+        role, name = stack.split(";", 1)[0], stack.rsplit(";", 1)[-1]
+        record = by_stage.setdefault((role, name), [0, 0, 0])
+        record[0] += count
+        # A stage nested in itself would be counted twice in its total
+        if name not in stack.split(";")[1:-1]:
+            record[1] += total
+        record[2] += self_ns
+
+    out = io.StringIO()
+    out.write(f"Run: {wall_s:.3f} s wall\n\n")
+    out.write(f"{'process':14} {'stage':22} {'count':>9} {'total s':>10} {'self s':>10} {'mean ms':>10}\n")
+    for (role, name), (count, total, self_ns) in sorted(by_stage.items(), key=lambda item: (item[0][0], -item[1][1])):
+        out.write(f"{role:14} {name:22} {count:>9} {total / 1e9:>10.3f} {self_ns / 1e9:>10.3f} {total / 1e6 / count:>10.3f}\n")
+    return out.getvalue()
+
+
+#Stops profiling, merges the records of all processes and writes the report files. Returns the summary text.
+def finish():
+    if _settings is None:
+        return ""
+    directory, profiler, _ = _settings
+    _dump()
+
+    merged = _merge_stages(directory)
+    with open(os.path.join(directory, "stages.folded"), "w") as f:
+        for stack, (_, _, self_ns) in sorted(merged.items()):
+            if self_ns >= 1000:
+                f.write("%s %d\n" % (stack, self_ns // 1000))
+    summary = _summary(merged, (time.perf_counter_ns() - _started) / 1e9 if _started else 0)
+
+    if profiler == "cprofile":
+        files = sorted(glob.glob(os.path.join(directory, "cprofile-*.prof")))
+        if files:
+            stats = pstats.Stats(*files)
+            stats.dump_stats(os.path.join(directory, "profile.prof"))
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats("cumulative").print_stats(30)
+            summary += "\n" + out.getvalue()
+    elif profiler == "sample":
+        samples = Counter()
+        for path in glob.glob(os.path.join(directory, "samples-*.folded")):
+            with open(path) as f:
+                for line in f:
+                    stack, count = line.rsplit(" ", 1)
+                    samples[stack] += int(count)
+        with open(os.path.join(directory, "samples.folded"), "w") as f:
+            for stack, count in sorted(samples.items()):
+                f.write("%s %d\n" % (stack, count))
+
+    with open(os.path.join(directory, "summary.txt"), "w") as f:
+        f.write(summary)
+    return summary
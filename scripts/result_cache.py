@@ -0,0 +1,95 @@
+# Content-addressed cache of diff results, so re-running a driver only diffs pairs it has not
+# seen before. A result is keyed by (hash(original), hash(mutant), tool, tool version, options)
+# and appended to <cache_dir>/<tool>.jsonl as one "<key>\t<json result>" line, flushed right
+# away. An interrupted run therefore loses at most the line being written, which is dropped
+# the next time the cache is opened. Only an index of key -> file offset is kept in memory.
+
+import os
+import json
+import hashlib
+import threading
+
+from gumtree_client import find_gumtree_lib, GumtreeError
+from process_runner import Limits, RunError, run
+
+
+#Identifies the installed version of a diff tool, so results of an upgraded tool are not reused
+def tool_version(diff_tool):
+    try:
+        if diff_tool == "difft":
+            return run(["difft", "--version"], Limits(timeout=60)).stdout.decode().splitlines()[0]
+        elif diff_tool == "GT":
+            lib = find_gumtree_lib()
+            return ",".join(sorted(f for f in os.listdir(lib) if f.startswith("gumtree")))
+    except (OSError, RunError, GumtreeError, IndexError):
+        pass
+    return "unknown"
+
+
+class ResultCache:
+    def __init__(self, cache_dir, diff_tool, options=""):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, diff_tool + ".jsonl")
+        self.prefix = "\0".join([diff_tool, tool_version(diff_tool), options]) + "\0"
+        self.hashes = {}    #path -> content hash, originals are shared by many pairs
+        self.index = {}     #key -> offset of its line
+        self.lock = threading.Lock()
+
+        self.load_index()
+        self.writer = open(self.path, "ab")
+        self.reader = open(self.path, "rb")
+
+    def load_index(self):
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path, "rb+") as f:
+            for line in f:
+                if not line.endswith(b"\n") or b"\t" not in line:
+                    # Partial line left by a crash, cut it off
+                    f.truncate(offset)
+                    break
+                self.index[line[:line.index(b"\t")].decode()] = offset
+                offset += len(line)
+
+    def file_hash(self, path):
+        digest = self.hashes.get(path)
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self.hashes[path] = digest
+        return digest
+
+    #Sets the content hash of a file whose content is known to hash to digest, e.g. a git blob by its SHA
+    def set_hash(self, path, digest):
+        self.hashes[path] = digest
+
+    #Forgets the content hash of a file, once it is removed or may change
+    def forget_hash(self, path):
+        self.hashes.pop(path, None)
+
+    def key(self, original, mutant):
+        key = self.prefix + self.file_hash(original) + self.file_hash(mutant)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    #Returns the cached result for key, or None
+    def get(self, key):
+        offset = self.index.get(key)
+        if offset is None:
+            return None
+        with self.lock:
+            self.reader.seek(offset)
+            line = self.reader.readline()
+        return json.loads(line[line.index(b"\t") + 1:])
+
+    def put(self, key, result):
+        line = (key + "\t" + json.dumps(result) + "\n").encode()
+        with self.lock:
+            offset = self.writer.tell()
+            self.writer.write(line)
+            self.writer.flush()
+            self.index[key] = offset
+
+    def close(self):
+        self.writer.close()
+        self.reader.close()
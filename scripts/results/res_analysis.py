@@ -1,3 +1,5 @@
+import os
+import sys
 import pickle
 import pprint
 import csv
@@ -5,6 +7,10 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import numpy as np
 
+# The results store is read with the reader of the scripts (see ../results_store.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from results_store import Results
+
 
 def load_pickles():
     difft_file = open("results-difft.pickle", "rb")
@@ -16,6 +22,46 @@ def load_pickles():
     return {"GT": GT, "difft": difft}
 
 
+TABLE_COLUMNS = ["contract", "level", "operator", "tool", "edits", "time"]
+
+
+#Flattens the nested pickle results ({tool: {contract: [{operator: diff}]}}) into a table with one row per pair.
+#A diff is either a list starting with the edit count (and running time) or a bare edit count; failed pairs ([] or an
+#error record, see process_runner.py) get edits = -1.
+def pickles_to_table(diff_results):
+    names = {"contract": {}, "operator": {}, "tool": {}}
+    cols = {name: [] for name in TABLE_COLUMNS}
+    for diff_tool in diff_results:
+        for contract in diff_results[diff_tool]:
+            for i, level in enumerate(diff_results[diff_tool][contract]):
+                for mut, diff in level.items():
+                    if isinstance(diff, dict):
+                        edits, time = -1, np.nan
+                    elif isinstance(diff, list):
+                        edits = diff[0] if diff else -1
+                        time = diff[1] if len(diff) > 1 and isinstance(diff[1], float) else np.nan
+                    else:
+                        edits, time = diff, np.nan
+                    cols["contract"].append(names["contract"].setdefault(contract, len(names["contract"])))
+                    cols["level"].append(i + 1)
+                    cols["operator"].append(names["operator"].setdefault(mut, len(names["operator"])))
+                    cols["tool"].append(names["tool"].setdefault(diff_tool, len(names["tool"])))
+                    cols["edits"].append(edits)
+                    cols["time"].append(time)
+
+    table = {name: np.asarray(cols[name], dtype=np.float64 if name == "time" else np.int64) for name in TABLE_COLUMNS}
+    table["names"] = {name: list(ids) for name, ids in names.items()}
+    return table
+
+
+#Loads the columnar results store written by the perform_diffs* drivers as a table, the columns stay memory-mapped
+def load_store(path):
+    results = Results(path)
+    table = {name: np.asarray(results.columns[name]) for name in TABLE_COLUMNS}
+    table["names"] = results.strings
+    return table
+
+
 def setup(n_mut):
     res = [0] * n_mut
     count = [0] * n_mut
@@ -25,46 +71,80 @@ def setup(n_mut):
     return {"res": res, "count": count, "mut_res": mut_res, "mut_count": mut_count}
 
 
-def remove_mut_operators(diff_results, operators):
-    for diff_tool in diff_results:
-        for contract in diff_results[diff_tool]:
-            for i in range(len(diff_results[diff_tool][contract])):
-                for r in operators:
-                    if r in diff_results[diff_tool][contract][i].keys():
-                        diff_results[diff_tool][contract][i].pop(r)
-
-
-def analyze_diffs(diffs, res_dict, n_mut):
-    is_GT = isinstance(next(iter(next(iter(diffs.values()))[0].values())), list)
-
-    for contract in diffs:
-        for i in range(len(diffs[contract])):
-            for mut in diffs[contract][i]:
-                if not diffs[contract][i][mut] == []:
-                    res_dict["count"][i] += 1
-                    if is_GT:
-                        res_dict["res"][i] += diffs[contract][i][mut][0]
-                    else:
-                        res_dict["res"][i] += diffs[contract][i][mut]
-                    
-                    if not mut in res_dict["mut_res"].keys():
-                        res_dict["mut_res"][mut] = [0] * n_mut
-                        res_dict["mut_count"][mut] = [0] * n_mut 
-
-                    if is_GT:
-                        res_dict["mut_res"][mut][i] += diffs[contract][i][mut][0]
-                    else:
-                        res_dict["mut_res"][mut][i] += diffs[contract][i][mut] 
-                    res_dict["mut_count"][mut][i] += 1    
-
-    #Calculate average results 
-    res_dict["res"] = [i / j for i, j in zip( res_dict["res"],  res_dict["count"])]
-
-    for mut in res_dict["mut_res"]:
-        for i in range(len(np.trim_zeros( res_dict["mut_res"][mut]))):
-            res_dict["mut_res"][mut] = np.trim_zeros( res_dict["mut_res"][mut])
-            res_dict["mut_count"][mut] = np.trim_zeros( res_dict["mut_count"][mut])
-            res_dict["mut_res"][mut][i] /= res_dict["mut_count"][mut][i]
+#Returns the table without the rows of the given operators
+def remove_mut_operators(table, operators):
+    removed = [i for i, op in enumerate(table["names"]["operator"]) if op in operators]
+    keep = ~np.isin(table["operator"], removed)
+    filtered = {name: table[name][keep] for name in TABLE_COLUMNS}
+    filtered["names"] = table["names"]
+    return filtered
+
+
+#Successful pairs of one tool, as (level index, operator, edits) arrays, empty if the table has no results of the tool
+def tool_rows(table, tool):
+    if tool in table["names"]["tool"]:
+        mask = (table["tool"] == table["names"]["tool"].index(tool)) & (table["edits"] >= 0)
+    else:
+        mask = np.zeros(len(table["tool"]), dtype=bool)
+    return table["level"][mask].astype(np.int64) - 1, table["operator"][mask].astype(np.int64), table["edits"][mask]
+
+
+def analyze_diffs(table, tool, res_dict, n_mut):
+    level, op, edits = tool_rows(table, tool)
+
+    count = np.bincount(level, minlength=n_mut)
+    res = np.bincount(level, weights=edits, minlength=n_mut)
+    res_dict["count"] = count.tolist()
+
+    #Calculate average results
+    res_dict["res"] = (res / count).tolist()
+
+    # Sums and counts per (operator, level) in one pass, operators in order of first appearance
+    n_ops = len(table["names"]["operator"])
+    mut_sums = np.bincount(op * n_mut + level, weights=edits, minlength=n_ops * n_mut).reshape(n_ops, n_mut)
+    mut_counts = np.bincount(op * n_mut + level, minlength=n_ops * n_mut).reshape(n_ops, n_mut)
+    present, first = np.unique(op, return_index=True)
+
+    for o in present[np.argsort(first)]:
+        mut = table["names"]["operator"][o]
+        sums, counts = mut_sums[o], mut_counts[o]
+        nonzero_sums, nonzero_counts = np.flatnonzero(sums), np.flatnonzero(counts)
+        if nonzero_sums.size == 0:
+            res_dict["mut_res"][mut] = sums.astype(np.int64).tolist()
+            res_dict["mut_count"][mut] = counts.tolist()
+            continue
+
+        # Leading and trailing zeros are trimmed from sums and counts separately, then averaged position by position
+        sums = sums[nonzero_sums[0]:nonzero_sums[-1] + 1]
+        res_dict["mut_res"][mut] = (sums / counts[nonzero_counts[0]:nonzero_counts[0] + len(sums)]).tolist()
+        res_dict["mut_count"][mut] = counts[nonzero_counts[0]:nonzero_counts[-1] + 1].tolist()
+
+
+#Average edit script length per operator category (rows) and number of mutations (columns)
+def analyze_categories(table, tool, categories, n_mut):
+    op_names = table["names"]["operator"]
+    category_of = np.full(len(op_names), -1)
+    for c, ops in enumerate(categories):
+        for op in ops:
+            if op in op_names:
+                category_of[op_names.index(op)] = c
+
+    level, op, edits = tool_rows(table, tool)
+    category = category_of[op]
+    keep = category >= 0
+    flat = category[keep] * n_mut + level[keep]
+    sums = np.bincount(flat, weights=edits[keep], minlength=len(categories) * n_mut).reshape(len(categories), n_mut)
+    counts = np.bincount(flat, minlength=len(categories) * n_mut).reshape(len(categories), n_mut)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+#Per-operator results padded into an (operator, number of mutations) matrix, missing levels are NaN
+def mut_matrix(data, n_mut=10):
+    matrix = np.full((len(data), n_mut), np.nan)
+    for row, values in zip(matrix, data.values()):
+        row[:len(values)] = values
+    return matrix
 
 
 def print_summary(GT, difft):
@@ -141,10 +221,7 @@ def box_plot(data, offset):
 
 
 def box(data, offset, color):
-    d = [[] for _ in range(10)]
-    for key in data.keys():
-        for i in range(len(data[key])):
-            d[i].append(data[key][i])
+    d = [column[~np.isnan(column)] for column in mut_matrix(data).T]
     
     x = [x - offset for x in [1,2,3,4,5,6,7,8,9,10]]
    
@@ -198,15 +275,7 @@ def bar(data, offset, color, subplot, oper):
 
 def calc_corr(data):
     x = [1,2,3,4,5,6,7,8,9,10]
-    count = [0 for _ in range(10)]
-    
-    d = [0 for _ in range(10)]
-    for key in data.keys():
-        for i in range(len(data[key])):
-            d[i] += data[key][i]
-            count[i] += 1
-    
-    res = [i / j for i, j in zip(d, count)]
+    res = np.nanmean(mut_matrix(data), axis=0)
 
     r = np.corrcoef(x, res)
     r2 = np.polyfit(x, res, 1)
@@ -215,15 +284,16 @@ def calc_corr(data):
 
 if __name__ ==  '__main__':
     num_mut = 10
-    pickles = load_pickles()
+    # python3 res_analysis.py [PATH TO RESULTS STORE], defaults to the pickles
+    table = load_store(sys.argv[1]) if len(sys.argv) > 1 else pickles_to_table(load_pickles())
 
-    remove_mut_operators(pickles, ["AVR","SCEC"])
+    table = remove_mut_operators(table, ["AVR","SCEC"])
 
     GT_res_dict = setup(num_mut)
-    analyze_diffs(pickles["GT"], GT_res_dict, num_mut)
+    analyze_diffs(table, "GT", GT_res_dict, num_mut)
 
     difft_res_dict = setup(num_mut)
-    analyze_diffs(pickles["difft"], difft_res_dict, num_mut)
+    analyze_diffs(table, "difft", difft_res_dict, num_mut)
 
     #print_summary(GT_res_dict, difft_res_dict)
     #print_by_mutation(difft_res_dict)
@@ -256,6 +326,11 @@ if __name__ ==  '__main__':
     opers.append( ["BCRD","DLR","ER","ETR","FVR","GVR","PKD","SFR","SKD","SKI","TOR","VVR"])
     titles = ["Mutated Literals", "Mutated Operators & Type Specifications", "Mutated Code Blocks", "Mutated Arguments & Modifers", "Other Mutations"]
 
+    for tool in ["GT", "difft"]:
+        print(tool + " average edits by category:")
+        for title, averages in zip(titles, analyze_categories(table, tool, opers, num_mut)):
+            print(title, np.around(averages, 2))
+
     for i in range(len(opers)):
         bar_by_mut_plot((GT_res_dict["mut_res"], difft_res_dict["mut_res"]), 0.15, opers[i], titles[i])
     
@@ -0,0 +1,310 @@
+# Columnar results store shared by all drivers and the analysis.
+#
+# A store is a directory holding one flat array file per column (native byte order, fixed item
+# size), so appending a row appends a few bytes to each file and readers can memory-map every
+# column without parsing anything:
+#
+#   contract.I  level.H  operator.H  tool.B  edits.i  time.d  script_offset.Q  script_length.I
+#   wall_ns.q  cpu_user_ns.q  cpu_sys_ns.q  max_rss_kb.q  parse_ns.q  match_ns.q  actions_ns.q
+#   output_level.B
+#
+# The metric columns hold the metrics of each diff (see process_runner.METRICS), -1 where unknown,
+# and output_level the index in output_level.OUTPUT_LEVELS of the level the row was written at. A
+# store written before these columns existed gets them when it is opened for appending, filled with
+# -1 for the metrics and 0 (raw) for the level; readers treat missing columns the same way.
+#
+# String columns (contract, operator, tool) hold indices into <column>.dict, a text file with
+# one value per line. Edit scripts are appended to scripts.bin and referenced by offset and
+# length (length 0 means no script). Scripts compressed by the full output level and the counts
+# of the summary level (see output_level.py) are stored as the driver returned them. Failed pairs
+# are stored with edits = -1 and, for their script, the JSON error record describing the failure
+# (see process_runner.py). Each (contract, level, operator, tool) is stored once: re-running a
+# driver on the same store adds new pairs, and only replaces the row of a pair that failed before
+# and now succeeded, or that was stored at the summary level and now has its edit script. Use a
+# fresh store for a new tool version.
+#
+# Only one process may append to a store at a time. Rows are only complete once every column
+# has been written, so a store left behind by a crash is cut back to its last complete row when
+# it is opened again. A row is replaced in place, column by column, after its new script is on disk.
+#
+# Usage:
+#   with ResultsStore("../results/store") as store:
+#       store.append("Contract", 1, "AOR", "GT", 12, 0.8, "<actions>...</actions>", {"wall_ns": 812000000})
+#
+#   results = Results("../results/store")
+#   edits = results.columns["edits"]          # memoryview over the mapped file
+#   results.value("operator", 0), results.script(0)
+
+import os
+import mmap
+import json
+import math
+from array import array
+
+from process_runner import METRICS
+from output_level import OUTPUT_LEVELS, COMPRESSED_PREFIX, decompress_script
+
+COLUMNS = [
+    ("contract", "I"),
+    ("level", "H"),
+    ("operator", "H"),
+    ("tool", "B"),
+    ("edits", "i"),
+    ("time", "d"),
+    ("script_offset", "Q"),
+    ("script_length", "I"),
+] + [(name, "q") for name in METRICS] + [("output_level", "B")]
+STRING_COLUMNS = ["contract", "operator", "tool"]
+#Columns added after the first stores were written, with the value of the rows written without them
+LATE_COLUMNS = dict({name: -1 for name in METRICS}, output_level=0)
+
+
+def column_path(path, name, typecode):
+    return os.path.join(path, name + "." + typecode)
+
+
+def read_strings(path, name):
+    dict_path = os.path.join(path, name + ".dict")
+    if not os.path.exists(dict_path):
+        return []
+    with open(dict_path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+#Number of complete rows in a store, i.e. rows present in every column and whose script is in scripts.bin.
+#Late columns that do not exist yet are not counted.
+def complete_rows(path):
+    n_rows = min(os.path.getsize(column_path(path, name, typecode)) // array(typecode).itemsize
+                 if os.path.exists(column_path(path, name, typecode)) else 0
+                 for name, typecode in COLUMNS
+                 if name not in LATE_COLUMNS or os.path.exists(column_path(path, name, typecode)))
+    if n_rows == 0:
+        return 0
+
+    scripts_path = os.path.join(path, "scripts.bin")
+    scripts_size = os.path.getsize(scripts_path) if os.path.exists(scripts_path) else 0
+    offsets, lengths = array("Q"), array("I")
+    with open(column_path(path, "script_offset", "Q"), "rb") as f:
+        offsets.fromfile(f, n_rows)
+    with open(column_path(path, "script_length", "I"), "rb") as f:
+        lengths.fromfile(f, n_rows)
+    while n_rows > 0 and offsets[n_rows - 1] + lengths[n_rows - 1] > scripts_size:
+        n_rows -= 1
+    return n_rows
+
+
+#Splits a driver result (list, dict or plain count, see perform_diffs*.py) into edit count, running time, edit script
+#and metrics. A list is [edit count, running time, edit script or None, metrics].
+def unpack_result(diff):
+    if isinstance(diff, dict) and "error" in diff:
+        return -1, math.nan, diff, None
+    if isinstance(diff, dict):
+        edits = diff.get("number_of_edits", diff.get("number_of_changes"))
+        return edits, diff.get("timing", math.nan), diff.get("edit_script", diff.get("diff_chunks")), diff.get("metrics")
+    if isinstance(diff, int):
+        return (-1, math.nan, None, None) if diff == -1 else (diff, math.nan, None, None)
+    if not diff:
+        return -1, math.nan, None, None
+    edits, elapsed, script, metrics = diff
+    return edits, elapsed, script, metrics
+
+
+#Whether a row replaces the stored row of the same pair: a success replaces a failure, and a success that keeps
+#its edit script one of the summary level (output levels are indices in OUTPUT_LEVELS)
+def replaces(edits, output_level, stored_edits, stored_output_level):
+    summary = OUTPUT_LEVELS.index("summary")
+    if edits < 0:
+        return False
+    return stored_edits < 0 or (stored_output_level == summary and output_level != summary)
+
+
+class ResultsStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        # Drop a partially written last row, and add the late columns to a store written without them
+        n_rows = complete_rows(path)
+        self.n_rows = n_rows
+        self.files = {}
+        for name, typecode in COLUMNS:
+            file_path = column_path(path, name, typecode)
+            new = not os.path.exists(file_path)
+            f = open(file_path, "ab")
+            if new and n_rows > 0:   #a late column, the store has no rows without the others
+                f.write((array(typecode, [LATE_COLUMNS[name]]) * n_rows).tobytes())
+            else:
+                f.truncate(n_rows * array(typecode).itemsize)
+            self.files[name] = f
+
+        self.strings = {}
+        self.string_files = {}
+        for name in STRING_COLUMNS:
+            self.strings[name] = {value: i for i, value in enumerate(read_strings(path, name))}
+            self.string_files[name] = open(os.path.join(path, name + ".dict"), "a", encoding="utf-8")
+
+        self.scripts = open(os.path.join(path, "scripts.bin"), "ab")
+
+        # (contract, level, operator, tool) -> (row, edits, output level) of every stored pair
+        self.keys = {}
+        if n_rows > 0:
+            results = Results(path)
+            cols = [results.columns[name] for name in ("contract", "level", "operator", "tool", "edits", "output_level")]
+            for i, (contract, level, operator, tool, edits, output_level) in enumerate(zip(*cols)):
+                self.keys[(contract, level, operator, tool)] = (i, edits, output_level)
+            del cols
+            results.close()
+
+    def string_id(self, name, value):
+        ids = self.strings[name]
+        if value not in ids:
+            ids[value] = len(ids)
+            # Written right away, a row may only refer to values that are already on disk
+            self.string_files[name].write(value + "\n")
+            self.string_files[name].flush()
+        return ids[value]
+
+    #Appends a row, unless the pair is already in the store. A failed pair (edits < 0) is replaced by a success,
+    #and a success at the summary level by one that keeps its edit script. Returns whether the row was written.
+    #metrics is a dict with (some of) the keys of process_runner.METRICS, output_level one of OUTPUT_LEVELS.
+    def append(self, contract, level, operator, tool, edits, time, script=None, metrics=None, output_level="raw"):
+        key = (self.string_id("contract", contract), level, self.string_id("operator", operator), self.string_id("tool", tool))
+        level_id = OUTPUT_LEVELS.index(output_level)
+        stored = self.keys.get(key)
+        if stored is not None and not replaces(edits, level_id, stored[1], stored[2]):
+            return False
+        row_index = stored[0] if stored is not None else self.n_rows
+        self.keys[key] = (row_index, edits, level_id)
+
+        offset, length = self.scripts.tell(), 0
+        if script is not None:
+            if not isinstance(script, str):
+                script = json.dumps(script)
+            data = script.encode()
+            self.scripts.write(data)
+            length = len(data)
+
+        row = {
+            "contract": key[0],
+            "level": level,
+            "operator": key[2],
+            "tool": key[3],
+            "edits": edits,
+            "time": time,
+            "script_offset": offset,
+            "script_length": length,
+        }
+        for name in METRICS:
+            value = metrics.get(name) if metrics else None
+            row[name] = -1 if value is None else value
+        row["output_level"] = level_id
+        if stored is not None:
+            self.replace(row_index, row)
+            return True
+        for name, typecode in COLUMNS:
+            self.files[name].write(array(typecode, [row[name]]).tobytes())
+        self.n_rows += 1
+        return True
+
+    #Overwrites row i. Everything written so far, the new script included, is flushed first.
+    def replace(self, i, row):
+        self.flush()
+        for name, typecode in COLUMNS:
+            with open(column_path(self.path, name, typecode), "r+b") as f:
+                f.seek(i * array(typecode).itemsize)
+                f.write(array(typecode, [row[name]]).tobytes())
+
+    #Appends a result as returned by a perform_diffs* driver, kept at the given output level
+    def append_result(self, contract, level, operator, tool, diff, output_level="raw"):
+        return self.append(contract, level, operator, tool, *unpack_result(diff), output_level=output_level)
+
+    def flush(self):
+        # Scripts before columns, so a flushed row never points past the end of scripts.bin
+        self.scripts.flush()
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        self.flush()
+        self.scripts.close()
+        for f in list(self.files.values()) + list(self.string_files.values()):
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Read-only view of a store with every column memory-mapped
+class Results:
+    def __init__(self, path):
+        self.path = path
+        self.n_rows = complete_rows(path) if os.path.isdir(path) else 0
+        self.maps = []
+        self.views = []     #every view over the maps, released before they are closed
+        self.columns = {}
+        for name, typecode in COLUMNS:
+            file_path = column_path(path, name, typecode)
+            if name in LATE_COLUMNS and not os.path.exists(file_path):
+                self.columns[name] = memoryview(array(typecode, [LATE_COLUMNS[name]]) * self.n_rows)
+            else:
+                self.columns[name] = self.track(self.map(file_path, typecode)[:self.n_rows])
+        self.scripts = self.map(os.path.join(path, "scripts.bin"), "B")
+        self.strings = {name: read_strings(path, name) for name in STRING_COLUMNS}
+
+    def map(self, file_path, typecode):
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            return memoryview(array(typecode))
+        with open(file_path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(m)
+        view = self.track(memoryview(m))
+        view = self.track(view[:len(view) - len(view) % array(typecode).itemsize])
+        return self.track(view.cast(typecode))
+
+    def track(self, view):
+        self.views.append(view)
+        return view
+
+    def __len__(self):
+        return self.n_rows
+
+    #Value of a column in row i, with string columns decoded
+    def value(self, name, i):
+        value = self.columns[name][i]
+        return self.strings[name][value] if name in self.strings else value
+
+    def row(self, i):
+        return {name: self.value(name, i) for name, _ in COLUMNS}
+
+    def rows(self):
+        for i in range(self.n_rows):
+            yield self.row(i)
+
+    #Edit script of row i, or None if none was stored. Compressed scripts are decompressed. Rows written with a
+    #script store hold a "sha256:<hash>" reference to their script, which is looked up in scripts (a
+    #script_store.Scripts) if given.
+    def script(self, i, scripts=None):
+        length = self.columns["script_length"][i]
+        if length == 0:
+            return None
+        offset = self.columns["script_offset"][i]
+        script = bytes(self.scripts[offset:offset + length]).decode()
+        if script.startswith(COMPRESSED_PREFIX):
+            script = decompress_script(script)
+        elif scripts is not None:
+            script = scripts.resolve(script)
+        return script if script is None or isinstance(script, str) else json.dumps(script)
+
+    #Releases the views and closes the maps. Views the caller made of the columns must be released first.
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.columns = {}
+        self.scripts = None
+        for m in self.maps:
+            m.close()
+        self.maps = []
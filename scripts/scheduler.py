@@ -0,0 +1,81 @@
+# Pair-level scheduling of diff jobs. Instead of one task per contract (where contracts with
+# hundreds of mutants become stragglers), every (contract, level, operator) pair is its own
+# task. Pairs are started largest first, the external diff tool runs in a bounded pool of
+# threads (they only wait on subprocesses), and the Python-side parsing of the tool output
+# runs in a process pool so it is not serialized by the GIL.
+
+import os
+import concurrent.futures as cc
+from collections import namedtuple
+
+from process_runner import error_record, is_error
+from profiling import stage, pool_args
+
+#size is the combined size of both files when known, see corpus_index.py
+DiffPair = namedtuple("DiffPair", ["contract", "level", "operator", "original", "mutant", "size"], defaults=[None])
+
+
+#Estimated cost of diffing a pair, used to start the most expensive pairs first
+def pair_cost(pair):
+    if pair.size is not None:
+        return pair.size
+    try:
+        return os.path.getsize(pair.original) + os.path.getsize(pair.mutant)
+    except OSError:
+        return 0
+
+
+#Runs run_fn(original, mutant) for every pair with at most tool_workers running at once, then
+#parse_fn(*raw_output) in a pool of parse_workers processes. Without a parse_fn, the output of run_fn
+#is the result. A pair whose run_fn or parse_fn raises (or whose run_fn returns -1) is reported and
+#gets the error record of process_runner.error_record as its result. on_result(pair, result) is
+#called from the main thread as pairs finish. With a ResultCache, pairs that already have a result
+#are answered from it and new successful results are added to it; failures are not cached.
+def run_pairs(pairs, run_fn, parse_fn, on_result, tool_workers=os.cpu_count(), parse_workers=os.cpu_count(), cache=None):
+    keys = {}
+    if cache is not None:
+        todo = []
+        for pair in pairs:
+            with stage("cache-get"):
+                keys[pair] = cache.key(pair.original, pair.mutant)
+                result = cache.get(keys[pair])
+            if result is None:
+                todo.append(pair)
+            else:
+                on_result(pair, result)
+        print(f'Pairs cached: {len(pairs) - len(todo)}/{len(pairs)}')
+        pairs = todo
+
+    pairs = sorted(pairs, key=pair_cost, reverse=True)
+
+    with cc.ThreadPoolExecutor(max_workers=tool_workers) as tools, cc.ProcessPoolExecutor(max_workers=parse_workers, **pool_args()) as parsers:
+        # Start the parse processes from the main thread, before any tool threads exist to be forked mid-flight
+        parsers.submit(int).result()
+
+        def diff_pair(pair):
+            with stage("run"):
+                raw = run_fn(pair.original, pair.mutant)
+            if raw == -1:
+                raise RuntimeError("diff tool failed")
+            if parse_fn is None:
+                return raw
+            with stage("parse-wait"):
+                return parsers.submit(parse_fn, *raw).result()
+
+        futures = {tools.submit(diff_pair, pair): pair for pair in pairs}
+        completed_count = 0
+        for future in cc.as_completed(futures):
+            pair = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print("pair causing error: " + pair.mutant + " (" + str(e) + ")")
+                result = error_record(e)
+            if cache is not None and not is_error(result):
+                with stage("cache-put"):
+                    cache.put(keys[pair], result)
+            with stage("on-result"):
+                on_result(pair, result)
+            completed_count += 1
+            print(f'Pairs done: {completed_count}/{len(pairs)}', end='\r')
+    print()
@@ -0,0 +1,301 @@
+# Compressed, deduplicated store of edit scripts (Gumtree's <actions> XML, difftastic's chunks), with
+# random access to the script of one (contract, level, operator, tool).
+#
+# A store is a directory with:
+#
+#   blobs.bin    the compressed scripts, each distinct script once
+#   index.tsv    one line per stored script:
+#                contract  level  operator  tool  sha256  kind  dict  offset  length  size
+#   dicts/       the compression dictionaries, <sha256>.zdict, themselves zlib-compressed
+#
+# Identical scripts (by the sha256 of their bytes) are stored once, however many mutants share
+# them. Scripts are compressed with zlib and a dictionary per contract: the first script stored for a
+# contract (its last 32 KiB, zlib's window) becomes the dictionary of all scripts of that contract,
+# as the mutants of one contract share most of their node types, labels and structure. zstd would
+# allow larger dictionaries, but is not available in the image; zlib is in the standard library.
+# kind is "t" for a text script (Gumtree) and "j" for a JSON one (difftastic), size its length before
+# compression. Scripts compressed by the full output level (see output_level.py) are stored raw.
+#
+# The whole index is read when a store is opened, and a script is read with one slice of the mapped
+# blobs.bin and one decompression. Blobs are written before their index line, so a store left behind
+# by a crash is cut back to its last complete line when it is opened for appending. A script stored
+# again for the same (contract, level, operator, tool) replaces the earlier one. Only one process may
+# append to a store at a time.
+#
+# Usage:
+#   with ScriptStore("../results/scripts") as store:
+#       store.put("Contract", 1, "AOR", "GT", "<actions>...</actions>")
+#
+#   scripts = Scripts("../results/scripts")
+#   scripts.get("Contract", 1, "AOR", "GT")    -> "<actions>...</actions>"
+#   scripts.get_by_hash("<sha256>")             -> "<actions>...</actions>"
+#   scripts.resolve("sha256:<sha256>")          -> "<actions>...</actions>", the script a stored result refers to
+#
+#   python3 script_store.py get ../results/scripts Contract 1 AOR --tool GT
+#   python3 script_store.py hash ../results/scripts <sha256>
+#   python3 script_store.py import ../results/store ../results/scripts    # the scripts of a results store (see results_store.py)
+#   python3 script_store.py stats ../results/scripts
+
+import os
+import sys
+import mmap
+import json
+import zlib
+import hashlib
+import argparse
+from collections import namedtuple
+
+from output_level import decompress_script
+
+DICT_SIZE = 32 << 10    #zlib only looks back 32 KiB, a longer dictionary is not used
+LEVEL = 9
+REF_PREFIX = "sha256:"  #prefix of the reference put_result leaves in a result in place of its script
+
+#Where a distinct script is stored
+Blob = namedtuple("Blob", ["kind", "dict", "offset", "length", "size"])
+
+
+def parse_input():
+    parser = argparse.ArgumentParser(description="Compressed, deduplicated store of edit scripts.",
+                                     epilog="Example: python3 %s get ../results/scripts Contract 1 AOR" % os.path.basename(__file__))
+    commands = parser.add_subparsers(dest="command", required=True)
+    get = commands.add_parser("get", help="print the edit script of a pair")
+    get.add_argument("store", help="script store directory")
+    get.add_argument("contract")
+    get.add_argument("level", type=int)
+    get.add_argument("operator")
+    get.add_argument("--tool", choices=["GT", "difft"], default="GT", help="diffing tool (default: GT)")
+    by_hash = commands.add_parser("hash", help="print the edit script with a sha256 (of a sha256:<hash> reference)")
+    by_hash.add_argument("store", help="script store directory")
+    by_hash.add_argument("digest", help="sha256 of the script, with or without the sha256: prefix")
+    imp = commands.add_parser("import", help="add the edit scripts of a results store (see results_store.py)")
+    imp.add_argument("results", help="results store directory")
+    imp.add_argument("store", help="script store directory")
+    stats = commands.add_parser("stats", help="print the number and size of the stored scripts")
+    stats.add_argument("store", help="script store directory")
+    return parser.parse_args()
+
+
+#Bytes and kind of a script: text as it is, anything else as compact JSON
+def encode_script(script):
+    script = decompress_script(script)
+    if isinstance(script, str):
+        return script.encode(), "t"
+    return json.dumps(script, separators=(",", ":")).encode(), "j"
+
+
+def decode_script(data, kind):
+    return data.decode() if kind == "t" else json.loads(data)
+
+
+def read_dict(path, digest):
+    with open(os.path.join(path, "dicts", digest + ".zdict"), "rb") as f:
+        return zlib.decompress(f.read())
+
+
+#Reads the index into {(contract, level, operator, tool): (sha256, Blob)}. Returns it with the offset
+#after the last complete line whose blob is entirely in blobs.bin.
+def read_index(path):
+    entries = {}
+    index_path = os.path.join(path, "index.tsv")
+    blobs_path = os.path.join(path, "blobs.bin")
+    if not os.path.exists(index_path):
+        return entries, 0
+    blobs_size = os.path.getsize(blobs_path) if os.path.exists(blobs_path) else 0
+    offset = 0
+    with open(index_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            contract, level, operator, tool, digest, kind, zdict, blob_offset, length, size = line[:-1].decode().split("\t")
+            blob = Blob(kind, zdict, int(blob_offset), int(length), int(size))
+            if blob.offset + blob.length > blobs_size:
+                break
+            entries[(contract, int(level), operator, tool)] = (digest, blob)
+            offset += len(line)
+    return entries, offset
+
+
+class ScriptStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "dicts"), exist_ok=True)
+
+        # Drop a partially written last line, and the blobs written after the last complete one
+        self.entries, index_end = read_index(path)
+        self.blobs = {}             #sha256 of a script -> its Blob
+        self.contract_dicts = {}    #contract -> sha256 of its dictionary
+        blobs_end = 0
+        for (contract, _, _, _), (digest, blob) in self.entries.items():
+            self.blobs[digest] = blob
+            self.contract_dicts.setdefault(contract, blob.dict)
+            blobs_end = max(blobs_end, blob.offset + blob.length)
+        self.index = open(os.path.join(path, "index.tsv"), "ab")
+        self.index.truncate(index_end)
+        self.data = open(os.path.join(path, "blobs.bin"), "ab")
+        self.data.truncate(blobs_end)
+        self.data.seek(blobs_end)   #tell() gives the offset of the next blob
+        self.dicts = {}             #sha256 -> dictionary, of the dictionaries used so far
+
+    #Dictionary of a contract, made from data when it has none yet
+    def dict_for(self, contract, data):
+        digest = self.contract_dicts.get(contract)
+        if digest is None:
+            zdict = data[-DICT_SIZE:]
+            digest = hashlib.sha256(zdict).hexdigest()
+            dict_path = os.path.join(self.path, "dicts", digest + ".zdict")
+            if not os.path.exists(dict_path):
+                with open(dict_path + ".tmp", "wb") as f:
+                    f.write(zlib.compress(zdict, LEVEL))
+                os.replace(dict_path + ".tmp", dict_path)
+            self.contract_dicts[contract] = digest
+            self.dicts[digest] = zdict
+        elif digest not in self.dicts:
+            self.dicts[digest] = read_dict(self.path, digest)
+        return digest, self.dicts[digest]
+
+    #Stores the edit script of a pair, unless the same script is stored already. Returns its sha256.
+    def put(self, contract, level, operator, tool, script):
+        data, kind = encode_script(script)
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self.blobs.get(digest)
+        if blob is None:
+            dict_digest, zdict = self.dict_for(contract, data)
+            compressor = zlib.compressobj(LEVEL, zdict=zdict)
+            compressed = compressor.compress(data) + compressor.flush()
+            blob = Blob(kind, dict_digest, self.data.tell(), len(compressed), len(data))
+            self.data.write(compressed)
+            self.blobs[digest] = blob
+            # The blob must be on disk before a line refers to it
+            self.data.flush()
+        key = (contract, level, operator, tool)
+        self.entries[key] = (digest, blob)
+        line = "\t".join([contract, str(level), operator, tool, digest, blob.kind, blob.dict, str(blob.offset), str(blob.length), str(blob.size)])
+        self.index.write(line.encode() + b"\n")
+        self.index.flush()
+        return digest
+
+    #Stores the edit script of a result as returned by a perform_diffs* driver, and returns the result with
+    #"sha256:<hash of the script>" in its place. Failures, unchanged pairs and results without a script are
+    #returned as they are. Results of the summary output level have no script to store (see output_level.py).
+    def put_result(self, contract, level, operator, tool, diff):
+        if isinstance(diff, dict) and "error" not in diff:
+            field = "edit_script" if "edit_script" in diff else "diff_chunks"
+            if diff.get(field) is not None:
+                return dict(diff, **{field: REF_PREFIX + self.put(contract, level, operator, tool, diff[field])})
+        elif isinstance(diff, list) and diff[2] is not None:
+            return diff[:2] + [REF_PREFIX + self.put(contract, level, operator, tool, diff[2])] + diff[3:]
+        return diff
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Read-only view of a store, with blobs.bin memory-mapped
+class Scripts:
+    def __init__(self, path):
+        self.path = path
+        self.entries, _ = read_index(path)
+        self.blobs = {digest: blob for digest, blob in self.entries.values()}     #sha256 of a script -> its Blob
+        self.dicts = {}
+        self.map = None
+        blobs_path = os.path.join(path, "blobs.bin")
+        if os.path.exists(blobs_path) and os.path.getsize(blobs_path) > 0:
+            with open(blobs_path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def blob(self, digest, blob):
+        zdict = self.dicts.get(blob.dict)
+        if zdict is None:
+            zdict = self.dicts[blob.dict] = read_dict(self.path, blob.dict)
+        decompressor = zlib.decompressobj(zdict=zdict)
+        data = decompressor.decompress(self.map[blob.offset:blob.offset + blob.length]) + decompressor.flush()
+        return decode_script(data, blob.kind)
+
+    #Edit script of a pair, or None if none was stored
+    def get(self, contract, level, operator, tool="GT"):
+        entry = self.entries.get((contract, level, operator, tool))
+        return self.blob(*entry) if entry is not None else None
+
+    #Edit script with the given sha256, or None if none was stored
+    def get_by_hash(self, digest):
+        blob = self.blobs.get(digest)
+        return self.blob(digest, blob) if blob is not None else None
+
+    #Script of a stored result: the script a "sha256:<hash>" reference (see ScriptStore.put_result) refers to, None
+    #if it is not in the store. Anything else is returned as it is.
+    def resolve(self, script):
+        if isinstance(script, str) and script.startswith(REF_PREFIX):
+            return self.get_by_hash(script[len(REF_PREFIX):])
+        return script
+
+    #Number of stored scripts and distinct scripts, and the bytes of all scripts, the distinct scripts and
+    #the compressed distinct scripts
+    def stats(self):
+        return {"scripts": len(self.entries), "distinct": len(self.blobs),
+                "bytes": sum(blob.size for _, blob in self.entries.values()),
+                "distinct_bytes": sum(blob.size for blob in self.blobs.values()),
+                "stored_bytes": sum(blob.length for blob in self.blobs.values())}
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+#Adds the edit scripts of the successful pairs of a results store. Returns the number of scripts added.
+def import_results(results_path, store):
+    from results_store import Results
+    results = Results(results_path)
+    added = 0
+    try:
+        for i in range(len(results)):
+            script = results.script(i)
+            # Failed pairs have their error record and the summary output level its counts instead of a script,
+            # and the scripts of a run with a script store are only referenced (and in that store already)
+            if script is None or results.columns["edits"][i] < 0 or script.startswith(("{", REF_PREFIX)):
+                continue
+            if script.startswith("["):
+                script = json.loads(script)
+            store.put(results.value("contract", i), results.columns["level"][i], results.value("operator", i),
+                      results.value("tool", i), script)
+            added += 1
+    finally:
+        results.close()
+    return added
+
+
+if __name__ == '__main__':
+    args = parse_input()
+    if args.command == "get":
+        scripts = Scripts(args.store)
+        script = scripts.get(args.contract, args.level, args.operator, args.tool)
+        if script is None:
+            sys.exit("No edit script for %s level %d %s (%s)" % (args.contract, args.level, args.operator, args.tool))
+        print(script if isinstance(script, str) else json.dumps(script))
+    elif args.command == "hash":
+        script = Scripts(args.store).resolve(REF_PREFIX + args.digest.removeprefix(REF_PREFIX))
+        if script is None:
+            sys.exit("No edit script with sha256 " + args.digest)
+        print(script if isinstance(script, str) else json.dumps(script))
+    elif args.command == "import":
+        with ScriptStore(args.store) as store:
+            print(f"Imported {import_results(args.results, store)} edit scripts into {args.store}")
+    else:
+        stats = Scripts(args.store).stats()
+        ratio = stats["stored_bytes"] / stats["bytes"] if stats["bytes"] else 0
+        print(f"{stats['scripts']} edit scripts, {stats['distinct']} distinct; "
+              f"{stats['bytes']} bytes, {stats['distinct_bytes']} distinct, {stats['stored_bytes']} stored ({ratio:.2%})")
@@ -0,0 +1,11 @@
+# Small statistics helpers shared by the benchmark (bench_diffs.py) and the diff service (diff_service.py)
+
+
+#Percentile q (0-100) of sorted values, linearly interpolated
+def percentile(values, q):
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
@@ -0,0 +1,5 @@
+# The scripts import each other by module name and are run from scripts/, so the tests do the same
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
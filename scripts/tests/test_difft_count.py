@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from difft_count import count_changes, count_changes_legacy
+from bench_difft_count import synthetic_chunks
+
+
+def change(start, end):
+    return {"start": start, "end": end, "content": ""}
+
+
+def line(lhs=None, rhs=None):
+    sides = {"lhs": lhs, "rhs": rhs}
+    return {side: {"line_number": 0, "changes": [change(*span) for span in spans]} for side, spans in sides.items() if spans is not None}
+
+
+FIXTURES = {
+    "disjoint": [[line(lhs=[(0, 3), (5, 9)], rhs=[(12, 14)])]],
+    "rhs overlaps lhs": [[line(lhs=[(0, 10)], rhs=[(4, 6), (9, 12), (10, 12)])]],
+    "adjacent": [[line(lhs=[(0, 4), (4, 8)], rhs=[(8, 9), (3, 5)])]],
+    "empty spans": [[line(lhs=[(3, 3), (0, 5)], rhs=[(2, 2), (5, 5)])]],
+    "out of order": [[line(lhs=[(20, 30), (0, 5), (10, 15)], rhs=[(14, 21), (5, 10), (29, 40), (1, 2)])]],
+    "one side": [[line(lhs=[(0, 2), (1, 3)]), line(rhs=[(7, 9), (0, 8)])], [line(rhs=[(0, 1)])]],
+    "no changes": [[line(lhs=[], rhs=[])], []],
+}
+
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_matches_legacy_on_fixtures(name):
+    assert count_changes(FIXTURES[name]) == count_changes_legacy(FIXTURES[name])
+
+
+def test_matches_legacy_on_synthetic_chunks():
+    rng = random.Random(0)
+    for n_changes in [1, 5, 20, 100] * 10:
+        chunks = synthetic_chunks(rng, n_changes, 400)
+        # Shuffled changes take the insert path instead of the append path
+        shuffled = [[dict(l, **{side: dict(l[side], changes=rng.sample(l[side]["changes"], len(l[side]["changes"])))
+                                for side in ("lhs", "rhs")}) for l in chunk] for chunk in chunks]
+        assert count_changes(chunks) == count_changes_legacy(chunks)
+        assert count_changes(shuffled) == count_changes_legacy(shuffled)
+
+
+def test_counts_by_type():
+    counts = {}
+    chunks = [[line(lhs=[(0, 3)], rhs=[(1, 2), (5, 6)]), line(lhs=[(0, 1)]), line(rhs=[(0, 1), (2, 3)])]]
+    assert count_changes(chunks, counts) == 5
+    assert counts == {"update": 2, "delete": 1, "insert": 2}
@@ -0,0 +1,40 @@
+import random
+
+from mutant_compose import compose, compose_legacy, mutant_texts
+
+CONTRACT = "contract C { function f() public { x = a + b; } }"
+
+
+def mutation(start, end, replace):
+    return {"start": start, "end": end, "original": CONTRACT[start:end], "replace": replace, "startLine": 1}
+
+
+def test_adjacent_mutations_are_composed():
+    plus = CONTRACT.index("+")
+    mutations = [mutation(plus - 2, plus - 1, "cc"), mutation(plus - 1, plus, "\t"), mutation(plus, plus + 1, "-"), mutation(plus + 1, plus + 2, "")]
+    edits, resume = compose(CONTRACT, mutations, 10)
+    assert resume is None and len(edits) == 4
+    assert list(mutant_texts(CONTRACT, mutations, 10)) == list(compose_legacy(CONTRACT, mutations, 10))
+
+
+def test_only_overlapping_mutations_fall_back():
+    plus = CONTRACT.index("+")
+    # The insertion lands inside the replacement of the second mutation
+    mutations = [mutation(10, 11, "D"), mutation(plus - 2, plus + 3, "b * a"), mutation(plus, plus, "+1"), mutation(plus + 6, plus + 7, "}}")]
+    edits, resume = compose(CONTRACT, mutations, 10)
+    assert len(edits) == 2 and resume.index == 2
+    assert list(mutant_texts(CONTRACT, mutations, 10)) == list(compose_legacy(CONTRACT, mutations, 10))
+
+
+def test_matches_legacy_on_random_mutations():
+    rng = random.Random(0)
+    for _ in range(2000):
+        contract = "".join(rng.choice("abcdefgh") for _ in range(rng.randrange(5, 60)))
+        mutations = []
+        for _ in range(rng.randrange(1, 12)):
+            start = rng.randrange(len(contract))
+            end = min(len(contract), start + rng.choice([0, 1, 2, 3, 5, 8]))
+            replace = "".join(rng.choice("xyz") for _ in range(rng.choice([0, 1, 2, 4, 6])))
+            mutations.append({"start": start, "end": end, "original": contract[start:end], "replace": replace, "startLine": 1})
+        mutations.sort(key=lambda m: m["start"])
+        assert list(mutant_texts(contract, mutations, 8)) == list(compose_legacy(contract, mutations, 8))
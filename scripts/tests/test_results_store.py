@@ -0,0 +1,52 @@
+from results_store import ResultsStore, Results
+
+METRICS = {"wall_ns": 1000}
+
+
+def read_rows(path):
+    results = Results(path)
+    try:
+        return [dict(results.row(i), script=results.script(i)) for i in range(len(results))]
+    finally:
+        results.close()
+
+
+def test_success_replaces_failure_on_rerun(tmp_path):
+    with ResultsStore(str(tmp_path)) as store:
+        assert store.append_result("C", 1, "AOR", "GT", {"error": "timeout", "message": "killed"})
+        assert store.append_result("C", 1, "ROR", "GT", [3, 0.5, "<a/>", METRICS])
+
+    # A rerun diffs the failed pair again, its success replaces the error row
+    with ResultsStore(str(tmp_path)) as store:
+        assert store.append_result("C", 1, "AOR", "GT", [7, 0.25, "<actions/>", METRICS])
+        assert not store.append_result("C", 1, "ROR", "GT", [4, 0.5, "<b/>", METRICS])
+
+    rows = read_rows(str(tmp_path))
+    assert [(row["operator"], row["edits"], row["script"]) for row in rows] == [("AOR", 7, "<actions/>"), ("ROR", 3, "<a/>")]
+    assert rows[0]["time"] == 0.25 and rows[0]["wall_ns"] == 1000
+
+
+def test_failure_does_not_replace_success(tmp_path):
+    with ResultsStore(str(tmp_path)) as store:
+        store.append_result("C", 1, "AOR", "GT", [3, 0.5, "<a/>", METRICS])
+        assert not store.append_result("C", 1, "AOR", "GT", {"error": "timeout"})
+    assert [row["edits"] for row in read_rows(str(tmp_path))] == [3]
+
+
+def test_script_replaces_summary(tmp_path):
+    with ResultsStore(str(tmp_path)) as store:
+        store.append_result("C", 1, "AOR", "difft", [2, 0.5, {"delete": 2}, METRICS], "summary")
+        assert not store.append_result("C", 1, "AOR", "difft", [2, 0.5, {"delete": 2}, METRICS], "summary")
+        assert store.append_result("C", 1, "AOR", "difft", [2, 0.5, [[{"lhs": {}}]], METRICS], "full")
+        assert not store.append_result("C", 1, "AOR", "difft", [2, 0.5, {"delete": 2}, METRICS], "summary")
+    rows = read_rows(str(tmp_path))
+    assert len(rows) == 1 and rows[0]["output_level"] == 1 and rows[0]["script"] == '[[{"lhs": {}}]]'
+
+
+def test_close_releases_maps(tmp_path):
+    with ResultsStore(str(tmp_path)) as store:
+        store.append_result("C", 1, "AOR", "GT", [3, 0.5, "<a/>", METRICS])
+    results = Results(str(tmp_path))
+    assert results.columns["edits"][0] == 3
+    results.close()
+    assert results.maps == []
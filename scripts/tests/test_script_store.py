@@ -0,0 +1,23 @@
+from script_store import ScriptStore, Scripts
+from results_store import ResultsStore, Results
+
+METRICS = {"wall_ns": 1000}
+
+
+def test_results_refer_to_their_scripts_by_hash(tmp_path):
+    scripts_path, results_path = str(tmp_path / "scripts"), str(tmp_path / "store")
+    with ScriptStore(scripts_path) as scripts, ResultsStore(results_path) as store:
+        for operator, diff in [("AOR", [3, 0.5, "<actions/>", METRICS]), ("ROR", [2, 0.5, [[{"lhs": {}}]], METRICS])]:
+            diff = scripts.put_result("C", 1, operator, "GT", diff)
+            assert diff[2].startswith("sha256:")
+            store.append_result("C", 1, operator, "GT", diff)
+
+    scripts, results = Scripts(scripts_path), Results(results_path)
+    try:
+        assert scripts.get_by_hash(results.script(0)[len("sha256:"):]) == "<actions/>"
+        assert scripts.get_by_hash("0" * 64) is None
+        assert [results.script(i, scripts) for i in range(len(results))] == ["<actions/>", '[[{"lhs": {}}]]']
+        assert scripts.resolve("<a/>") == "<a/>"
+    finally:
+        results.close()
+        scripts.close()
@@ -0,0 +1,81 @@
+# Content-addressed cache of tree-sitter-parser output (the XML AST Gumtree consumes).
+# Every mutant of a contract is diffed against the same original, so the original only
+# has to be parsed once: its tree is stored as <cache_dir>/<sha256 of source>.xml and
+# handed to the Gumtree workers, which load it instead of re-running the parser.
+
+import os
+import sys
+import shutil
+import hashlib
+import threading
+
+from process_runner import Limits, RunError, run
+from profiling import stage
+
+
+#kind classifies the failure as in process_runner.py
+class TreeCacheError(Exception):
+    def __init__(self, message, kind="tool-error"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+#Finds tree-sitter-parser.py, either from $TREE_SITTER_PARSER or on the PATH (as set up in the Dockerfile)
+def find_parser():
+    parser = os.environ.get("TREE_SITTER_PARSER") or shutil.which("tree-sitter-parser.py")
+    if parser is None:
+        raise TreeCacheError("tree-sitter-parser.py not found on PATH, set TREE_SITTER_PARSER")
+    return parser
+
+
+class TreeCache:
+    def __init__(self, cache_dir, language="solidity", limits=Limits()):
+        self.cache_dir = cache_dir
+        self.language = language
+        self.limits = limits
+        self.parser = find_parser()
+        self.known = {}     #path -> (mtime, size, tree path), so unchanged originals are not re-hashed
+        self.locks = {}     #content hash -> lock, so a tree is only parsed once even with many threads
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    #Returns the path of the cached XML tree of the given source file, parsing it on a miss
+    def tree_for(self, path):
+        with stage("tree-cache"):
+            return self._tree_for(path)
+
+    def _tree_for(self, path):
+        stat = os.stat(path)
+        known = self.known.get(path)
+        if known is not None and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+
+        digest = file_hash(path)
+        tree_path = os.path.join(self.cache_dir, digest + ".xml")
+        with self.lock:
+            key_lock = self.locks.setdefault(digest, threading.Lock())
+        with key_lock:
+            if not os.path.exists(tree_path):
+                self.parse(path, tree_path)
+
+        self.known[path] = (stat.st_mtime_ns, stat.st_size, tree_path)
+        return tree_path
+
+    def parse(self, path, tree_path):
+        try:
+            tree = run([sys.executable, self.parser, path, self.language], self.limits).stdout
+        except RunError as e:
+            raise TreeCacheError("tree-sitter-parser failed on " + path + " (" + e.kind + ")", e.kind) from e
+        if not tree:
+            raise TreeCacheError("tree-sitter-parser produced no tree for " + path, "no-output")
+
+        # Write to a temporary file first so an interrupted run never leaves a truncated tree behind
+        tmp_path = tree_path + ".%d.tmp" % os.getpid()
+        with open(tmp_path, "wb") as f:
+            f.write(tree)
+        os.replace(tmp_path, tree_path)